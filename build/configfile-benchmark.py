@@ -0,0 +1,179 @@
+#!/usr/bin/python
+
+# Copyright (C) 2026 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Micro-benchmark of ovirt_engine.configfile.
+
+Builds a temporary engine configuration like an installed engine has:
+the ovirt-engine.conf defaults of this tree and an engine.conf.d
+directory with the files written by engine-setup, plus --extra files
+of user overrides. Measures configurations loaded per second by parsing
+and from cache.
+
+Usage:
+    PYTHONPATH=packaging/pythonlib build/configfile-benchmark.py \\
+        --count 1000 --extra 20
+"""
+
+import argparse
+import os
+import re
+import shutil
+import tempfile
+import timeit
+
+from ovirt_engine import configfile
+
+_DEFAULTS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..',
+    'packaging',
+    'services',
+    'ovirt-engine',
+    'ovirt-engine.conf.in',
+)
+
+_SETUP_FILES = {
+    '10-setup-database.conf': (
+        'ENGINE_DB_HOST="localhost"\n'
+        'ENGINE_DB_PORT="5432"\n'
+        'ENGINE_DB_USER="engine"\n'
+        'ENGINE_DB_PASSWORD="Pa\\"ss w0rd#"\n'
+        'ENGINE_DB_DATABASE="engine"\n'
+        'ENGINE_DB_SECURED="False"\n'
+        'ENGINE_DB_SECURED_VALIDATION="False"\n'
+        'ENGINE_DB_DRIVER="org.postgresql.Driver"\n'
+        'ENGINE_DB_URL="jdbc:postgresql://${ENGINE_DB_HOST}:'
+        '${ENGINE_DB_PORT}/${ENGINE_DB_DATABASE}?sslfactory='
+        'org.postgresql.ssl.NonValidatingFactory"\n'
+    ),
+    '10-setup-java.conf': (
+        'JAVA_HOME="/usr/lib/jvm/jre-11-openjdk"\n'
+    ),
+    '10-setup-jboss.conf': (
+        'JBOSS_HOME="/usr/share/ovirt-engine-wildfly"\n'
+    ),
+    '10-setup-pki.conf': (
+        'ENGINE_PKI="/etc/pki/ovirt-engine"\n'
+        'ENGINE_PKI_CA="/etc/pki/ovirt-engine/ca.pem"\n'
+        'ENGINE_PKI_ENGINE_CERT="/etc/pki/ovirt-engine/certs/engine.cer"\n'
+        'ENGINE_PKI_TRUST_STORE_TYPE="JKS"\n'
+        'ENGINE_PKI_TRUST_STORE="/etc/pki/ovirt-engine/.truststore"\n'
+        'ENGINE_PKI_TRUST_STORE_PASSWORD="mypass"\n'
+        'ENGINE_PKI_ENGINE_STORE_TYPE="PKCS12"\n'
+        'ENGINE_PKI_ENGINE_STORE="/etc/pki/ovirt-engine/keys/engine.p12"\n'
+        'ENGINE_PKI_ENGINE_STORE_PASSWORD="mypass"\n'
+        'ENGINE_PKI_ENGINE_STORE_ALIAS="1"\n'
+    ),
+    '10-setup-protocols.conf': (
+        'ENGINE_FQDN=engine.example.com\n'
+        'ENGINE_PROXY_ENABLED=true\n'
+        'ENGINE_PROXY_HTTP_PORT=80\n'
+        'ENGINE_PROXY_HTTPS_PORT=443\n'
+        'ENGINE_AJP_ENABLED=true\n'
+        'ENGINE_AJP_PORT=8702\n'
+        'ENGINE_HTTP_ENABLED=false\n'
+        'ENGINE_HTTPS_ENABLED=false\n'
+    ),
+    '10-setup-uuid.conf': (
+        'ENGINE_VM_UUID=c1b2b68c-b5b2-4ec1-a0d5-d4f0d1b0e2a4\n'
+    ),
+}
+
+
+def _create(tmpdir, extra):
+    defaults = os.path.join(tmpdir, 'ovirt-engine.conf')
+    with open(_DEFAULTS) as f:
+        content = re.sub(r'@\w+@', '/usr/share/ovirt-engine', f.read())
+    with open(defaults, 'w') as f:
+        f.write(content)
+
+    vars = os.path.join(tmpdir, 'engine.conf')
+    confd = '%s.d' % vars
+    os.mkdir(confd)
+    for name, content in _SETUP_FILES.items():
+        with open(os.path.join(confd, name), 'w') as f:
+            f.write(content)
+    for i in range(extra):
+        with open(os.path.join(confd, '99-custom-%02d.conf' % i), 'w') as f:
+            f.write(
+                '# custom settings %d\n'
+                'ENGINE_JVM_ARGS="${ENGINE_JVM_ARGS} -Dcustom.%d=true"\n'
+                'ENGINE_HEAP_MAX="%dm"\n' % (i, i, 1024 + i)
+            )
+
+    # cache is not used for recently modified files
+    old = timeit.default_timer() - 3600
+    for path in [defaults, confd] + [
+        os.path.join(confd, name) for name in os.listdir(confd)
+    ]:
+        os.utime(path, (old, old))
+
+    return defaults, vars
+
+
+def _report(name, count, duration):
+    print(
+        '%-16s %8d loads in %6.2f s, %10.1f loads/s' % (
+            name,
+            count,
+            duration,
+            count / duration,
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='ovirt_engine.configfile micro-benchmark',
+    )
+    parser.add_argument(
+        '--count', type=int, default=1000,
+        help='number of loads per measurement',
+    )
+    parser.add_argument(
+        '--extra', type=int, default=10,
+        help='number of additional files in engine.conf.d',
+    )
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        files = _create(tmpdir, args.extra)
+        cache = os.path.join(tmpdir, 'cache.json')
+
+        start = timeit.default_timer()
+        for i in range(args.count):
+            parsed = configfile.ConfigFile(files)
+        _report('parse', args.count, timeit.default_timer() - start)
+
+        configfile.ConfigFile(files, cache=cache)
+        start = timeit.default_timer()
+        for i in range(args.count):
+            cached = configfile.ConfigFile(files, cache=cache)
+        _report('cache', args.count, timeit.default_timer() - start)
+
+        if parsed.values != cached.values:
+            raise RuntimeError('Cached values differ from parsed values')
+        print('%d keys' % len(parsed.values))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
@@ -0,0 +1,435 @@
+#!/usr/bin/python
+
+# Copyright (C) 2026 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Load generator for fence_kdump listener.
+
+Runs FenceKdumpListener in process against fake database manager (or
+real PostgreSQL when --db-database is specified) and sends datagrams
+from simulated hosts in separate process. Each host is using its own
+loopback address 127.x.y.z, so listener sees it as separate session.
+
+Usage:
+    export PYTHONPATH=packaging/pythonlib
+    PYTHONPATH+=:packaging/services/ovirt-fence-kdump-listener
+    build/fence-kdump-listener-benchmark.py --hosts 1000,5000 --rounds 5
+"""
+
+import argparse
+import logging
+import multiprocessing
+import random
+import resource
+import socket
+import threading
+import time
+import timeit
+
+import db
+import listener
+
+
+from ovirt_engine import base
+from ovirt_engine import metrics
+from ovirt_engine import util
+
+# source port of all simulated hosts, hosts differ by address
+_SOURCE_PORT = 7409
+
+
+class _Stopped(Exception):
+    pass
+
+
+class FakeDbManager(base.Base):
+    """DbManager replacement answering listener procedures from memory"""
+
+    def __init__(self, latency=0):
+        super(FakeDbManager, self).__init__()
+        self._latency = latency
+        self.calls = 0
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def prepare_procedure(self, name, argc):
+        pass
+
+    def validate_connection(self):
+        return True
+
+    def call_procedure(self, name, args=None):
+        self.calls += 1
+        if self._latency:
+            time.sleep(self._latency)
+        if name == 'UpsertKdumpStatusForIps':
+            self.rows += len(args[2])
+            return [
+                {'address': address, 'updated': 1}
+                for address in args[2]
+            ]
+        elif name == 'UpsertKdumpStatusForIp':
+            self.rows += 1
+            return [{'upsertkdumpstatusforip': 1}]
+        return []
+
+
+class BenchmarkListener(listener.FenceKdumpListener):
+    """Listener which can be stopped and records db sync durations"""
+
+    # how often stop request is checked
+    _STOP_CHECK_INTERVAL = 0.1
+
+    def __init__(self, **kwargs):
+        super(BenchmarkListener, self).__init__(**kwargs)
+        self._stopping = threading.Event()
+        self.syncDurations = []
+
+    def stop(self):
+        self._stopping.set()
+
+    def _next_wakeup(self):
+        return min(
+            super(BenchmarkListener, self)._next_wakeup(),
+            util.monotonic() + self._STOP_CHECK_INTERVAL,
+        )
+
+    def _house_keeping(self):
+        if self._stopping.is_set():
+            raise _Stopped()
+        super(BenchmarkListener, self)._house_keeping()
+
+    def _db_sync(self):
+        start = timeit.default_timer()
+        try:
+            super(BenchmarkListener, self)._db_sync()
+        finally:
+            self.syncDurations.append(timeit.default_timer() - start)
+
+    def serve(self):
+        try:
+            self.run()
+        except _Stopped:
+            pass
+
+
+def _host_address(index):
+    # skip 127.0.x.x, listener is usually bound there
+    index += 0x10000
+    return '127.%d.%d.%d' % (
+        (index >> 16) & 0xff,
+        (index >> 8) & 0xff,
+        index & 0xff,
+    )
+
+
+def _send(target, hosts, rounds, interval, invalid_ratio, rate, seed, queue):
+    """Sends rounds of datagrams from all hosts, runs in child process"""
+    rnd = random.Random(seed)
+    valid = listener.FenceKdumpListener._MSG_V1_PREFIX
+    invalid = b'\0' * len(valid)
+    sent = {'valid': 0, 'invalid': 0, 'errors': 0}
+    start = timeit.default_timer()
+    for r in range(rounds):
+        round_start = timeit.default_timer()
+        for i in range(hosts):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind((_host_address(i), _SOURCE_PORT))
+                if rnd.random() < invalid_ratio:
+                    sock.sendto(invalid, target)
+                    sent['invalid'] += 1
+                else:
+                    sock.sendto(valid, target)
+                    sent['valid'] += 1
+            except socket.error:
+                sent['errors'] += 1
+            finally:
+                sock.close()
+
+            if rate:
+                total = sent['valid'] + sent['invalid']
+                delay = start + float(total) / rate - timeit.default_timer()
+                if delay > 0:
+                    time.sleep(delay)
+
+        if r < rounds - 1:
+            delay = round_start + interval - timeit.default_timer()
+            if delay > 0:
+                time.sleep(delay)
+
+    sent['duration'] = timeit.default_timer() - start
+    queue.put(sent)
+
+
+def _udp_receive_errors():
+    """Returns kernel UDP receive buffer errors, None if not available"""
+    try:
+        with open('/proc/net/snmp', 'r') as f:
+            rows = [
+                line.split()[1:]
+                for line in f
+                if line.startswith('Udp:')
+            ]
+        return int(dict(zip(rows[0], rows[1]))['RcvbufErrors'])
+    except (IOError, OSError, IndexError, KeyError, ValueError):
+        return None
+
+
+def _sample(registry, name):
+    """Returns sum of all samples of metric from registry"""
+    total = 0
+    for line in registry.render().splitlines():
+        if line.startswith(name + '{') or line.startswith(name + ' '):
+            total += float(line.rsplit(' ', 1)[1])
+    return total
+
+
+def _percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def _create_db_manager(args, registry):
+    if args.db_database:
+        return db.DbManager(
+            host=args.db_host,
+            port=args.db_port,
+            database=args.db_database,
+            username=args.db_user,
+            password=args.db_password,
+            secured=False,
+            secure_validation=False,
+            registry=registry,
+            validation=args.db_validation,
+        )
+    return FakeDbManager(latency=args.db_latency)
+
+
+def run(args, hosts):
+    registry = metrics.Registry()
+    db_manager = _create_db_manager(args=args, registry=registry)
+    lsnr = BenchmarkListener(
+        binds=[(args.address, args.port)],
+        db_manager=db_manager,
+        heartbeat_interval=args.heartbeat_interval,
+        session_sync_interval=args.session_sync_interval,
+        reopen_db_connection_interval=args.session_sync_interval,
+        session_expiration_time=args.session_expiration_time,
+        receive_buffer_size=args.receive_buffer_size or None,
+        registry=registry,
+    )
+    with db_manager, lsnr:
+        thread = threading.Thread(target=lsnr.serve, name='listener')
+        thread.start()
+
+        queue = multiprocessing.Queue()
+        sender = multiprocessing.Process(
+            target=_send,
+            kwargs={
+                'target': (args.address, args.port),
+                'hosts': hosts,
+                'rounds': args.rounds,
+                'interval': args.interval,
+                'invalid_ratio': args.invalid_ratio,
+                'rate': args.rate,
+                'seed': args.seed,
+                'queue': queue,
+            },
+        )
+        errors_before = _udp_receive_errors()
+        usage_before = resource.getrusage(resource.RUSAGE_SELF)
+        sender.start()
+        sent = queue.get()
+        sender.join()
+
+        # let listener process queued messages and expire sessions
+        time.sleep(args.settle)
+        lsnr.stop()
+        thread.join()
+        usage_after = resource.getrusage(resource.RUSAGE_SELF)
+        errors_after = _udp_receive_errors()
+
+    received = _sample(registry, 'fence_kdump_listener_messages_total')
+    total = sent['valid'] + sent['invalid']
+    user = usage_after.ru_utime - usage_before.ru_utime
+    system = usage_after.ru_stime - usage_before.ru_stime
+    durations = lsnr.syncDurations
+
+    print('hosts: %d' % hosts)
+    print(
+        '  datagrams sent:     %d (valid %d, invalid %d, errors %d) '
+        'in %.2f s' % (
+            total,
+            sent['valid'],
+            sent['invalid'],
+            sent['errors'],
+            sent['duration'],
+        )
+    )
+    print('  datagrams received: %d' % received)
+    print(
+        '  packet loss:        %.2f %% (kernel receive errors: %s)' % (
+            100.0 * (total - received) / total if total else 0,
+            (
+                errors_after - errors_before
+                if errors_before is not None and errors_after is not None
+                else 'n/a'
+            ),
+        )
+    )
+    print(
+        '  db syncs:           %d, latency p50 %.2f ms, p99 %.2f ms, '
+        'max %.2f ms' % (
+            len(durations),
+            _percentile(durations, 0.5) * 1000,
+            _percentile(durations, 0.99) * 1000,
+            max(durations or [0]) * 1000,
+        )
+    )
+    if isinstance(db_manager, FakeDbManager):
+        print(
+            '  db calls:           %d, rows %d' % (
+                db_manager.calls,
+                db_manager.rows,
+            )
+        )
+    print(
+        '  cpu:                %.3f s (user %.3f s, system %.3f s), '
+        '%.3f s per 1k hosts' % (
+            user + system,
+            user,
+            system,
+            (user + system) * 1000 / hosts,
+        )
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='ovirt-fence-kdump-listener load generator',
+    )
+    parser.add_argument(
+        '--debug', default=False, action='store_true',
+        help='enable debug log',
+    )
+    parser.add_argument(
+        '--hosts', default='1000',
+        help='comma separated numbers of simulated hosts, run per number',
+    )
+    parser.add_argument(
+        '--rounds', type=int, default=3,
+        help='number of messages sent by each host',
+    )
+    parser.add_argument(
+        '--interval', type=float, default=1.0,
+        help='seconds between rounds',
+    )
+    parser.add_argument(
+        '--rate', type=float, default=0,
+        help='maximum datagrams per second, 0 for unlimited',
+    )
+    parser.add_argument(
+        '--invalid-ratio', type=float, default=0.05,
+        help='fraction of invalid datagrams',
+    )
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='random seed used to choose invalid datagrams',
+    )
+    parser.add_argument(
+        '--settle', type=float, default=5.0,
+        help='seconds to keep listener running after last datagram',
+    )
+    parser.add_argument(
+        '--address', default='127.0.0.1',
+        help='listener address',
+    )
+    parser.add_argument(
+        '--port', type=int, default=17410,
+        help='listener port',
+    )
+    parser.add_argument(
+        '--receive-buffer-size', type=int, default=0,
+        help='listener socket receive buffer size, 0 for system default',
+    )
+    parser.add_argument(
+        '--heartbeat-interval', type=int, default=1,
+        help='listener heartbeat interval in seconds',
+    )
+    parser.add_argument(
+        '--session-sync-interval', type=int, default=1,
+        help='listener session sync interval in seconds',
+    )
+    parser.add_argument(
+        '--session-expiration-time', type=int, default=2,
+        help='listener session expiration time in seconds',
+    )
+    parser.add_argument(
+        '--db-latency', type=float, default=0,
+        help='latency of fake database calls in seconds',
+    )
+    parser.add_argument(
+        '--db-database', default=None,
+        help='use real PostgreSQL engine database instead of fake one',
+    )
+    parser.add_argument(
+        '--db-host', default='localhost',
+        help='PostgreSQL host, empty for local socket',
+    )
+    parser.add_argument(
+        '--db-port', type=int, default=5432,
+        help='PostgreSQL port',
+    )
+    parser.add_argument(
+        '--db-user', default='engine',
+        help='PostgreSQL user',
+    )
+    parser.add_argument(
+        '--db-password', default='',
+        help='PostgreSQL password',
+    )
+    parser.add_argument(
+        '--db-validation', default=db.DbManager.VALIDATION_STATUS,
+        choices=(
+            db.DbManager.VALIDATION_STATUS,
+            db.DbManager.VALIDATION_QUERY,
+        ),
+        help='PostgreSQL connection validation mode',
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.WARNING,
+    )
+    for hosts in args.hosts.split(','):
+        run(args=args, hosts=int(hosts))
+
+
+if __name__ == '__main__':
+    main()
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
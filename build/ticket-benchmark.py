@@ -0,0 +1,198 @@
+#!/usr/bin/python
+
+# Copyright (C) 2026 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Micro-benchmark of ovirt_engine.ticket.
+
+Measures tickets encoded per second by TicketEncoder.encode and by
+TicketEncoder.encode_many in batches, and tickets decoded per second by
+TicketDecoder with known peer certificate (like websocket proxy) and
+with certificate taken from ticket, for each crypto backend. Uses
+certificate and key given, or temporary self-signed ones generated by
+openssl.
+
+Usage:
+    PYTHONPATH=packaging/pythonlib build/ticket-benchmark.py \\
+        --count 10000 --batch 1,100 \\
+        --backend cryptography --backend m2crypto
+"""
+
+import argparse
+import contextlib
+import os
+import shutil
+import subprocess
+import tempfile
+import timeit
+
+from ovirt_engine import ticket
+
+_DATA = '{"host": "host.example.com", "port": "5900", "ssl_target": true}'
+
+
+@contextlib.contextmanager
+def _certificate(args):
+    if args.cert:
+        yield args.cert, args.key
+        return
+    tmpdir = tempfile.mkdtemp()
+    try:
+        cert = os.path.join(tmpdir, 'cert.pem')
+        key = os.path.join(tmpdir, 'key.pem')
+        if args.key_type == 'ec':
+            newkey = ('-newkey', 'ec', '-pkeyopt', 'ec_paramgen_curve:P-256')
+        else:
+            newkey = ('-newkey', 'rsa:%d' % args.key_size)
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(
+                (
+                    'openssl', 'req', '-x509', '-nodes',
+                ) + newkey + (
+                    '-subj', '/CN=ticket-benchmark',
+                    '-days', '1',
+                    '-keyout', key,
+                    '-out', cert,
+                ),
+                stdout=devnull,
+                stderr=devnull,
+            )
+        yield cert, key
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def _report(name, count, duration):
+    print(
+        '%-24s %8d tickets in %6.2f s, %10.1f tickets/s' % (
+            name,
+            count,
+            duration,
+            count / duration,
+        )
+    )
+
+
+def run(args, backend, cert, key):
+    print('backend: %s' % backend)
+    encoder = ticket.TicketEncoder(
+        cert,
+        key,
+        lifetime=3600,
+        backend=backend,
+        digest=args.digest,
+    )
+
+    start = timeit.default_timer()
+    for i in range(args.count):
+        encoder.encode(_DATA)
+    _report('encode', args.count, timeit.default_timer() - start)
+
+    for batch in args.batch.split(','):
+        batch = int(batch)
+        datas = [_DATA] * batch
+        start = timeit.default_timer()
+        for i in range(args.count // batch):
+            encoder.encode_many(datas)
+        _report(
+            'encode_many batch %d' % batch,
+            args.count // batch * batch,
+            timeit.default_timer() - start,
+        )
+
+    tickets = encoder.encode_many([_DATA] * args.count)
+    with open(cert) as f:
+        peer = f.read()
+    for name, decoder in (
+        (
+            'decode peer',
+            ticket.TicketDecoder(
+                ca=None,
+                eku=None,
+                peer=peer,
+                backend=backend,
+            ),
+        ),
+        (
+            'decode ticket cert',
+            ticket.TicketDecoder(ca=None, eku=None, backend=backend),
+        ),
+    ):
+        start = timeit.default_timer()
+        for t in tickets:
+            decoder.decode(t)
+        _report(name, args.count, timeit.default_timer() - start)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='ovirt_engine.ticket micro-benchmark',
+    )
+    parser.add_argument(
+        '--count', type=int, default=10000,
+        help='number of tickets per measurement',
+    )
+    parser.add_argument(
+        '--batch', default='10,100',
+        help='comma separated encode_many batch sizes',
+    )
+    parser.add_argument(
+        '--cert', default=None,
+        help='signing certificate, temporary one is generated by default',
+    )
+    parser.add_argument(
+        '--key', default=None,
+        help='signing key of --cert',
+    )
+    parser.add_argument(
+        '--key-type', default='rsa', choices=('rsa', 'ec'),
+        help='type of generated key',
+    )
+    parser.add_argument(
+        '--key-size', type=int, default=2048,
+        help='size of generated RSA key',
+    )
+    parser.add_argument(
+        '--digest', default='sha1',
+        help='ticket digest',
+    )
+    parser.add_argument(
+        '--backend', action='append',
+        choices=[b.name for b in ticket.BACKENDS],
+        help='crypto backend, may be repeated, default all available',
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    backends = args.backend
+    if not backends:
+        backends = []
+        for backend in ticket.BACKENDS:
+            try:
+                ticket.get_backend(backend.name)
+                backends.append(backend.name)
+            except ImportError:
+                print('backend %s is not available' % backend.name)
+    with _certificate(args) as (cert, key):
+        for backend in backends:
+            run(args=args, backend=backend, cert=cert, key=key)
+
+
+if __name__ == '__main__':
+    main()
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
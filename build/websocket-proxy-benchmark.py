@@ -0,0 +1,366 @@
+#!/usr/bin/python
+
+# Copyright (C) 2026 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Throughput benchmark of websocket proxy modes.
+
+Starts a target streaming data (download, like console screen updates)
+or consuming it (upload), the proxy in child process and websocket
+clients. Reports throughput and MB/s per core of proxy process, CPU
+time of processes forked by websockify is included once reaped.
+
+Usage:
+    export PYTHONPATH=packaging/pythonlib
+    PYTHONPATH+=:packaging/services/ovirt-websocket-proxy
+    build/websocket-proxy-benchmark.py \\
+        --mode eventloop --mode websockify --connections 1,10
+
+websockify mode requires websockify and generated config.py.
+"""
+
+import argparse
+import base64
+import imp
+import json
+import logging
+import os
+import resource
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+import timeit
+
+import eventloop
+
+_CHUNK = 0x10000
+_MB = 1024 * 1024
+
+
+class _TicketDecoder(object):
+    """Accepts any ticket, returns the benchmark target"""
+
+    def __init__(self, port):
+        self._port = port
+
+    def decode(self, ticket):
+        return json.dumps({
+            'host': '127.0.0.1',
+            'port': str(self._port),
+            'ssl_target': False,
+        })
+
+
+def _target(port, direction, size):
+    """Serves connections, runs in child process"""
+    ls = socket.socket()
+    ls.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    ls.bind(('127.0.0.1', port))
+    ls.listen(socket.SOMAXCONN)
+    chunk = os.urandom(_CHUNK)
+
+    def serve(sock):
+        try:
+            if direction == 'download':
+                sent = 0
+                while sent < size:
+                    sock.sendall(chunk[:min(_CHUNK, size - sent)])
+                    sent += _CHUNK
+            else:
+                buf = bytearray(_CHUNK)
+                received = 0
+                while received < size:
+                    n = sock.recv_into(buf)
+                    if not n:
+                        return
+                    received += n
+                sock.sendall(b'!')
+            # wait for client to close
+            sock.recv(1)
+        except socket.error:
+            # readiness probe or failed client
+            pass
+        finally:
+            sock.close()
+
+    while True:
+        sock, address = ls.accept()
+        t = threading.Thread(target=serve, args=(sock,))
+        t.daemon = True
+        t.start()
+
+
+def _recv_exactly(sock, view):
+    while len(view):
+        n = sock.recv_into(view)
+        if not n:
+            raise EOFError()
+        view = view[n:]
+
+
+def _client(port, direction, size, results):
+    sock = socket.create_connection(('127.0.0.1', port))
+    try:
+        sock.sendall(
+            'GET /ticket HTTP/1.1\r\n'
+            'Host: 127.0.0.1\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            'Sec-WebSocket-Key: %s\r\n'
+            'Sec-WebSocket-Version: 13\r\n'
+            'Sec-WebSocket-Protocol: binary\r\n'
+            '\r\n' % base64.b64encode(os.urandom(16))
+        )
+        response = ''
+        while '\r\n\r\n' not in response:
+            data = sock.recv(1)
+            if not data:
+                raise EOFError('Handshake failed: %r' % response)
+            response += data
+
+        buf = bytearray(_CHUNK + 10)
+        view = memoryview(buf)
+
+        def frame():
+            _recv_exactly(sock, view[:2])
+            length = buf[1] & 0x7f
+            if length == 126:
+                _recv_exactly(sock, view[:2])
+                length = struct.unpack_from('>H', buf)[0]
+            elif length == 127:
+                _recv_exactly(sock, view[:8])
+                length = struct.unpack_from('>Q', buf)[0]
+            remaining = length
+            while remaining:
+                n = min(remaining, len(buf))
+                _recv_exactly(sock, view[:n])
+                remaining -= n
+            return length
+
+        if direction == 'download':
+            received = 0
+            while received < size:
+                received += frame()
+        else:
+            # payload is not important, so the same masked frame is sent
+            payload = os.urandom(_CHUNK)
+            message = struct.pack(
+                '>BBQ', 0x82, 0x80 | 127, _CHUNK
+            ) + b'\0\0\0\0' + payload
+            sent = 0
+            while sent < size:
+                sock.sendall(message)
+                sent += _CHUNK
+            frame()
+    finally:
+        sock.close()
+    results.append(size)
+
+
+def _proxy(args, mode, port, target_port):
+    """Runs proxy, runs in child process"""
+    if mode == 'eventloop':
+        eventloop.EventLoopProxy(
+            listen_host='127.0.0.1',
+            listen_port=port,
+            target=lambda path: ('127.0.0.1', target_port, False),
+            workers=args.workers,
+        ).serve_forever()
+    else:
+        # service is next to eventloop, found in PYTHONPATH
+        proxy = imp.load_source(
+            'ovirt_websocket_proxy',
+            os.path.join(
+                os.path.dirname(os.path.abspath(eventloop.__file__)),
+                'ovirt-websocket-proxy.py',
+            ),
+        )
+        if proxy.websockify_has_plugins():
+            kwargs = {'token_plugin': 'TokenFile'}
+        else:
+            kwargs = {'target_cfg': '/dummy'}
+        proxy.OvirtWebSocketProxy(
+            listen_host='127.0.0.1',
+            listen_port=port,
+            source_is_ipv6=False,
+            verbose=False,
+            ticketDecoder=_TicketDecoder(target_port),
+            logger=logging.getLogger('websockify'),
+            cert='',
+            key='',
+            ssl_only=False,
+            daemon=False,
+            record=None,
+            web=None,
+            target_host=None,
+            target_port=None,
+            wrap_mode='exit',
+            wrap_cmd=None,
+            RequestHandlerClass=proxy.OvirtProxyRequestHandler,
+            **kwargs
+        ).start_server()
+
+
+def _fork(target, *args):
+    pid = os.fork()
+    if pid == 0:
+        status = 0
+        try:
+            target(*args)
+        except BaseException:
+            logging.exception('Child failed')
+            status = 1
+        finally:
+            os._exit(status)
+    return pid
+
+
+def _wait_listening(port, timeout=10):
+    deadline = timeit.default_timer() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return
+        except socket.error:
+            if timeit.default_timer() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def run(args, mode, connections):
+    target = _fork(
+        _target,
+        args.target_port,
+        args.direction,
+        args.size * _MB,
+    )
+    proxy = None
+    try:
+        _wait_listening(args.target_port)
+        proxy = _fork(_proxy, args, mode, args.port, args.target_port)
+        _wait_listening(args.port)
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=_client,
+                args=(
+                    args.port,
+                    args.direction,
+                    args.size * _MB,
+                    results,
+                ),
+            )
+            for i in range(connections)
+        ]
+        start = timeit.default_timer()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        duration = timeit.default_timer() - start
+
+        # let websockify reap its children
+        time.sleep(1)
+    finally:
+        if proxy is not None:
+            os.kill(proxy, signal.SIGTERM)
+            usage = os.wait4(proxy, 0)[2]
+        os.kill(target, signal.SIGKILL)
+        os.waitpid(target, 0)
+
+    total = float(sum(results)) / _MB
+    cpu = usage.ru_utime + usage.ru_stime
+    print(
+        '%-10s %-8s connections %4d: %8.1f MB in %6.2f s, %8.1f MB/s, '
+        'proxy cpu %6.2f s, %8.1f MB/s per core%s' % (
+            mode,
+            args.direction,
+            connections,
+            total,
+            duration,
+            total / duration,
+            cpu,
+            total / cpu if cpu else 0,
+            (
+                '' if len(results) == connections
+                else ', %d connections failed' % (
+                    connections - len(results)
+                )
+            ),
+        )
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='ovirt-websocket-proxy throughput benchmark',
+    )
+    parser.add_argument(
+        '--debug', default=False, action='store_true',
+        help='enable debug log',
+    )
+    parser.add_argument(
+        '--mode', action='append', choices=('eventloop', 'websockify'),
+        help='proxy mode, may be repeated, default eventloop',
+    )
+    parser.add_argument(
+        '--direction', default='download', choices=('download', 'upload'),
+        help='download streams from target to client, upload the opposite',
+    )
+    parser.add_argument(
+        '--connections', default='1',
+        help='comma separated numbers of concurrent connections',
+    )
+    parser.add_argument(
+        '--size', type=int, default=256,
+        help='megabytes transferred per connection',
+    )
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help='eventloop mode worker processes',
+    )
+    parser.add_argument(
+        '--port', type=int, default=16100,
+        help='proxy port',
+    )
+    parser.add_argument(
+        '--target-port', type=int, default=16101,
+        help='target port',
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.WARNING,
+    )
+    # clients and target may have many sockets open
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    for mode in args.mode or ['eventloop']:
+        for connections in args.connections.split(','):
+            run(args=args, mode=mode, connections=int(connections))
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
@@ -33,8 +33,9 @@ BEGIN
 END;$PROCEDURE$
 LANGUAGE plpgsql;
 
+-- v_ip is IPv4 or IPv6 address, scope of link local address is ignored
 CREATE OR REPLACE FUNCTION UpsertKdumpStatusForIp (
-    v_ip VARCHAR(20),
+    v_ip VARCHAR(50),
     v_status VARCHAR(20),
     v_address VARCHAR(255)
     )
@@ -49,7 +50,8 @@ BEGIN
     SELECT vds_id
     INTO v_vds_id
     FROM vds_interface
-    WHERE addr = v_ip;
+    WHERE addr = v_ip
+        OR ipv6_address = split_part(v_ip, '%', 1);
 
     IF v_vds_id IS NOT NULL THEN
         SELECT UpsertKdumpStatus(v_vds_id, v_status, v_address)
@@ -60,6 +62,37 @@ BEGIN
 END;$PROCEDURE$
 LANGUAGE plpgsql;
 
+-- UpsertKdumpStatusForIps is used in fence_kdump listener to save
+-- all updated sessions in single call
+DROP TYPE IF EXISTS kdump_status_for_ip_rs CASCADE;
+CREATE TYPE kdump_status_for_ip_rs AS (
+        address VARCHAR(255),
+        updated INT
+        );
+
+CREATE OR REPLACE FUNCTION UpsertKdumpStatusForIps (
+    v_ips VARCHAR(50) [],
+    v_statuses VARCHAR(20) [],
+    v_addresses VARCHAR(255) []
+    )
+RETURNS SETOF kdump_status_for_ip_rs AS $PROCEDURE$
+DECLARE v_result kdump_status_for_ip_rs;
+
+BEGIN
+    FOR i IN 1..coalesce(array_length(v_ips, 1), 0)
+    LOOP
+        v_result.address := v_addresses[i];
+        v_result.updated := UpsertKdumpStatusForIp(
+            v_ips[i],
+            v_statuses[i],
+            v_addresses[i]
+            );
+
+        RETURN NEXT v_result;
+    END LOOP;
+END;$PROCEDURE$
+LANGUAGE plpgsql;
+
 CREATE OR REPLACE FUNCTION RemoveFinishedKdumpStatusForVds (v_vds_id UUID)
 RETURNS VOID AS $PROCEDURE$
 BEGIN
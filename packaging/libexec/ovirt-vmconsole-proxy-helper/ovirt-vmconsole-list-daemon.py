@@ -0,0 +1,267 @@
+#!/usr/bin/python
+
+# Copyright (C) 2026 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helper daemon answering ovirt-vmconsole-list requests.
+
+Keeps connections to engine open and caches public keys responses, so
+ovirt-vmconsole-list executed per ssh login does not need to load
+ticket key, sign ticket and perform TLS handshake with engine.
+
+If HELPER_KEYS_SYNC_INTERVAL is set, public keys are periodically synced
+into local index, and public keys requests are answered from the index
+while it is not older than HELPER_KEYS_MAX_AGE, engine is called
+otherwise.
+"""
+
+import gettext
+import json
+import os
+import stat
+import sys
+import threading
+
+import ovirt_vmconsole_conf as config
+import vmconsole_helper
+
+from ovirt_engine import configfile
+from ovirt_engine import service
+
+if sys.version_info[0] < 3:
+    from SocketServer import StreamRequestHandler
+    from SocketServer import ThreadingMixIn
+    from SocketServer import UnixStreamServer
+else:
+    from socketserver import StreamRequestHandler
+    from socketserver import ThreadingMixIn
+    from socketserver import UnixStreamServer
+
+
+def _(m):
+    return gettext.dgettext(message=m, domain='ovirt-engine-vmconsole-helper')
+
+
+class _RequestHandler(StreamRequestHandler):
+
+    # client sends single request line
+    MAX_REQUEST_SIZE = 0x10000
+
+    def handle(self):
+        try:
+            request = json.loads(
+                self.rfile.readline(self.MAX_REQUEST_SIZE).decode('utf8')
+            )
+            response = {'result': self.server.call(request)}
+        except Exception as e:
+            self.server.logger.debug('Request failed', exc_info=True)
+            response = {'error': str(e)}
+        self.wfile.write(('%s\n' % json.dumps(response)).encode('utf8'))
+
+
+class HelperServer(ThreadingMixIn, UnixStreamServer):
+    """Serves helper requests, each connection in its own thread"""
+
+    daemon_threads = True
+
+    # responses of these commands are cached
+    _CACHED_COMMANDS = ('public_keys',)
+    _COMMANDS = ('public_keys', 'available_consoles')
+
+    def __init__(self, path, client, cache, logger, index=None):
+        UnixStreamServer.__init__(self, path, _RequestHandler)
+        self._client = client
+        self._cache = cache
+        self._index = index
+        self.logger = logger
+
+    def call(self, request):
+        if request.get('command') not in self._COMMANDS:
+            raise ValueError(
+                _("Invalid command '{command}'").format(
+                    command=request.get('command'),
+                )
+            )
+
+        if request['command'] == 'public_keys' and self._index is not None:
+            if not self._index.ready:
+                self.logger.debug('Keys index is not synced, calling engine')
+            else:
+                response = self._index.lookup(
+                    key_fp=request.get('key_fp', ''),
+                    key_type=request.get('key_type', ''),
+                    key_content=request.get('key_content', ''),
+                )
+                if response is not None:
+                    return response
+                self.logger.debug('Key is not indexed, calling engine')
+
+        cached = request['command'] in self._CACHED_COMMANDS
+        if cached:
+            key = self._cache.key(request)
+            response = self._cache.get(key)
+            if response is not None:
+                self.logger.debug('Cached response of %s', key)
+                return response
+
+        response = self._client.call(request)
+        if cached:
+            self._cache.put(key, response)
+        return response
+
+
+class KeysSync(threading.Thread):
+    """Syncs keys index from engine every interval seconds"""
+
+    def __init__(self, client, index, interval, logger):
+        super(KeysSync, self).__init__(name='KeysSync')
+        self.daemon = True
+        self._client = client
+        self._index = index
+        self._interval = interval
+        self._stopping = threading.Event()
+        self.logger = logger
+
+    def sync(self):
+        response = json.loads(
+            self._client.call({
+                'command': 'public_keys',
+                'version': 1,
+                'key_fp': '',
+                'key_type': '',
+                'key_content': '',
+            })
+        )
+        self._index.update(response.get('keys', []))
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                self.logger.warning(
+                    _('Cannot sync keys from engine: {error}').format(
+                        error=e,
+                    )
+                )
+                self.logger.debug('Exception', exc_info=True)
+            self._stopping.wait(self._interval)
+
+    def stop(self):
+        self._stopping.set()
+
+
+class Daemon(service.Daemon):
+
+    def _removeSocket(self):
+        path = self._config.get('HELPER_SOCKET')
+        try:
+            if stat.S_ISSOCK(os.stat(path).st_mode):
+                os.unlink(path)
+        except OSError:
+            pass
+
+    def daemonSetup(self):
+        self._config = configfile.ConfigFile(
+            [
+                config.VMCONSOLE_PROXY_HELPER_DEFAULTS,
+                config.VMCONSOLE_PROXY_HELPER_VARS,
+            ],
+            cache=os.path.join(
+                config.VMCONSOLE_PROXY_HELPER_CACHE,
+                'ovirt-vmconsole-proxy-helper.conf.json',
+            ),
+        )
+
+        if not self._config.get('HELPER_SOCKET'):
+            raise RuntimeError(_('HELPER_SOCKET is not configured'))
+
+        self.check(
+            name=self._config.get('TOKEN_KEY'),
+        )
+        self.check(
+            name=os.path.dirname(self._config.get('HELPER_SOCKET')),
+            directory=True,
+            writable=True,
+        )
+        if self._config.getinteger('HELPER_KEYS_SYNC_INTERVAL') > 0:
+            self.check(
+                name=self._config.get('HELPER_KEYS_INDEX'),
+                mustExist=False,
+                writable=True,
+            )
+
+    def daemonContext(self):
+        client = vmconsole_helper.EngineClient(
+            self._config,
+            connections=self._config.getinteger('HELPER_CONNECTIONS'),
+        )
+        index = keysSync = None
+        interval = self._config.getinteger('HELPER_KEYS_SYNC_INTERVAL')
+        if interval > 0:
+            index = vmconsole_helper.KeyIndex(
+                self._config.get('HELPER_KEYS_INDEX'),
+                max_age=(
+                    self._config.getinteger('HELPER_KEYS_MAX_AGE') or
+                    3 * interval
+                ),
+            )
+            try:
+                index.load()
+            except (IOError, ValueError, KeyError) as e:
+                self.logger.warning(
+                    _(
+                        "Cannot load keys index '{path}', "
+                        "waiting for sync: {error}"
+                    ).format(
+                        path=self._config.get('HELPER_KEYS_INDEX'),
+                        error=e,
+                    )
+                )
+            keysSync = KeysSync(
+                client=client,
+                index=index,
+                interval=interval,
+                logger=self.logger,
+            )
+            keysSync.start()
+
+        # socket of previous instance
+        self._removeSocket()
+        server = HelperServer(
+            path=self._config.get('HELPER_SOCKET'),
+            client=client,
+            cache=vmconsole_helper.ResponseCache(
+                ttl=self._config.getinteger('HELPER_KEYS_CACHE_TTL'),
+            ),
+            logger=self.logger,
+            index=index,
+        )
+        try:
+            server.serve_forever()
+        finally:
+            if keysSync is not None:
+                keysSync.stop()
+            server.server_close()
+            client.close()
+            self._removeSocket()
+
+
+if __name__ == '__main__':
+    service.setupLogger()
+    d = Daemon()
+    d.run()
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
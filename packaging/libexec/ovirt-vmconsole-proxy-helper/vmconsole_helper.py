@@ -0,0 +1,479 @@
+# Copyright (C) 2026 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Engine access shared by ovirt-vmconsole-list and its helper daemon."""
+
+import base64
+import collections
+import contextlib
+import gettext
+import hashlib
+import json
+import logging
+import os
+import socket
+import ssl
+import sys
+import threading
+import time
+
+from ovirt_engine import ticket
+from ovirt_engine import util
+
+if sys.version_info[0] < 3:
+    from httplib import HTTPConnection
+    from httplib import HTTPException
+    from httplib import HTTPSConnection
+    from urlparse import urljoin
+    from urlparse import urlparse
+else:
+    from http.client import HTTPConnection
+    from http.client import HTTPException
+    from http.client import HTTPSConnection
+    from urllib.parse import urljoin
+    from urllib.parse import urlparse
+
+
+LOGGER_NAME = 'ovirt.engine.vmconsole.helper'
+
+_HTTP_STATUS_CODE_SUCCESS = 200
+_SERVICE_PATH = 'services/vmconsole-proxy'
+
+
+def _(m):
+    return gettext.dgettext(message=m, domain='ovirt-engine-vmconsole-helper')
+
+
+class EngineConnection(HTTPSConnection):
+    """HTTPS connection verifying engine certificate"""
+
+    def __init__(self, host, port=None, ca_certs=None, verify_host=True):
+        HTTPSConnection.__init__(self, host, port)
+        self._ca_certs = ca_certs
+        self._verify_host = verify_host
+
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port), self.timeout)
+
+        if getattr(ssl, 'create_default_context', None):
+            context = ssl.create_default_context()
+            if self._ca_certs:
+                context.load_verify_locations(cafile=self._ca_certs)
+                context.check_hostname = self._verify_host
+                context.verify_mode = ssl.CERT_REQUIRED
+            else:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            self.sock = context.wrap_socket(sock, server_hostname=self.host)
+
+        else:
+            self.sock = ssl.wrap_socket(
+                sock,
+                cert_reqs=(
+                    ssl.CERT_REQUIRED if self._ca_certs
+                    else ssl.CERT_NONE
+                ),
+                ca_certs=self._ca_certs,
+            )
+            if self._verify_host:
+                cert = self.sock.getpeercert()
+                for field in cert.get('subject', []):
+                    if field[0][0] == 'commonName':
+                        expected = field[0][1]
+                        break
+                else:
+                    raise RuntimeError(
+                        _('No CN in peer certificate')
+                    )
+
+                if expected != self.host:
+                    raise RuntimeError(
+                        _(
+                            "Invalid host '{host}' "
+                            "expected '{expected}'"
+                        ).format(
+                            expected=expected,
+                            host=self.host,
+                        )
+                    )
+
+
+def make_ticket_encoder(cfg_file):
+    return ticket.TicketEncoder(
+        cfg_file.get('TOKEN_CERTIFICATE'),
+        cfg_file.get('TOKEN_KEY'),
+        backend=cfg_file.get('TICKET_CRYPTO_BACKEND') or None,
+    )
+
+
+def handle_response(res_string):
+    if not res_string:
+        return res_string
+
+    res_obj = json.loads(res_string)
+    # fixup types as ovirt-vmconsole-proxy-keys expects them
+    res_obj['version'] = int(res_obj['version'])
+    for con in res_obj.get('consoles', []):
+        # fixup: servlet uses 'vmname' to reduce ambiguity;
+        # ovirt-vmconsole-* however, expects 'vm'.
+        con['vm'] = con['vmname']
+        # fixup: to avoid name clashes between VMs
+        # .sock suffix is for clarity
+        con['console'] = '%s.sock' % con['vmid']
+
+    return json.dumps(res_obj)
+
+
+class EngineClient(object):
+    """
+    Sends helper requests to engine.
+
+    Up to connections idle connections are kept open, so subsequent
+    requests do not require TCP and TLS handshake. Ticket encoder is
+    created once; signing is serialized, as the backend key context is
+    not thread safe.
+    """
+
+    def __init__(self, cfg_file, connections=1):
+        self.logger = logging.getLogger(LOGGER_NAME)
+        base_url = (
+            # debug, emergency override
+            os.getenv('OVIRT_VMCONSOLE_ENGINE_BASE_URL') or
+            cfg_file.get('ENGINE_BASE_URL')
+        )
+        self.logger.debug('using engine base url: %s', base_url)
+        self._url = urlparse(urljoin(base_url, _SERVICE_PATH))
+
+        self._ca_certs = cfg_file.get('ENGINE_CA')
+        if not self._ca_certs:
+            self.logger.warning(
+                'Engine CA not configured, connecting in insecure mode'
+            )
+            self._ca_certs = None
+        self._verify_host = cfg_file.getboolean('ENGINE_VERIFY_HOST')
+
+        self._encoder = make_ticket_encoder(cfg_file)
+        self._encoderLock = threading.Lock()
+        self._connections = connections
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._url.scheme == 'http':
+            return HTTPConnection(self._url.hostname, self._url.port)
+        return EngineConnection(
+            self._url.hostname,
+            self._url.port,
+            ca_certs=self._ca_certs,
+            verify_host=self._verify_host,
+        )
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < self._connections:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def _post(self, connection, data):
+        connection.request(
+            'POST',
+            self._url.path,
+            body=data,
+            headers={
+                'Content-Type': 'text/plain',
+                'Content-Length': str(len(data)),
+            },
+        )
+        res = connection.getresponse()
+        content = res.read()
+        return res, content
+
+    def call(self, request):
+        """Sends request dictionary, returns response string"""
+        with self._encoderLock:
+            data = self._encoder.encode(json.dumps(request))
+        self.logger.debug(
+            'will send POST to %s', self._url.geturl()
+        )
+
+        connection, reused = self._acquire()
+        try:
+            try:
+                res, content = self._post(connection, data)
+            except (socket.error, HTTPException):
+                if not reused:
+                    raise
+                # engine closed idle connection meanwhile
+                self.logger.debug('Reconnecting', exc_info=True)
+                connection.close()
+                connection = self._connect()
+                res, content = self._post(connection, data)
+        except Exception:
+            connection.close()
+            raise
+
+        if res.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+
+        if res.status != _HTTP_STATUS_CODE_SUCCESS:
+            raise RuntimeError(
+                'Engine call failed: code=%d' % res.status
+            )
+        return handle_response(content)
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+
+
+class ResponseCache(object):
+    """Bounded cache of responses expiring ttl seconds after stored"""
+
+    def __init__(self, ttl, size=1000):
+        self._ttl = ttl
+        self._size = size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(request):
+        return json.dumps(request, sort_keys=True)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if util.monotonic() < expires:
+                    return value
+                del self._entries[key]
+        return None
+
+    def put(self, key, value):
+        if self._ttl <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (util.monotonic() + self._ttl, value)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+
+
+def key_fingerprints(key):
+    """Fingerprints of OpenSSH public key line, as printed by sshd
+
+    Both SHA256:<base64> and MD5:<hex> forms are returned, MD5 also
+    without prefix, as used by older sshd.
+    """
+    fields = key.split()
+    if len(fields) < 2:
+        return []
+    try:
+        blob = base64.b64decode(fields[1].encode('ascii'))
+    except (TypeError, ValueError):
+        return []
+    md5 = ':'.join(
+        '%02x' % c for c in bytearray(hashlib.md5(blob).digest())
+    )
+    return [
+        'SHA256:%s' % base64.b64encode(
+            hashlib.sha256(blob).digest()
+        ).decode('ascii').rstrip('='),
+        'MD5:%s' % md5,
+        md5,
+    ]
+
+
+class KeyIndex(object):
+    """
+    Local index of public keys known to engine.
+
+    Keys are synced from full engine public_keys responses by update(),
+    and looked up by fingerprint, type or content without contacting
+    engine. The index is persisted into path, so it is available after
+    restart even if engine is not. The index is ready only up to max_age
+    seconds after last successful sync, as it does not reflect keys
+    revoked since.
+    """
+
+    def __init__(self, path, max_age):
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self._path = path
+        self._maxAge = max_age
+        self._lock = threading.Lock()
+        self._keys = []
+        self._byFingerprint = {}
+        self.synced = None
+
+    def _build(self, keys):
+        byFingerprint = {}
+        for entry in keys:
+            for fingerprint in entry['fingerprints']:
+                byFingerprint.setdefault(fingerprint, []).append(entry)
+        with self._lock:
+            self._keys = keys
+            self._byFingerprint = byFingerprint
+
+    def load(self):
+        if not os.path.exists(self._path):
+            return
+        with open(self._path) as f:
+            content = json.load(f)
+        self._build(content['keys'])
+        self.synced = content['synced']
+        self.logger.debug(
+            'Loaded %d keys from %s',
+            len(self._keys),
+            self._path,
+        )
+
+    def _save(self):
+        tmp = '%s.tmp' % self._path
+        with open(tmp, 'w') as f:
+            json.dump(
+                {
+                    'synced': self.synced,
+                    'keys': self._keys,
+                },
+                f,
+            )
+            # content must be on disk before rename replaces index
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, self._path)
+
+    @property
+    def ready(self):
+        if self.synced is None:
+            return False
+        # wall clock, as sync time is persisted
+        age = time.time() - self.synced
+        return 0 <= age <= self._maxAge
+
+    def update(self, keys):
+        """
+        Updates index by keys of engine public_keys response.
+
+        Fingerprints are computed only for keys not already indexed,
+        and the index is written only if keys were changed.
+        Returns number of added and removed keys.
+        """
+        current = dict(
+            ((e['entityid'], e['key']), e) for e in self._keys
+        )
+        fingerprints = dict((e['key'], e['fingerprints']) for e in self._keys)
+        updated = []
+        added = 0
+        for key in keys:
+            entry = current.pop((key['entityid'], key['key']), None)
+            if entry is None or entry['entity'] != key['entity']:
+                fps = fingerprints.get(key['key'])
+                if fps is None:
+                    fps = key_fingerprints(key['key'])
+                entry = {
+                    'entityid': key['entityid'],
+                    'entity': key['entity'],
+                    'key': key['key'],
+                    'fingerprints': fps,
+                }
+                added += 1
+            updated.append(entry)
+        removed = len(current)
+
+        self.synced = time.time()
+        if added or removed:
+            self._build(updated)
+            self._save()
+            self.logger.debug(
+                'Keys index updated, added %d removed %d',
+                added,
+                removed,
+            )
+        return added, removed
+
+    def lookup(self, key_fp='', key_type='', key_content=''):
+        """
+        Returns public_keys response of indexed keys matching filters.
+
+        None is returned if filters match no key, as the key may be
+        added to engine since last sync.
+        """
+        with self._lock:
+            if key_fp:
+                keys = self._byFingerprint.get(key_fp, [])
+            else:
+                keys = self._keys
+
+        result = []
+        for entry in keys:
+            fields = entry['key'].split()
+            if key_type and fields[0] != key_type:
+                continue
+            if key_content and fields[1:2] != [key_content]:
+                continue
+            result.append(
+                dict(
+                    (k, entry[k])
+                    for k in ('entityid', 'entity', 'key')
+                )
+            )
+        if not result and (key_fp or key_type or key_content):
+            return None
+        return json.dumps({
+            'version': 1,
+            'content': 'key_list',
+            'keys': result,
+        })
+
+
+def call_daemon(path, request, timeout=60):
+    """Sends request to helper daemon, returns response string
+
+    socket.error is raised if daemon is not available.
+    """
+    with contextlib.closing(
+        socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    ) as s:
+        s.settimeout(timeout)
+        s.connect(path)
+        try:
+            s.sendall(('%s\n' % json.dumps(request)).encode('utf8'))
+            chunks = []
+            while True:
+                chunk = s.recv(0x10000)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        except socket.error as e:
+            raise RuntimeError(
+                _('Helper daemon failed: {error}').format(error=e)
+            )
+
+    response = json.loads(b''.join(chunks).decode('utf8'))
+    if 'error' in response:
+        raise RuntimeError(response['error'])
+    return response['result']
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
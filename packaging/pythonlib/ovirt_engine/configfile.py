@@ -15,10 +15,18 @@
 #
 
 
+import ctypes
+import ctypes.util
+import errno
 import gettext
 import glob
+import json
 import os
 import re
+import select
+import sys
+import threading
+import time
 
 from . import base
 
@@ -31,51 +39,225 @@ class ConfigFile(base.Base):
     """
     Parsing of shell style config file.
     Follow closly the java LocalConfig implementaiton.
+
+    If cache is specified, the merged values are stored into it along
+    with stat of every file loaded and of every configuration directory,
+    subsequent loads use the cache as long as none of these changed.
+    Cache is not used if any of the files was modified recently, as
+    further changes within the mtime resolution cannot be detected.
+    Values of *_PASSWORD keys are not stored into cache, they are read
+    again from the files which set them.
+
+    reload() loads the files again and returns the changed keys, watch()
+    does so whenever the files change.
     """
 
-    _EMPTY_LINE = re.compile(r'^\s*(#.*|)$')
-    _KEY_VALUE_EXPRESSION = re.compile(r'^\s*(?P<key>\w+)=(?P<value>.*)$')
+    _LINE = re.compile(r'^\s*(?:(?P<key>\w+)=(?P<value>.*)|#.*|)$')
+    _SPECIAL = re.compile(r'[\\$" #]')
+    _QUOTED = re.compile(r'"(?P<value>[^\\$"]*)"$')
+    _TOKENS = re.compile(
+        r'\\(?P<escaped>.?)|'
+        r'\$\{(?P<name>[^}]*)\}|'
+        r'(?P<malformed>\$)|'
+        r'(?P<quote>")|'
+        r'(?P<separator>[ #])|'
+        r'(?P<text>[^\\$" #]+)',
+        re.DOTALL,
+    )
+    _SECRET = re.compile(r'_PASSWORD$')
+
+    _CACHE_VERSION = 2
+    _CACHE_RACY_SECONDS = 2
 
     @property
     def values(self):
         return self._values
 
     def _loadLine(self, line):
-        emptyMatch = self._EMPTY_LINE.search(line)
-        if emptyMatch is None:
-            keyValueMatch = self._KEY_VALUE_EXPRESSION.search(line)
-            if keyValueMatch is None:
-                raise RuntimeError(_('Invalid sytax'))
-            self._values[keyValueMatch.group('key')] = self.expandString(
-                keyValueMatch.group('value')
-            )
+        lineMatch = self._LINE.match(line)
+        if lineMatch is None:
+            raise RuntimeError(_('Invalid sytax'))
+        key = lineMatch.group('key')
+        if key is not None:
+            self._values[key] = self.expandString(lineMatch.group('value'))
+        return key
 
-    def __init__(self, files=[]):
+    def __init__(self, files=[], cache=None):
         super(ConfigFile, self).__init__()
 
         self._values = {}
+        # files setting secrets, in load order
+        self._secretFiles = []
+        self._files = list(files)
+        self._cache = cache
+
+        if cache is None or not self._loadCache(files, cache):
+            self._stamps = self._loadFiles(files)
+            if cache is not None:
+                self._saveCache(files, cache, self._stamps)
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return [st.st_mtime, st.st_size, st.st_ino]
 
+    def _loadFiles(self, files):
+        stamps = []
         for file in files:
+            stamps.append([file, self._stamp(file)])
             self.loadFile(file)
+            confd = '%s.d' % file
+            stamps.append([confd, self._stamp(confd)])
             for filed in sorted(
                 glob.glob(
                     os.path.join(
-                        '%s.d' % file,
+                        confd,
                         '*.conf',
                     )
                 )
             ):
+                stamps.append([filed, self._stamp(filed)])
                 self.loadFile(filed)
+        return stamps
+
+    def _loadCache(self, files, cache):
+        try:
+            with open(cache, 'r') as f:
+                content = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+
+        if (
+            content.get('version') != self._CACHE_VERSION or
+            content.get('files') != list(files)
+        ):
+            return False
+        for path, stamp in content['stamps']:
+            if self._stamp(path) != stamp:
+                return False
+
+        values = content['values']
+        if sys.version_info[0] < 3:
+            values = dict(
+                (k.encode('utf-8'), v.encode('utf-8'))
+                for k, v in values.items()
+            )
+        self._values = values
+        try:
+            for file in content['secretFiles']:
+                self._loadSecrets(file)
+        except (IOError, OSError, RuntimeError) as e:
+            self.logger.debug("Cannot load secrets of '%s': %s", cache, e)
+            self._values = {}
+            return False
+        self._secretFiles = content['secretFiles']
+        self._stamps = content['stamps']
+        self.logger.debug("loaded config from cache '%s'", cache)
+        return True
+
+    def _loadSecrets(self, file):
+        with open(file, 'r') as f:
+            for line in f:
+                lineMatch = self._LINE.match(line)
+                if lineMatch is None:
+                    raise RuntimeError(_('Invalid sytax'))
+                key = lineMatch.group('key')
+                if key is not None and self._SECRET.search(key):
+                    self._values[key] = self.expandString(
+                        lineMatch.group('value')
+                    )
+
+    def _saveCache(self, files, cache, stamps):
+        racy = time.time() - self._CACHE_RACY_SECONDS
+        if any(s is not None and s[0] > racy for p, s in stamps):
+            return
+
+        tmp = '%s.%s.tmp' % (cache, os.getpid())
+        try:
+            content = json.dumps({
+                'version': self._CACHE_VERSION,
+                'files': list(files),
+                'stamps': stamps,
+                'values': dict(
+                    (k, v) for k, v in self._values.items()
+                    if not self._SECRET.search(k)
+                ),
+                'secretFiles': self._secretFiles,
+            })
+            # values may still be sensitive
+            with os.fdopen(
+                os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600),
+                'w',
+            ) as f:
+                f.write(content)
+            os.rename(tmp, cache)
+        except (IOError, OSError, ValueError) as e:
+            self.logger.debug("Cannot write config cache '%s': %s", cache, e)
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def changed(self):
+        """Whether any of the loaded files or directories changed"""
+        for path, stamp in self._stamps:
+            if self._stamp(path) != stamp:
+                return True
+        return False
+
+    def reload(self):
+        """
+        Loads the files given at construction again.
+
+        Values are replaced at once, so concurrent readers see either
+        previous or new values. Returns dictionary of changed keys to
+        tuples of previous and new value, None if key was not set.
+        """
+        fresh = ConfigFile(self._files, cache=self._cache)
+        previous = self._values
+        self._values = fresh._values
+        self._stamps = fresh._stamps
+        return dict(
+            (key, (previous.get(key), self._values.get(key)))
+            for key in set(previous) | set(self._values)
+            if previous.get(key) != self._values.get(key)
+        )
+
+    def watch(self, callback, interval=5):
+        """
+        Reloads when the files change, calling callback with the changes.
+
+        Changes are detected by inotify, or by checking the files every
+        interval seconds where inotify is not available. callback is
+        called from the watcher thread. Returns started ConfigWatcher.
+        """
+        watcher = ConfigWatcher(
+            config=self,
+            callback=callback,
+            interval=interval,
+        )
+        watcher.start()
+        return watcher
 
     def loadFile(self, file):
         if os.path.exists(file):
             self.logger.debug("loading config '%s'", file)
             index = 0
+            secret = False
             try:
                 with open(file, 'r') as f:
                     for line in f:
                         index += 1
-                        self._loadLine(line)
+                        stripped = line.lstrip()
+                        if stripped and stripped[0] != '#':
+                            key = self._loadLine(line)
+                            if key is not None and self._SECRET.search(key):
+                                secret = True
+                if secret:
+                    self._secretFiles.append(file)
             except Exception as e:
                 self.logger.error(
                     "File '%s' index %d error" % (file, index),
@@ -93,41 +275,31 @@ class ConfigFile(base.Base):
                 )
 
     def expandString(self, value):
-        ret = ""
+        if self._SPECIAL.search(value) is None:
+            return value
+        quotedMatch = self._QUOTED.match(value)
+        if quotedMatch is not None:
+            return quotedMatch.group('value')
+
+        ret = []
 
-        escape = False
         inQuotes = False
-        index = 0
-        while (index < len(value)):
-            c = value[index]
-            index += 1
-            if escape:
-                escape = False
-                ret += c
+        for token in self._TOKENS.finditer(value):
+            kind = token.lastgroup
+            if kind in ('text', 'escaped'):
+                ret.append(token.group(kind))
+            elif kind == 'name':
+                ret.append(self._values.get(token.group(kind), ""))
+            elif kind == 'malformed':
+                raise RuntimeError('Malformed variable assignment')
+            elif kind == 'quote':
+                inQuotes = not inQuotes
+            elif inQuotes:
+                ret.append(token.group(kind))
             else:
-                if c == '\\':
-                    escape = True
-                elif c == '$':
-                    if value[index] != '{':
-                        raise RuntimeError('Malformed variable assignment')
-                    index += 1
-                    i = value.find('}', index)
-                    if i == -1:
-                        raise RuntimeError('Malformed variable assignment')
-                    name = value[index:i]
-                    index = i + 1
-                    ret += self._values.get(name, "")
-                elif c == '"':
-                    inQuotes = not inQuotes
-                elif c in (' ', '#'):
-                    if inQuotes:
-                        ret += c
-                    else:
-                        index = len(value)
-                else:
-                    ret += c
-
-        return ret
+                break
+
+        return ''.join(ret)
 
     def get(self, name, default=None):
         return self._values.get(name, default)
@@ -147,4 +319,141 @@ class ConfigFile(base.Base):
             return int(value)
 
 
+class _Inotify(object):
+
+    _IN_NONBLOCK = os.O_NONBLOCK
+    _IN_CLOEXEC = 0o2000000
+    _IN_MASK = (
+        0x00000004 |    # IN_ATTRIB
+        0x00000008 |    # IN_CLOSE_WRITE
+        0x00000040 |    # IN_MOVED_FROM
+        0x00000080 |    # IN_MOVED_TO
+        0x00000100 |    # IN_CREATE
+        0x00000200      # IN_DELETE
+    )
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(
+            ctypes.util.find_library('c') or 'libc.so.6',
+            use_errno=True,
+        )
+        self._fd = self._libc.inotify_init1(
+            self._IN_NONBLOCK | self._IN_CLOEXEC
+        )
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1')
+
+    def fileno(self):
+        return self._fd
+
+    def add(self, path):
+        if self._libc.inotify_add_watch(
+            self._fd,
+            path.encode('utf-8') if not isinstance(path, bytes) else path,
+            self._IN_MASK,
+        ) < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch', path)
+
+    def drain(self):
+        while True:
+            try:
+                if not os.read(self._fd, 0x10000):
+                    break
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    break
+                raise
+
+    def close(self):
+        os.close(self._fd)
+
+
+class ConfigWatcher(base.Base, threading.Thread):
+    """Calls callback with changes of config, see ConfigFile.watch()"""
+
+    # wait for the rest of changes, editors write files in steps
+    SETTLE_TIME = 0.5
+
+    def __init__(self, config, callback, interval):
+        base.Base.__init__(self)
+        threading.Thread.__init__(self, name='ConfigWatcher')
+        self.daemon = True
+        self._config = config
+        self._callback = callback
+        self._interval = interval
+        self._stopping = threading.Event()
+        try:
+            self._inotify = _Inotify()
+        except (OSError, AttributeError) as e:
+            self.logger.debug(
+                'inotify is not available, checking every %s seconds: %s',
+                interval,
+                e,
+            )
+            self._inotify = None
+
+    def _addWatches(self):
+        # directories of files are watched too, to detect files replaced
+        # by rename or .d directories created
+        for file in self._config._files:
+            for path in (os.path.dirname(file) or '.', '%s.d' % file):
+                if os.path.isdir(path):
+                    try:
+                        self._inotify.add(path)
+                    except OSError as e:
+                        self.logger.debug('Cannot watch %s: %s', path, e)
+
+    def _wait(self):
+        """Returns whether config may have changed"""
+        if self._inotify is None:
+            self._stopping.wait(self._interval)
+            return self._config.changed()
+
+        while not self._stopping.is_set():
+            try:
+                readable = select.select(
+                    [self._inotify],
+                    [],
+                    [],
+                    self._interval,
+                )[0]
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                continue
+            if readable:
+                self._stopping.wait(self.SETTLE_TIME)
+                self._inotify.drain()
+                self._addWatches()
+                return True
+        return False
+
+    def run(self):
+        if self._inotify is not None:
+            self._addWatches()
+        try:
+            while not self._stopping.is_set():
+                try:
+                    if self._wait() and not self._stopping.is_set():
+                        changes = self._config.reload()
+                        if changes:
+                            self.logger.debug(
+                                'Config changed: %s',
+                                sorted(changes),
+                            )
+                            self._callback(changes)
+                except Exception:
+                    self.logger.error(
+                        _('Cannot reload configuration'),
+                        exc_info=True,
+                    )
+                    self._stopping.wait(self._interval)
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+
+    def stop(self):
+        self._stopping.set()
+
+
 # vim: expandtab tabstop=4 shiftwidth=4
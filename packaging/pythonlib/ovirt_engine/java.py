@@ -21,6 +21,7 @@ import subprocess
 
 from . import base
 from . import config
+from . import stampcache
 
 
 def _(m):
@@ -29,18 +30,67 @@ def _(m):
 
 class Java(base.Base):
 
-    def __init__(self, component=None):
+    # java-home result depends on these, alternatives of the java
+    # packages are updated by renaming links in /etc/alternatives
+    _JAVA_HOME_DEPENDENCIES = (
+        '/etc/alternatives',
+        '/usr/lib/jvm',
+        '/usr/lib/jvm/jre',
+    )
+
+    def __init__(self, component=None, cache=None):
+        """
+        If cache file is given, java home is kept there and reused while
+        java-home script and installed java packages are unchanged.
+        """
         super(Java, self).__init__()
         self._component = component if component else 'engine'
+        self._cache = stampcache.StampCache(cache) if cache else None
 
     def getJavaHome(self):
+        script = os.path.join(
+            config.ENGINE_USR,
+            'bin',
+            'java-home',
+        )
+        if self._cache is None:
+            return self._detectJavaHome(script)
+
+        key = 'java-home:%s:%s:%s' % (
+            self._component,
+            os.environ.get('OVIRT_ENGINE_JAVA_HOME', ''),
+            os.environ.get('OVIRT_ENGINE_JAVA_HOME_FORCE', ''),
+        )
+        dependencies = [
+            script,
+            '%s.local' % script,
+        ] + list(self._JAVA_HOME_DEPENDENCIES)
+        cached = self._cache.get(key, dependencies)
+        if cached is not None:
+            javaHome = cached['javaHome']
+            if stampcache.stamp(
+                os.path.join(javaHome, 'bin', 'java')
+            ) == cached['java']:
+                self.logger.debug('JAVA_HOME (cached): %s', javaHome)
+                return javaHome
+
+        javaHome = self._detectJavaHome(script)
+        self._cache.put(
+            key,
+            dependencies,
+            {
+                'javaHome': javaHome,
+                'java': stampcache.stamp(
+                    os.path.join(javaHome, 'bin', 'java')
+                ),
+            },
+        )
+        return javaHome
+
+    def _detectJavaHome(self, script):
         p = subprocess.Popen(
             args=(
-                os.path.join(
-                    config.ENGINE_USR,
-                    'bin',
-                    'java-home',
-                ),
+                script,
                 '--component=%s' % self._component,
             ),
             stdout=subprocess.PIPE,
@@ -15,42 +15,253 @@
 #
 
 
+import functools
 import gettext
+import multiprocessing
+import os
 import re
 
 from . import util
 
+_MEMINFO = '/proc/meminfo'
+_PROC_CGROUP = '/proc/self/cgroup'
+_CGROUP_ROOT = '/sys/fs/cgroup'
+_NUMA_NODES = '/sys/devices/system/node'
+_THP_ENABLED = '/sys/kernel/mm/transparent_hugepage/enabled'
+# cgroup v1 reports no limit as huge value rounded to pages
+_CGROUP_UNLIMITED = 1 << 60
+
+_RE_MEMINFO = re.compile(
+    flags=re.VERBOSE,
+    pattern=r"""
+        ^
+        (?P<name>\w+)
+        :
+        \s+
+        (?P<value>\d+)
+    """
+)
+
+_cache = {}
+
 
 def _(m):
     return gettext.dgettext(message=m, domain='ovirt-engine-setup')
 
 
+def _cached(f):
+    """Cache result of f for the lifetime of the process"""
+    @functools.wraps(f)
+    def wrapper(*args):
+        key = (f.__name__,) + args
+        if key not in _cache:
+            _cache[key] = f(*args)
+        return _cache[key]
+    return wrapper
+
+
 @util.export
-def get_total_mb():
+def clear_cache():
+    """Forget cached results, so current limits are probed again"""
+    _cache.clear()
 
-    _RE_MEMINFO_MEMTOTAL = re.compile(
-        flags=re.VERBOSE,
-        pattern=r"""
-            ^
-            MemTotal:
-            \s+
-            (?P<value>\d+)
-            \s+
-            (?P<unit>\w+)
-        """
-    )
-    with open('/proc/meminfo', 'r') as f:
-        content = f.read()
 
-    match = _RE_MEMINFO_MEMTOTAL.match(content)
-    if match is None:
+def _meminfo():
+    """Values of /proc/meminfo, sizes in kB"""
+    values = {}
+    with open(_MEMINFO, 'r') as f:
+        for line in f:
+            match = _RE_MEMINFO.match(line)
+            if match is not None:
+                values[match.group('name')] = int(match.group('value'))
+    if 'MemTotal' not in values:
         raise RuntimeError(_("Unable to parse /proc/meminfo"))
+    return values
 
-    mem = int(match.group('value'))
-    if match.group('unit') == "kB":
-        mem //= 1024
 
-    return mem
+@util.export
+@_cached
+def get_total_mb():
+    return _meminfo()['MemTotal'] // 1024
+
+
+@_cached
+def _cgroup_dirs(controller):
+    """
+    Directories of cgroup of current process for controller and of its
+    ancestors, nearest first. Empty list if controller is not available.
+
+    cgroup v1 hierarchy of controller is used if mounted, otherwise the
+    unified v2 hierarchy. Within containers cgroup of the process may
+    not be visible, in this case root of the hierarchy is used.
+    """
+    paths = {}
+    try:
+        with open(_PROC_CGROUP, 'r') as f:
+            for line in f:
+                hierarchy, controllers, path = line.rstrip('\n').split(':', 2)
+                if hierarchy == '0' and not controllers:
+                    paths[None] = path
+                for name in controllers.split(','):
+                    paths[name] = path
+    except (IOError, ValueError):
+        return []
+
+    if (
+        controller in paths and
+        os.path.isdir(os.path.join(_CGROUP_ROOT, controller))
+    ):
+        base = os.path.join(_CGROUP_ROOT, controller)
+        path = paths[controller]
+    elif (
+        None in paths and
+        os.path.exists(os.path.join(_CGROUP_ROOT, 'cgroup.controllers'))
+    ):
+        base = _CGROUP_ROOT
+        path = paths[None]
+    else:
+        return []
+
+    dirs = []
+    while True:
+        d = os.path.join(base, path.lstrip('/'))
+        if os.path.isdir(d):
+            dirs.append(d)
+        if path in ('', '/'):
+            break
+        path = os.path.dirname(path)
+    return dirs
+
+
+def _read(*path):
+    try:
+        with open(os.path.join(*path), 'r') as f:
+            return f.read().strip()
+    except IOError:
+        return None
+
+
+@util.export
+@_cached
+def get_cgroup_memory_limit_mb():
+    """Memory limit of cgroup of current process in MB, None if none"""
+    limits = []
+    for d in _cgroup_dirs('memory'):
+        for name in ('memory.max', 'memory.limit_in_bytes'):
+            value = _read(d, name)
+            if (
+                value is not None and
+                value.isdigit() and
+                int(value) < _CGROUP_UNLIMITED
+            ):
+                limits.append(int(value) // 1024 // 1024)
+    return min(limits) if limits else None
+
+
+@util.export
+@_cached
+def get_effective_mb():
+    """Memory available to current process in MB, by cgroup or total"""
+    total = get_total_mb()
+    limit = get_cgroup_memory_limit_mb()
+    if limit is not None and limit < total:
+        return limit
+    return total
+
+
+def _cgroup_memory_usage_mb():
+    for d in _cgroup_dirs('memory'):
+        for name in ('memory.current', 'memory.usage_in_bytes'):
+            value = _read(d, name)
+            if value is not None and value.isdigit():
+                return int(value) // 1024 // 1024
+    return None
+
+
+@util.export
+def get_available_mb():
+    """
+    Memory which can be allocated now without swapping in MB, by
+    MemAvailable and cgroup limit and usage. Not cached.
+    """
+    meminfo = _meminfo()
+    available = meminfo.get(
+        'MemAvailable',
+        meminfo.get('MemFree', 0) + meminfo.get('Cached', 0),
+    ) // 1024
+    limit = get_cgroup_memory_limit_mb()
+    usage = _cgroup_memory_usage_mb()
+    if limit is not None and usage is not None:
+        available = min(available, max(limit - usage, 0))
+    return available
+
+
+@util.export
+def get_hugepages():
+    """
+    Huge pages of the system, as dictionary:
+        total_mb - reserved huge pages, not usable by regular allocations.
+        free_mb - reserved huge pages not in use.
+        size_kb - size of huge page.
+        transparent - transparent huge pages mode, None if unknown.
+    Not cached.
+    """
+    meminfo = _meminfo()
+    size = meminfo.get('Hugepagesize', 0)
+    transparent = _read(_THP_ENABLED)
+    if transparent is not None:
+        match = re.search(r'\[(\w+)\]', transparent)
+        transparent = match.group(1) if match else None
+    return {
+        'total_mb': meminfo.get('HugePages_Total', 0) * size // 1024,
+        'free_mb': meminfo.get('HugePages_Free', 0) * size // 1024,
+        'size_kb': size,
+        'transparent': transparent,
+    }
+
+
+@util.export
+@_cached
+def get_cpu_limit():
+    """
+    Number of cpus current process may use, by affinity and cgroup cpu
+    quota. May be fraction.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = float(len(os.sched_getaffinity(0)))
+    else:
+        cpus = float(multiprocessing.cpu_count())
+
+    for d in _cgroup_dirs('cpu'):
+        value = _read(d, 'cpu.max')
+        if value is not None:
+            quota, period = (value.split() + ['100000'])[:2]
+        else:
+            quota = _read(d, 'cpu.cfs_quota_us')
+            period = _read(d, 'cpu.cfs_period_us')
+        try:
+            quota = int(quota)
+            period = int(period)
+        except (TypeError, ValueError):
+            # max or missing
+            continue
+        if quota > 0 and period > 0:
+            cpus = min(cpus, float(quota) / period)
+    return cpus
+
+
+@util.export
+@_cached
+def get_numa_nodes():
+    """Number of NUMA nodes with memory, 1 if not NUMA"""
+    try:
+        nodes = [
+            n for n in os.listdir(_NUMA_NODES)
+            if re.match(r'^node\d+$', n)
+        ]
+    except OSError:
+        return 1
+    return max(len(nodes), 1)
 
 
 @util.export
@@ -0,0 +1,336 @@
+#
+# Copyright (C) 2026 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""Service metrics in prometheus text exposition format."""
+
+
+import contextlib
+import os
+import stat
+import sys
+import threading
+import timeit
+
+from . import base
+from . import util
+
+if sys.version_info[0] < 3:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+    from SocketServer import UnixStreamServer
+else:
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+    from socketserver import UnixStreamServer
+
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+
+def _escape(value):
+    return str(value).replace(
+        '\\', '\\\\'
+    ).replace(
+        '\n', '\\n'
+    ).replace(
+        '"', '\\"'
+    )
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (k, _escape(v))
+        for k, v in labels
+    )
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(object):
+    """Metric with optional labels.
+
+    Values are expected to be updated from a single thread, rendering
+    from another thread works on a copy.
+    """
+
+    TYPE = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+    def _samples(self):
+        return sorted(self._values.copy().items())
+
+    def render(self):
+        lines = [
+            '# HELP %s %s' % (self.name, self.help),
+            '# TYPE %s %s' % (self.name, self.TYPE),
+        ]
+        for key, value in self._samples():
+            lines.append(
+                '%s%s %s' % (
+                    self.name,
+                    _format_labels(key),
+                    _format_value(value),
+                )
+            )
+        return lines
+
+
+@util.export
+class Counter(_Metric):
+    TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+@util.export
+class Gauge(_Metric):
+    TYPE = 'gauge'
+
+    def __init__(self, name, help, callback=None):
+        """
+        callback, if set, is called on render instead of using set values,
+        it returns dictionary of sorted label items tuple to value.
+        """
+        super(Gauge, self).__init__(name=name, help=help)
+        self._callback = callback
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def _samples(self):
+        if self._callback is not None:
+            return sorted(self._callback().items())
+        return super(Gauge, self)._samples()
+
+
+@util.export
+class Histogram(_Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name=name, help=help)
+        self._buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            # per bucket counts, sum
+            entry = self._values[key] = [[0] * len(self._buckets), 0.0]
+        for i, bound in enumerate(self._buckets):
+            if value <= bound:
+                entry[0][i] += 1
+                break
+        entry[1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        # util.monotonic() resolution on python2 is too low for durations
+        start = timeit.default_timer()
+        try:
+            yield
+        finally:
+            self.observe(
+                max(timeit.default_timer() - start, 0),
+                **labels
+            )
+
+    def render(self):
+        lines = [
+            '# HELP %s %s' % (self.name, self.help),
+            '# TYPE %s %s' % (self.name, self.TYPE),
+        ]
+        for key, (counts, total) in self._samples():
+            counts = list(counts)
+            cumulative = 0
+            for bound, count in zip(self._buckets, counts):
+                cumulative += count
+                lines.append(
+                    '%s_bucket%s %s' % (
+                        self.name,
+                        _format_labels(key + (('le', _format_value(bound)),)),
+                        cumulative,
+                    )
+                )
+            lines.append(
+                '%s_sum%s %s' % (
+                    self.name,
+                    _format_labels(key),
+                    _format_value(total),
+                )
+            )
+            lines.append(
+                '%s_count%s %s' % (
+                    self.name,
+                    _format_labels(key),
+                    cumulative,
+                )
+            )
+        return lines
+
+
+@util.export
+class Registry(object):
+    """Collection of metrics exposed together."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help):
+        return self._register(Counter(name=name, help=help))
+
+    def gauge(self, name, help, callback=None):
+        return self._register(
+            Gauge(name=name, help=help, callback=callback)
+        )
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self._register(
+            Histogram(name=name, help=help, buckets=buckets)
+        )
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+@util.export
+class MetricsServer(base.Base):
+    """
+    HTTP server exposing registry at /metrics in a background thread
+
+    address is either (host, port) tuple or path of unix socket, which
+    can be queried by curl --unix-socket path http://localhost/metrics
+
+    Usage:
+        with MetricsServer(registry, ('127.0.0.1', 9100)):
+            pass
+    """
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, registry, address):
+        super(MetricsServer, self).__init__()
+        self._registry = registry
+        self._address = address
+        self._server = None
+        self._thread = None
+        # process serving, forked children inherit only the socket
+        self._pid = None
+
+    def _handler(self):
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                try:
+                    content = server._registry.render().encode('utf-8')
+                except Exception:
+                    server.logger.debug('Cannot render metrics', exc_info=True)
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', server.CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                server.logger.debug(format, *args)
+
+        return _Handler
+
+    def _unlink(self):
+        # remove stale socket of previous instance
+        try:
+            if stat.S_ISSOCK(os.stat(self._address).st_mode):
+                os.unlink(self._address)
+        except OSError:
+            pass
+
+    def start(self):
+        if isinstance(self._address, str):
+            self._unlink()
+            self._server = UnixStreamServer(self._address, self._handler())
+        else:
+            self._server = HTTPServer(self._address, self._handler())
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            name='metrics',
+        )
+        self._thread.daemon = True
+        self._thread.start()
+        self._pid = os.getpid()
+        self.logger.debug('Serving metrics on %s', self._address)
+
+    def stop(self):
+        if self._server is not None:
+            if self._pid == os.getpid():
+                self._server.shutdown()
+                self._server.server_close()
+                self._thread.join()
+                if isinstance(self._address, str):
+                    self._unlink()
+            else:
+                # forked child, thread and socket file belong to parent
+                self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
@@ -28,6 +28,7 @@ import socket
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 
 import daemon
@@ -107,6 +108,22 @@ def setupLogger():
         logging.debug('Cannot open syslog logger', exc_info=True)
 
 
+@util.export
+def resetLoggingLocks():
+    """
+    Recreates locks of logging module, to be called in forked child.
+
+    A lock held by another thread of the parent at fork, for example
+    while it logs, stays locked in the child, so its first log call
+    would deadlock. Python 3.7 and newer does the same at fork.
+    """
+    logging._lock = threading.RLock()
+    for ref in logging._handlerList:
+        handler = ref()
+        if handler is not None:
+            handler.createLock()
+
+
 @util.export
 class TempDir(base.Base):
     """
@@ -132,7 +149,11 @@ class TempDir(base.Base):
         if self._dir is None:
             self._dir = tempfile.mkdtemp()
 
-    def create(self):
+    def create(self, clear=True):
+        """Create empty directory, if not clear existing one is kept"""
+        if not clear and os.path.isdir(self._dir):
+            self.logger.debug("reusing directory '%s'", self._dir)
+            return
         self._clear()
         os.makedirs(self._dir, 0o700)
 
@@ -201,6 +222,87 @@ class PidFile(base.Base):
                     self.logger.debug('exception', exc_info=True)
 
 
+class _Readiness(base.Base, threading.Thread):
+    """
+    Probes readiness of daemon, with backoff until it is ready, then
+    every half of watchdog interval, if watchdog is enabled.
+
+    READY=1 is sent once probe succeeded, WATCHDOG=1 while it succeeds,
+    STATUS= whenever state changes.
+    """
+
+    INITIAL_INTERVAL = 0.5
+    MAX_INTERVAL = 10
+
+    def __init__(self, probe, notify, watchdog=None):
+        base.Base.__init__(self)
+        threading.Thread.__init__(self, name='Readiness')
+        self.daemon = True
+        self._probe = probe
+        self._notify = notify
+        self._watchdog = watchdog
+        self._stopping = threading.Event()
+
+    def _check(self):
+        try:
+            return bool(self._probe())
+        except Exception as e:
+            self.logger.debug('Readiness probe failed: %s', e)
+            return False
+
+    def _waitReady(self):
+        started = util.monotonic()
+        interval = self.INITIAL_INTERVAL
+        while not self._stopping.is_set():
+            if self._check():
+                elapsed = util.monotonic() - started
+                self.logger.info(
+                    _('Service is ready after {seconds:.1f} seconds').format(
+                        seconds=elapsed,
+                    )
+                )
+                self._notify('READY=1', 'STATUS=Serving')
+                return True
+            states = [
+                'STATUS=Starting, waiting %d seconds' % (
+                    util.monotonic() - started
+                ),
+            ]
+            if self._watchdog is not None:
+                # startup is limited by TimeoutStartSec
+                states.append('WATCHDOG=1')
+            self._notify(*states)
+            self._stopping.wait(
+                min(interval, self._watchdog / 2.0)
+                if self._watchdog is not None
+                else interval
+            )
+            interval = min(interval * 2, self.MAX_INTERVAL)
+        return False
+
+    def run(self):
+        try:
+            if not self._waitReady() or self._watchdog is None:
+                return
+            serving = True
+            while not self._stopping.wait(self._watchdog / 2.0):
+                if self._check():
+                    if not serving:
+                        self.logger.info(_('Service is serving again'))
+                        self._notify('STATUS=Serving')
+                    self._notify('WATCHDOG=1')
+                    serving = True
+                elif serving:
+                    self.logger.warning(_('Service is not serving'))
+                    self._notify('STATUS=Not serving')
+                    serving = False
+        except Exception:
+            self.logger.error(_('Readiness probing failed'), exc_info=True)
+
+    def stop(self):
+        self._stopping.set()
+
+
 @util.export
 class Daemon(base.Base):
 
@@ -402,24 +504,49 @@ class Daemon(base.Base):
             soft, hard = resource.getrlimit(resource.RLIMIT_NPROC)
             resource.setrlimit(resource.RLIMIT_NPROC, (hard, hard))
 
-    def _sd_notify_ready(self):
+    def _sd_notify(self, *states):
         """
         NOTICE: systemd-notify is not working!
         SEE: rhbz#820448
         """
+        e = os.getenv('NOTIFY_SOCKET')
+        if not e:
+            return
         with contextlib.closing(
             socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
         ) as s:
-            e = os.getenv('NOTIFY_SOCKET')
             if e.startswith('@'):
                 # abstract namespace socket
                 e = '\0%s' % e[1:]
             s.connect(e)
-            s.sendall('READY=1')
+            s.sendall('\n'.join(states).encode('utf-8'))
 
     def _daemonReady(self):
         if self._options.systemd == 'notify':
-            self._sd_notify_ready()
+            self._sd_notify('READY=1')
+
+    def _watchdogInterval(self):
+        """Seconds of systemd watchdog of current process, None if none"""
+        usec = os.getenv('WATCHDOG_USEC')
+        pid = os.getenv('WATCHDOG_PID')
+        if not usec or (pid and int(pid) != os.getpid()):
+            return None
+        return int(usec) / 1000000.0
+
+    def _startReadiness(self):
+        if self._options.systemd != 'notify':
+            return None
+        probed = self._overridden('daemonReadiness')
+        watchdog = self._watchdogInterval()
+        if not probed and watchdog is None:
+            return None
+        readiness = _Readiness(
+            probe=self.daemonReadiness,
+            notify=self._sd_notify,
+            watchdog=watchdog,
+        )
+        readiness.start()
+        return readiness
 
     def _daemon(self):
 
@@ -430,7 +557,9 @@ class Daemon(base.Base):
 
         self.daemonSetup()
 
-        self._daemonReady()
+        # otherwise when probe succeeds
+        if not self._overridden('daemonReadiness'):
+            self._daemonReady()
 
         stdout, stderr = (sys.stdout, sys.stderr)
         if self._options.redirectOutput:
@@ -439,6 +568,16 @@ class Daemon(base.Base):
         def _myterm(signum, frame):
             raise self.TerminateException()
 
+        def _myhup(signum, frame):
+            self.logger.info(_('Reloading configuration'))
+            try:
+                self.daemonReload()
+            except Exception:
+                self.logger.error(
+                    _('Cannot reload configuration'),
+                    exc_info=True,
+                )
+
         #
         # preserve log handler.
         # bit undocumented.
@@ -453,7 +592,11 @@ class Daemon(base.Base):
             signal_map={
                 signal.SIGTERM: _myterm,
                 signal.SIGINT: _myterm,
-                signal.SIGHUP: None,
+                # ignored unless supported, as before
+                signal.SIGHUP: (
+                    _myhup if self._reloadable()
+                    else None
+                ),
             },
             stdout=stdout,
             stderr=stderr,
@@ -464,13 +607,18 @@ class Daemon(base.Base):
 
             self._setLimits()
 
+            readiness = None
             try:
                 with PidFile(self._options.pidfile):
+                    readiness = self._startReadiness()
                     self.daemonContext()
                 self.logger.debug('Returned normally %s', os.getpid())
             except self.TerminateException:
                 self.logger.debug('Terminated normally %s', os.getpid())
             finally:
+                if readiness is not None:
+                    readiness.stop()
+                    readiness.join()
                 self.daemonCleanup()
 
         self.logger.debug('daemon return')
@@ -581,5 +729,26 @@ class Daemon(base.Base):
         """Cleanup"""
         pass
 
+    def _overridden(self, name):
+        return getattr(self, name).__func__ is not Daemon.__dict__[name]
+
+    def _reloadable(self):
+        return self._overridden('daemonReload')
+
+    def daemonReload(self):
+        """Re-apply configuration
+        Called on SIGHUP within daemon context, only settings which
+        are safe to change while running should be applied
+        """
+        pass
+
+    def daemonReadiness(self):
+        """Return True if daemon is serving
+        If overridden, called periodically from a thread within daemon
+        context, systemd is notified that daemon is ready only after it
+        returned True, and watchdog is notified only while it does
+        """
+        return True
+
 
 # vim: expandtab tabstop=4 shiftwidth=4
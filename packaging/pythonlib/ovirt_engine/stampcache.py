@@ -0,0 +1,113 @@
+# Copyright (C) 2026 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Cache of values valid while files are unchanged."""
+
+
+import json
+import os
+import time
+
+from . import base
+
+
+def stamp(path):
+    """Modification time, size and inode of path, None if missing"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime, st.st_size, st.st_ino]
+
+
+class StampCache(base.Base):
+    """
+    Values stored in JSON file, each with stamps of files it depends on.
+
+    A value is returned by get() only while none of its files was
+    modified, replaced or removed since put(), so package updates
+    invalidate it. Values of files modified recently are not stored,
+    as a modification within timestamp granularity may go unnoticed.
+    Failures to read or write the cache are ignored.
+
+    Usage:
+        cache = StampCache(path)
+        value = cache.get('key', paths)
+        if value is None:
+            value = compute()
+            cache.put('key', paths, value)
+    """
+
+    _VERSION = 1
+    _RACY_SECONDS = 2
+
+    def __init__(self, path):
+        super(StampCache, self).__init__()
+        self._path = path
+
+    def _load(self):
+        try:
+            with open(self._path, 'r') as f:
+                content = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        if content.get('version') != self._VERSION:
+            return {}
+        return content.get('entries', {})
+
+    def get(self, key, paths):
+        entry = self._load().get(key)
+        if entry is None:
+            return None
+        stamps = entry['stamps']
+        if sorted(p for p, s in stamps) != sorted(set(paths)):
+            return None
+        for path, s in stamps:
+            if stamp(path) != s:
+                return None
+        self.logger.debug("'%s' loaded from cache '%s'", key, self._path)
+        return entry['value']
+
+    def put(self, key, paths, value):
+        stamps = [[path, stamp(path)] for path in sorted(set(paths))]
+        racy = time.time() - self._RACY_SECONDS
+        if any(s is not None and s[0] > racy for p, s in stamps):
+            return
+
+        entries = self._load()
+        entries[key] = {
+            'stamps': stamps,
+            'value': value,
+        }
+        tmp = '%s.%s.tmp' % (self._path, os.getpid())
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(
+                    {
+                        'version': self._VERSION,
+                        'entries': entries,
+                    },
+                    f,
+                )
+            os.rename(tmp, self._path)
+        except (IOError, OSError, ValueError) as e:
+            self.logger.debug("Cannot write cache '%s': %s", self._path, e)
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
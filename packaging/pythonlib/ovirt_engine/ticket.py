@@ -1,95 +1,408 @@
 import base64
+import collections
 import datetime
+import hashlib
 import json
+import os
 
-from M2Crypto import EVP
-from M2Crypto import X509
-from M2Crypto import Rand
+# digests accepted for ticket signatures
+DIGESTS = ('sha1', 'sha256', 'sha384', 'sha512')
+
+
+def _checkDigest(digest):
+    if digest not in DIGESTS:
+        raise ValueError('Unsupported digest %s' % digest)
+    return digest
+
+
+class M2CryptoBackend(object):
+    """Crypto operations implemented by M2Crypto"""
+
+    name = 'm2crypto'
+
+    def __init__(self):
+        from M2Crypto import EVP
+        from M2Crypto import X509
+        from M2Crypto import Rand
+        self._EVP = EVP
+        self._X509 = X509
+        self._Rand = Rand
+
+    def load_certificate(self, pem):
+        return self._X509.load_cert_string(pem)
+
+    def load_certificate_file(self, path):
+        return self._X509.load_cert(path)
+
+    def load_private_key_file(self, path):
+        return self._EVP.load_key(path)
+
+    def certificate_pem(self, cert):
+        return cert.as_pem()
+
+    def random_bytes(self, size):
+        return self._Rand.rand_bytes(size)
+
+    def public_key(self, cert):
+        return cert.get_pubkey()
+
+    def sign(self, key, digest, data):
+        key.reset_context(md=_checkDigest(digest))
+        key.sign_init()
+        key.sign_update(data)
+        return key.sign_final()
+
+    def verify(self, key, digest, data, signature):
+        key.reset_context(md=_checkDigest(digest))
+        key.verify_init()
+        key.verify_update(data)
+        return key.verify_final(signature) == 1
+
+    def issued_by(self, ca, cert):
+        return cert.verify(ca.get_pubkey()) == 1
+
+    def not_before(self, cert):
+        return cert.get_not_before().get_datetime().replace(tzinfo=None)
+
+    def not_after(self, cert):
+        return cert.get_not_after().get_datetime().replace(tzinfo=None)
+
+    def extended_key_usage(self, cert):
+        try:
+            value = cert.get_ext('extendedKeyUsage').get_value()
+        except LookupError:
+            return []
+        return [u.strip() for u in value.split(',')]
+
+
+class CryptographyBackend(object):
+    """
+    Crypto operations implemented by cryptography.
+
+    Signature and verification are single calls of OpenSSL EVP, without
+    per ticket context setup. Both RSA and ECDSA keys are supported.
+    Requires cryptography 1.5 or newer, used only if selected by name
+    or if M2Crypto is not installed.
+    """
+
+    name = 'cryptography'
+
+    def __init__(self):
+        from cryptography import x509
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.backends import default_backend
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+        from cryptography.hazmat.primitives.asymmetric import padding
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        self._x509 = x509
+        self._InvalidSignature = InvalidSignature
+        self._backend = default_backend()
+        self._hashes = hashes
+        self._serialization = serialization
+        self._ec = ec
+        self._padding = padding
+        self._rsa = rsa
+
+    def _hash(self, digest):
+        return getattr(self._hashes, _checkDigest(digest).upper())()
+
+    def _signature_args(self, key, algorithm):
+        if isinstance(
+            key,
+            (self._rsa.RSAPrivateKey, self._rsa.RSAPublicKey),
+        ):
+            return (self._padding.PKCS1v15(), algorithm)
+        return (self._ec.ECDSA(algorithm),)
+
+    def load_certificate(self, pem):
+        return self._x509.load_pem_x509_certificate(pem, self._backend)
+
+    def load_certificate_file(self, path):
+        with open(path, 'rb') as f:
+            return self.load_certificate(f.read())
+
+    def load_private_key_file(self, path):
+        with open(path, 'rb') as f:
+            return self._serialization.load_pem_private_key(
+                f.read(),
+                password=None,
+                backend=self._backend,
+            )
+
+    def certificate_pem(self, cert):
+        return cert.public_bytes(self._serialization.Encoding.PEM)
+
+    def random_bytes(self, size):
+        return os.urandom(size)
+
+    def public_key(self, cert):
+        return cert.public_key()
+
+    def sign(self, key, digest, data):
+        return key.sign(
+            data,
+            *self._signature_args(key, self._hash(digest))
+        )
+
+    def _verify(self, key, signature, data, algorithm):
+        try:
+            key.verify(
+                signature,
+                data,
+                *self._signature_args(key, algorithm)
+            )
+            return True
+        except self._InvalidSignature:
+            return False
+
+    def verify(self, key, digest, data, signature):
+        return self._verify(key, signature, data, self._hash(digest))
+
+    def issued_by(self, ca, cert):
+        return self._verify(
+            ca.public_key(),
+            cert.signature,
+            cert.tbs_certificate_bytes,
+            cert.signature_hash_algorithm,
+        )
+
+    def not_before(self, cert):
+        # naive properties are deprecated since cryptography 42
+        if hasattr(cert, 'not_valid_before_utc'):
+            return cert.not_valid_before_utc.replace(tzinfo=None)
+        return cert.not_valid_before
+
+    def not_after(self, cert):
+        if hasattr(cert, 'not_valid_after_utc'):
+            return cert.not_valid_after_utc.replace(tzinfo=None)
+        return cert.not_valid_after
+
+    def extended_key_usage(self, cert):
+        try:
+            extension = cert.extensions.get_extension_for_oid(
+                self._x509.oid.ExtensionOID.EXTENDED_KEY_USAGE
+            )
+        except self._x509.ExtensionNotFound:
+            return []
+        return [oid.dotted_string for oid in extension.value]
+
+
+# preferred first, M2Crypto is the default as required by the package
+BACKENDS = (
+    M2CryptoBackend,
+    CryptographyBackend,
+)
+_backends = {}
+
+
+def get_backend(name=None):
+    """Returns crypto backend by name, first available if name is None"""
+    for backend in BACKENDS:
+        if name in (None, backend.name):
+            if backend.name not in _backends:
+                try:
+                    _backends[backend.name] = backend()
+                except ImportError:
+                    if name is not None:
+                        raise
+                    continue
+            return _backends[backend.name]
+    raise RuntimeError(
+        'Crypto backend %s is not available' % (name or '')
+    )
+
+
+def _formatDate(d):
+    return d.strftime("%Y%m%d%H%M%S")
+
+
+def _parseDate(d):
+    # equivalent of strptime(d, '%Y%m%d%H%M%S'), which is slow
+    if len(d) != 14 or not d.isdigit():
+        raise ValueError('Invalid date %s' % d)
+    return datetime.datetime(
+        int(d[0:4]),
+        int(d[4:6]),
+        int(d[6:8]),
+        int(d[8:10]),
+        int(d[10:12]),
+        int(d[12:14]),
+    )
 
 
 class TicketEncoder():
 
-    @staticmethod
-    def _formatDate(d):
-        return d.strftime("%Y%m%d%H%M%S")
+    # fields are signed as single buffer of their values in this order
+    _SIGNED_FIELDS = ('salt', 'digest', 'validFrom', 'validTo', 'data')
+    _SALT_SIZE = 8
 
-    def __init__(self, cert, key, lifetime=5):
+    _formatDate = staticmethod(_formatDate)
+
+    def __init__(self, cert, key, lifetime=5, backend=None, digest='sha1'):
         self._lifetime = lifetime
-        self._x509 = X509.load_cert(cert)
-        self._pkey = EVP.load_key(key)
+        self._digest = digest
+        self._backend = get_backend(backend)
+        x509 = self._backend.load_certificate_file(cert)
+        self._pkey = self._backend.load_private_key_file(key)
+        # certificate is the same for all tickets, serialize it once
+        self._certificate = json.dumps(
+            self._backend.certificate_pem(x509).decode('utf8')
+        )
+        self._signedFields = ','.join(self._SIGNED_FIELDS)
 
-    def encode(self, data):
-        d = {
-            'salt': base64.b64encode(Rand.rand_bytes(8)),
-            'digest': 'sha1',
-            'validFrom': self._formatDate(datetime.datetime.utcnow()),
-            'validTo': self._formatDate(
-                datetime.datetime.utcnow() + datetime.timedelta(
-                    seconds=self._lifetime
-                )
+    def _validity(self):
+        now = datetime.datetime.utcnow()
+        return (
+            self._formatDate(now),
+            self._formatDate(
+                now + datetime.timedelta(seconds=self._lifetime)
             ),
-            'data': data
-        }
+        )
+
+    def _encode(self, salt, validFrom, validTo, data):
+        values = (salt, self._digest, validFrom, validTo, data)
+        signed = ''.join(values)
+        if not isinstance(signed, bytes):
+            signed = signed.encode('utf8')
+
+        d = dict(zip(self._SIGNED_FIELDS, values))
+        d['signedFields'] = self._signedFields
+        d['signature'] = base64.b64encode(
+            self._backend.sign(self._pkey, self._digest, signed)
+        )
 
-        self._pkey.reset_context(md=d['digest'])
-        self._pkey.sign_init()
-        fields = []
-        for k, v in d.items():
-            fields.append(k)
-            self._pkey.sign_update(v)
+        return base64.b64encode(
+            '%s, "certificate": %s}' % (
+                json.dumps(d)[:-1],
+                self._certificate,
+            )
+        )
+
+    def encode(self, data):
+        validFrom, validTo = self._validity()
+        return self._encode(
+            base64.b64encode(self._backend.random_bytes(self._SALT_SIZE)),
+            validFrom,
+            validTo,
+            data,
+        )
+
+    def encode_many(self, datas):
+        """Encodes list of payloads, returns list of tickets
+
+        Tickets of batch share validity period, salts are generated by
+        single call.
+        """
+        validFrom, validTo = self._validity()
+        salts = self._backend.random_bytes(self._SALT_SIZE * len(datas))
+        return [
+            self._encode(
+                base64.b64encode(
+                    salts[i * self._SALT_SIZE:(i + 1) * self._SALT_SIZE]
+                ),
+                validFrom,
+                validTo,
+                data,
+            )
+            for i, data in enumerate(datas)
+        ]
+
+
+class TicketCache(object):
+    """
+    Bounded LRU cache of verified tickets.
+
+    Entries are keyed by ticket digest and hold decoded data until
+    the ticket expires, so repeated decode of the same ticket does not
+    require signature verification.
+    """
 
-        d['signedFields'] = ','.join(fields)
-        d['signature'] = base64.b64encode(self._pkey.sign_final())
-        d['certificate'] = self._x509.as_pem()
+    def __init__(self, size):
+        self._size = size
+        self._entries = collections.OrderedDict()
 
-        return base64.b64encode(json.dumps(d))
+    @staticmethod
+    def digest(ticket):
+        if not isinstance(ticket, bytes):
+            ticket = ticket.encode('utf8')
+        return hashlib.sha256(ticket).hexdigest()
+
+    def get(self, digest, now):
+        entry = self._entries.pop(digest, None)
+        if entry is not None:
+            validTo, data = entry
+            if now <= validTo:
+                # re-insert as most recently used
+                self._entries[digest] = entry
+                return data
+        return None
+
+    def put(self, digest, validTo, data):
+        self._entries.pop(digest, None)
+        self._entries[digest] = (validTo, data)
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drops all entries, tickets are verified again"""
+        self._entries = collections.OrderedDict()
 
 
 class TicketDecoder():
 
     _peer = None
+    _peerKey = None
     _ca = None
+    _cache = None
 
-    @staticmethod
-    def _parseDate(d):
-        return datetime.datetime.strptime(d, '%Y%m%d%H%M%S')
+    _parseDate = staticmethod(_parseDate)
 
-    @staticmethod
-    def _verifyCertificate(ca, x509):
-        if x509.verify(ca.get_pubkey()) == 0:
+    def _verifyCertificate(self, x509):
+        if not self._backend.issued_by(self._ca, x509):
             raise ValueError('Untrusted certificate')
 
         if not (
-            x509.get_not_before().get_datetime().replace(tzinfo=None) <=
+            self._backend.not_before(x509) <=
             datetime.datetime.utcnow() <=
-            x509.get_not_after().get_datetime().replace(tzinfo=None)
+            self._backend.not_after(x509)
         ):
             raise ValueError('Certificate expired')
 
-    def __init__(self, ca, eku, peer=None):
+    def __init__(self, ca, eku, peer=None, cache=None, backend=None):
         self._eku = eku
+        self._backend = get_backend(backend)
         if peer is not None:
-            self._peer = X509.load_cert_string(peer)
+            self._peer = self._backend.load_certificate(peer)
+            self._peerKey = self._backend.public_key(self._peer)
         if ca is not None:
-            self._ca = X509.load_cert(ca)
+            self._ca = self._backend.load_certificate_file(ca)
+        self._cache = cache
 
     def decode(self, ticket):
+        if self._cache is not None:
+            digest = self._cache.digest(ticket)
+            data = self._cache.get(digest, datetime.datetime.utcnow())
+            if data is not None:
+                return data
+
         decoded = json.loads(base64.b64decode(ticket))
 
         if self._peer is not None:
             x509 = self._peer
+            pkey = self._peerKey
         else:
-            x509 = X509.load_cert_string(
+            x509 = self._backend.load_certificate(
                 decoded['certificate'].encode('utf8')
             )
+            pkey = self._backend.public_key(x509)
 
         if self._ca is not None:
-            self._verifyCertificate(self._ca, x509)
+            self._verifyCertificate(x509)
 
         if self._eku is not None:
-            if self._eku not in x509.get_ext(
-                'extendedKeyUsage'
-            ).get_value().split(','):
+            if self._eku not in self._backend.extended_key_usage(x509):
                 raise ValueError('Certificate is not authorized for action')
 
         signedFields = [s.strip() for s in decoded['signedFields'].split(',')]
@@ -99,23 +412,27 @@ class TicketDecoder():
         ) == 0:
             raise ValueError('Invalid ticket')
 
-        pkey = x509.get_pubkey()
-        pkey.reset_context(md=decoded['digest'])
-        pkey.verify_init()
-        for field in signedFields:
-            pkey.verify_update(decoded[field].encode('utf8'))
-        if pkey.verify_final(
-            base64.b64decode(decoded['signature'])
-        ) != 1:
+        if not self._backend.verify(
+            pkey,
+            decoded['digest'],
+            b''.join(decoded[field].encode('utf8') for field in signedFields),
+            base64.b64decode(decoded['signature']),
+        ):
             raise ValueError('Invalid ticket signature')
 
+        validTo = self._parseDate(decoded['validTo'])
         if not (
             self._parseDate(decoded['validFrom']) <=
             datetime.datetime.utcnow() <=
-            self._parseDate(decoded['validTo'])
+            validTo
         ):
             raise ValueError('Ticket life time expired')
 
+        if self._cache is not None:
+            if self._ca is not None:
+                validTo = min(validTo, self._backend.not_after(x509))
+            self._cache.put(digest, validTo, decoded['data'])
+
         return decoded['data']
 
 
@@ -0,0 +1,134 @@
+# Copyright (C) 2026 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Timing of startup phases."""
+
+
+import contextlib
+import json
+import os
+import time
+
+from . import base
+from . import util
+
+
+def processAge():
+    """Seconds since the current process was started, None if unknown"""
+    try:
+        with open('/proc/self/stat') as f:
+            # fields following command, which may contain spaces
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - float(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+
+
+class PhaseTimer(base.Base):
+    """
+    Measures duration of named phases.
+
+    Usage:
+        timer = PhaseTimer()
+        with timer.phase('config'):
+            ...
+        timer.log()
+        timer.write(path)
+
+    Time the process spent before the timer was created, interpreter
+    startup and imports, is reported as phase 'process' and included in
+    total.
+    """
+
+    def __init__(self):
+        super(PhaseTimer, self).__init__()
+        self._started = util.monotonic()
+        self._startedTime = time.time()
+        self._phases = []
+        self._processAge = max(processAge() or 0, 0)
+        if self._processAge:
+            self._phases.append({
+                'name': 'process',
+                'seconds': round(self._processAge, 3),
+                'status': 'ok',
+            })
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = util.monotonic()
+        status = 'failed'
+        try:
+            yield
+            status = 'ok'
+        finally:
+            duration = util.monotonic() - start
+            self._phases.append({
+                'name': name,
+                'seconds': round(duration, 3),
+                'status': status,
+            })
+            self.logger.debug(
+                'Phase %s %s in %.3f seconds',
+                name,
+                status,
+                duration,
+            )
+
+    def report(self):
+        return {
+            'pid': os.getpid(),
+            'started': time.strftime(
+                '%Y-%m-%dT%H:%M:%S%z',
+                time.localtime(self._startedTime),
+            ),
+            'total': round(
+                self._processAge + util.monotonic() - self._started,
+                3,
+            ),
+            'phases': self._phases,
+        }
+
+    def log(self):
+        report = self.report()
+        self.logger.info(
+            'Startup phases (%.3f seconds): %s',
+            report['total'],
+            ', '.join(
+                '%s %.3f%s' % (
+                    p['name'],
+                    p['seconds'],
+                    '' if p['status'] == 'ok' else ' (%s)' % p['status'],
+                )
+                for p in report['phases']
+            ),
+        )
+
+    def write(self, path):
+        tmp = '%s.tmp' % path
+        with open(tmp, 'w') as f:
+            json.dump(
+                self.report(),
+                f,
+                indent=4,
+                separators=(',', ': '),
+                sort_keys=True,
+            )
+            f.write('\n')
+        os.rename(tmp, path)
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
@@ -18,7 +18,9 @@
 """Utilities and tools."""
 
 
+import os
 import sys
+import time
 
 __all__ = ['export']
 
@@ -59,4 +61,17 @@ def processTemplate(template, subst={}):
     return content
 
 
+@export
+def monotonic():
+    """Return seconds from arbitrary point, not affected by clock changes.
+
+    time.monotonic is not available in python2, elapsed real time of
+    os.times() is used instead (clock ticks since boot on Linux).
+
+    """
+    if hasattr(time, 'monotonic'):
+        return time.monotonic()
+    return os.times()[4]
+
+
 # vim: expandtab tabstop=4 shiftwidth=4
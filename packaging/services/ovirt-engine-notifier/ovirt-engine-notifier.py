@@ -26,6 +26,7 @@ import config
 
 from ovirt_engine import configfile
 from ovirt_engine import java
+from ovirt_engine import mem
 from ovirt_engine import service
 
 
@@ -113,13 +114,19 @@ class Daemon(service.Daemon):
                 self._defaults,
                 config.ENGINE_NOTIFIER_VARS,
             ),
+            cache=os.path.join(config.ENGINE_CACHE, 'notifier.conf.json'),
         )
 
         #
         # the earliest so we can abort early.
         #
         self._executable = os.path.join(
-            java.Java().getJavaHome(),
+            java.Java(
+                cache=os.path.join(
+                    config.ENGINE_CACHE,
+                    'notifier.detect.json',
+                ),
+            ).getJavaHome(),
             'bin',
             'java',
         )
@@ -148,8 +155,22 @@ class Daemon(service.Daemon):
             self._engineArgs.append(notifierProperty)
 
         # Add extra jvm arguments provided in the configuration:
-        for arg in shlex.split(self._config.get('NOTIFIER_JVM_ARGS')):
-            self._engineArgs.append(arg)
+        jvmArgs = shlex.split(self._config.get('NOTIFIER_JVM_ARGS'))
+        self._engineArgs.extend(jvmArgs)
+
+        # Default heap is derived from memory of host, older java
+        # virtual machines ignore cgroup limit of the service.
+        limit = mem.get_cgroup_memory_limit_mb()
+        if (
+            limit is not None and
+            limit < mem.get_total_mb() and
+            not any(
+                arg.startswith(('-Xmx', '-XX:MaxRAM'))
+                for arg in jvmArgs
+            )
+        ):
+            self.logger.debug('cgroup memory limit %s MB', limit)
+            self._engineArgs.append('-XX:MaxRAM=%dm' % limit)
 
         debugAddress = self._config.get('NOTIFIER_DEBUG_ADDRESS')
         if debugAddress:
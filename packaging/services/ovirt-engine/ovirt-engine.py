@@ -16,9 +16,13 @@
 
 
 import gettext
+import hashlib
+import json
 import os
 import re
 import shlex
+import shutil
+import ssl
 import subprocess
 import sys
 
@@ -31,6 +35,13 @@ from ovirt_engine import configfile
 from ovirt_engine import java
 from ovirt_engine import mem
 from ovirt_engine import service
+from ovirt_engine import stampcache
+from ovirt_engine import timing
+
+if sys.version_info[0] < 3:
+    from urllib2 import urlopen
+else:
+    from urllib.request import urlopen
 
 
 def _(m):
@@ -53,12 +64,42 @@ class Daemon(service.Daemon):
         """,
     )
 
+    _JAVA_VERSION_REGEX = re.compile(
+        flags=re.VERBOSE,
+        pattern=r"""
+            \s
+            version
+            \s
+            "
+            (?P<major>\d+)
+            (\.(?P<minor>\d+))?
+        """,
+    )
+
+    _GC_ARGS = {
+        'G1': ['-XX:+UseG1GC'],
+        'Parallel': ['-XX:+UseParallelGC'],
+        'Serial': ['-XX:+UseSerialGC'],
+    }
+
+    # larger heap disables compressed object pointers
+    _HEAP_COMPRESSED_OOPS_MB = 31 * 1024
+
+    _READINESS_TIMEOUT = 10
+
     def __init__(self):
         super(Daemon, self).__init__()
         self._tempDir = None
         self._jbossRuntime = None
         self._jbossVersion = None
+        self._detectCache = None
+        self._incremental = False
+        self._appCdsClassList = None
+        self._readinessUrl = None
+        self._fingerprints = {}
+        self._newFingerprints = {}
         self._jbossConfigFile = None
+        self._timer = timing.PhaseTimer()
         self._defaults = os.path.abspath(
             os.path.join(
                 os.path.dirname(sys.argv[0]),
@@ -66,16 +107,70 @@ class Daemon(service.Daemon):
             )
         )
 
+    def _fingerprintsFile(self):
+        return os.path.join(
+            self._jbossRuntime.directory,
+            'fingerprints.json',
+        )
+
+    def _loadFingerprints(self):
+        try:
+            with open(self._fingerprintsFile(), 'r') as f:
+                self._fingerprints = json.load(f)
+        except (IOError, OSError, ValueError):
+            self._fingerprints = {}
+
+    def _saveFingerprints(self):
+        tmp = '%s.tmp' % self._fingerprintsFile()
+        with open(tmp, 'w') as f:
+            json.dump(self._newFingerprints, f)
+        os.rename(tmp, self._fingerprintsFile())
+
+    def _fingerprint(self, *items):
+        return hashlib.sha256(
+            json.dumps(items, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+    def _upToDate(self, name, fingerprint, path=None):
+        """
+        Whether name was produced with same fingerprint by previous
+        start, and its file path was not modified since.
+        """
+        entry = [
+            fingerprint,
+            stampcache.stamp(path) if path else None,
+        ]
+        self._newFingerprints[name] = entry
+        return (
+            self._incremental and
+            self._fingerprints.get(name) == entry
+        )
+
+    def _produced(self, name, path=None):
+        if path:
+            self._newFingerprints[name][1] = stampcache.stamp(path)
+
     def _processTemplate(self, template, dir, mode=None):
         out = os.path.join(
             dir,
             re.sub('\.in$', '', os.path.basename(template)),
         )
+        fingerprint = self._fingerprint(
+            stampcache.stamp(template),
+            self._config.values,
+            self._jbossVersion,
+            self._jbossRuntime.directory,
+        )
+        if self._upToDate(out, fingerprint, out):
+            self.logger.debug("'%s' is up to date", out)
+            return out
+
         with open(template, 'r') as f:
             t = Template(f.read())
-        with open(out, 'w') as f:
+        tmp = '%s.tmp' % out
+        with open(tmp, 'w') as f:
             if mode is not None:
-                os.chmod(out, mode)
+                os.chmod(tmp, mode)
             f.write(
                 t.render(
                     config=self._config,
@@ -83,6 +178,8 @@ class Daemon(service.Daemon):
                     jboss_runtime=self._jbossRuntime.directory,
                 )
             )
+        os.rename(tmp, out)
+        self._produced(out, out)
         return out
 
     def _checkInstallation(
@@ -150,9 +247,9 @@ class Daemon(service.Daemon):
             self._jbossRuntime.directory,
             'deployments',
         )
-        os.mkdir(deploymentsDir)
 
         # The list of applications to be deployed:
+        engineAppDirs = []
         for engineAppDir in shlex.split(self._config.get('ENGINE_APPS')):
             self.logger.debug('Deploying: %s', engineAppDir)
             if not os.path.isabs(engineAppDir):
@@ -170,16 +267,78 @@ class Daemon(service.Daemon):
                     ),
                 )
                 continue
+            engineAppDirs.append(engineAppDir)
 
-            engineAppLink = os.path.join(
-                deploymentsDir,
-                os.path.basename(engineAppDir),
-            )
-            os.symlink(engineAppDir, engineAppLink)
-            with open('%s.dodeploy' % engineAppLink, 'w'):
+        fingerprint = self._fingerprint(
+            [
+                [d, stampcache.stamp(d)]
+                for d in engineAppDirs
+            ],
+        )
+        if (
+            self._upToDate('deployments', fingerprint) and
+            os.path.isdir(deploymentsDir)
+        ):
+            self.logger.debug("Reusing '%s'", deploymentsDir)
+            # markers of previous run, links are kept
+            for name in os.listdir(deploymentsDir):
+                marker = os.path.join(deploymentsDir, name)
+                if not os.path.islink(marker):
+                    os.unlink(marker)
+        else:
+            # replace previous deployments at once
+            newDeploymentsDir = '%s.new' % deploymentsDir
+            oldDeploymentsDir = '%s.old' % deploymentsDir
+            for d in (newDeploymentsDir, oldDeploymentsDir):
+                if os.path.exists(d):
+                    shutil.rmtree(d)
+            os.mkdir(newDeploymentsDir)
+            for engineAppDir in engineAppDirs:
+                os.symlink(
+                    engineAppDir,
+                    os.path.join(
+                        newDeploymentsDir,
+                        os.path.basename(engineAppDir),
+                    ),
+                )
+            if os.path.exists(deploymentsDir):
+                os.rename(deploymentsDir, oldDeploymentsDir)
+            os.rename(newDeploymentsDir, deploymentsDir)
+            if os.path.exists(oldDeploymentsDir):
+                shutil.rmtree(oldDeploymentsDir)
+
+        for engineAppDir in engineAppDirs:
+            with open(
+                '%s.dodeploy' % os.path.join(
+                    deploymentsDir,
+                    os.path.basename(engineAppDir),
+                ),
+                'w',
+            ):
                 pass
 
     def _detectJBossVersion(self):
+        # version tool is a java virtual machine, run it only after
+        # JBoss was changed
+        jbossHome = self._config.get('JBOSS_HOME')
+        key = 'jboss-version:%s' % jbossHome
+        dependencies = [
+            jbossHome,
+            os.path.join(jbossHome, 'jboss-modules.jar'),
+            os.path.join(jbossHome, 'modules'),
+            os.path.join(jbossHome, 'version.txt'),
+        ]
+        self._jbossVersion = self._detectCache.get(key, dependencies)
+        if self._jbossVersion is None:
+            self._runJBossVersion()
+            self._detectCache.put(key, dependencies, self._jbossVersion)
+
+        self.logger.debug(
+            "Detected JBoss version: %s",
+            self._jbossVersion,
+        )
+
+    def _runJBossVersion(self):
         args = ['ovirt-engine-version'] + self._engineArgs + ['-v']
         self.logger.info(
             "Detecting JBoss version. Running: {exe} {args}".format(
@@ -219,11 +378,6 @@ class Daemon(service.Daemon):
         else:
             raise RuntimeError(_('Cannot detect JBoss version'))
 
-        self.logger.debug(
-            "Detected JBoss version: %s",
-            self._jbossVersion,
-        )
-
     def daemonSetup(self):
 
         if os.geteuid() == 0:
@@ -241,39 +395,62 @@ class Daemon(service.Daemon):
                 )
             )
 
-        self._config = configfile.ConfigFile(
-            (
-                self._defaults,
-                config.ENGINE_VARS,
-            ),
+        with self._timer.phase('config'):
+            self._config = configfile.ConfigFile(
+                (
+                    self._defaults,
+                    config.ENGINE_VARS,
+                ),
+                cache=os.path.join(
+                    config.ENGINE_CACHE,
+                    'ovirt-engine.conf.json',
+                ),
+            )
+
+        # results of detection of installed components
+        detectCache = os.path.join(
+            config.ENGINE_CACHE,
+            'ovirt-engine.detect.json',
         )
+        self._detectCache = stampcache.StampCache(detectCache)
 
         #
         # the earliest so we can abort early.
         #
-        self._executable = os.path.join(
-            java.Java().getJavaHome(),
-            'bin',
-            'java',
-        )
+        with self._timer.phase('java-home'):
+            self._executable = os.path.join(
+                java.Java(cache=detectCache).getJavaHome(),
+                'bin',
+                'java',
+            )
 
         jbossModulesJar = os.path.join(
             self._config.get('JBOSS_HOME'),
             'jboss-modules.jar',
         )
 
-        self._checkInstallation(
-            pidfile=self.pidfile,
-            jbossModulesJar=jbossModulesJar,
-        )
+        with self._timer.phase('check'):
+            self._checkInstallation(
+                pidfile=self.pidfile,
+                jbossModulesJar=jbossModulesJar,
+            )
 
-        self._tempDir = service.TempDir(self._config.get('ENGINE_TMP'))
-        self._tempDir.create()
+        self._incremental = self._config.getboolean(
+            'ENGINE_RUNTIME_INCREMENTAL'
+        )
+        with self._timer.phase('runtime-dirs'):
+            self._tempDir = service.TempDir(self._config.get('ENGINE_TMP'))
+            self._tempDir.create(clear=not self._incremental)
 
-        self._jbossRuntime = service.TempDir(self._config.get('JBOSS_RUNTIME'))
-        self._jbossRuntime.create()
+            self._jbossRuntime = service.TempDir(
+                self._config.get('JBOSS_RUNTIME')
+            )
+            self._jbossRuntime.create(clear=not self._incremental)
+            if self._incremental:
+                self._loadFingerprints()
 
-        self._setupEngineApps()
+        with self._timer.phase('deployments'):
+            self._setupEngineApps()
 
         jbossTempDir = os.path.join(
             self._jbossRuntime.directory,
@@ -293,17 +470,19 @@ class Daemon(service.Daemon):
             ),
         )
 
-        os.mkdir(jbossTempDir)
-        os.mkdir(jbossConfigDir)
+        for d in (jbossTempDir, jbossConfigDir):
+            if not os.path.isdir(d):
+                os.mkdir(d)
         os.chmod(jbossConfigDir, 0o700)
 
-        jbossBootLoggingFile = self._processTemplate(
-            template=os.path.join(
-                os.path.dirname(sys.argv[0]),
-                'ovirt-engine-logging.properties.in'
-            ),
-            dir=jbossConfigDir,
-        )
+        with self._timer.phase('logging-template'):
+            jbossBootLoggingFile = self._processTemplate(
+                template=os.path.join(
+                    os.path.dirname(sys.argv[0]),
+                    'ovirt-engine-logging.properties.in'
+                ),
+                dir=jbossConfigDir,
+            )
 
         # We start with an empty list of arguments:
         self._engineArgs = []
@@ -312,8 +491,23 @@ class Daemon(service.Daemon):
         heap_min_conf = self._config.get('ENGINE_HEAP_MIN')
         heap_max_conf = self._config.get('ENGINE_HEAP_MAX')
 
+        tuned = {}
+        tunedArgs = []
+        if self._config.getboolean('ENGINE_JVM_AUTO_TUNE'):
+            with self._timer.phase('jvm-auto-tune'):
+                tuned, tunedArgs = self._autoTuneJvm(
+                    heap_min_conf=heap_min_conf,
+                    heap_max_conf=heap_max_conf,
+                    enforceHeap=self._config.getboolean(
+                        'ENFORCE_ENGINE_HEAP_PARAMS'
+                    ),
+                )
+            heap_min_conf = tuned['HEAP_MIN']
+            heap_max_conf = tuned['HEAP_MAX']
+
         if not self._config.getboolean('ENFORCE_ENGINE_HEAP_PARAMS'):
-            total = mem.get_total_mb()
+            # within containers and slices limited by cgroup
+            total = mem.get_effective_mb()
 
             # Do not allow more than available memory
             if mem.javaX_mb(heap_min_conf) > total:
@@ -344,7 +538,16 @@ class Daemon(service.Daemon):
             '-XX:+TieredCompilation',
             '-Xms%s' % heap_min_conf,
             '-Xmx%s' % heap_max_conf,
-        ])
+        ] + tunedArgs)
+
+        if self._config.getboolean('ENGINE_APPCDS'):
+            with self._timer.phase('appcds'):
+                self._engineArgs.extend(
+                    self._setupAppCds(
+                        jbossModulesJar=jbossModulesJar,
+                        javaModulePath=javaModulePath,
+                    )
+                )
 
         # Add extra system properties provided in the configuration:
         for engineProperty in shlex.split(
@@ -418,20 +621,375 @@ class Daemon(service.Daemon):
             'ENGINE_USR': self._config.get('ENGINE_USR'),
             'ENGINE_VAR': self._config.get('ENGINE_VAR'),
             'ENGINE_CACHE': self._config.get('ENGINE_CACHE'),
-            'MALLOC_ARENA_MAX': self._config.get('ENGINE_MALLOC_ARENA_MAX'),
+            'MALLOC_ARENA_MAX': str(
+                tuned.get(
+                    'MALLOC_ARENA_MAX',
+                    self._config.get('ENGINE_MALLOC_ARENA_MAX'),
+                )
+            ),
         })
 
-        self._detectJBossVersion()
+        with self._timer.phase('jboss-version'):
+            self._detectJBossVersion()
 
-        self._jbossConfigFile = self._processTemplate(
-            template=os.path.join(
-                os.path.dirname(sys.argv[0]),
-                'ovirt-engine.xml.in',
-            ),
-            dir=jbossConfigDir,
-            mode=0o600,
+        with self._timer.phase('config-template'):
+            self._jbossConfigFile = self._processTemplate(
+                template=os.path.join(
+                    os.path.dirname(sys.argv[0]),
+                    'ovirt-engine.xml.in',
+                ),
+                dir=jbossConfigDir,
+                mode=0o600,
+            )
+
+        if self._incremental:
+            self._saveFingerprints()
+
+        self._readinessUrl = self._readinessProbeUrl()
+        self.logger.debug('Readiness probe url: %s', self._readinessUrl)
+
+    def _autoTuneJvm(self, heap_min_conf, heap_max_conf, enforceHeap):
+        """
+        Derive java virtual machine heap, garbage collector, its threads,
+        metaspace and malloc arenas from memory, cpus and NUMA nodes
+        available to the service. Each value can be overridden by
+        ENGINE_AUTO_TUNE_<KEY>.
+
+        Returns tuned values and java virtual machine arguments.
+        """
+        memory = mem.get_effective_mb()
+        cpus = mem.get_cpu_limit()
+        nodes = mem.get_numa_nodes()
+        self.logger.info(
+            'JVM auto tuning: %s MB memory, %.1f cpus, %s NUMA nodes',
+            memory,
+            cpus,
+            nodes,
+        )
+
+        tuned = {}
+
+        def choose(key, value, reason):
+            override = self._config.get('ENGINE_AUTO_TUNE_%s' % key)
+            if override:
+                value = override
+                reason = 'ENGINE_AUTO_TUNE_%s' % key
+            self.logger.info(
+                'JVM auto tuning: %s=%s (%s)',
+                key,
+                value,
+                reason,
+            )
+            tuned[key] = value
+            return value
+
+        if enforceHeap:
+            heapMax = choose(
+                'HEAP_MAX',
+                heap_max_conf,
+                'ENFORCE_ENGINE_HEAP_PARAMS',
+            )
+            choose('HEAP_MIN', heap_min_conf, 'ENFORCE_ENGINE_HEAP_PARAMS')
+        else:
+            percent = self._config.getinteger('ENGINE_AUTO_TUNE_HEAP_PERCENT')
+            heapMaxMb = max(
+                memory * percent // 100,
+                mem.javaX_mb(heap_max_conf),
+            )
+            reason = '%s%% of memory, at least ENGINE_HEAP_MAX' % percent
+            if heapMaxMb > memory * 9 // 10:
+                heapMaxMb = memory * 9 // 10
+                reason = '90% of memory'
+            if heapMaxMb > self._HEAP_COMPRESSED_OOPS_MB:
+                heapMaxMb = self._HEAP_COMPRESSED_OOPS_MB
+                reason = 'compressed object pointers limit'
+            heapMax = choose('HEAP_MAX', '%dM' % heapMaxMb, reason)
+            choose(
+                'HEAP_MIN',
+                '%dM' % min(
+                    max(
+                        mem.javaX_mb(heap_min_conf),
+                        mem.javaX_mb(heapMax) // 2,
+                    ),
+                    mem.javaX_mb(heapMax),
+                ),
+                'half of heap, at least ENGINE_HEAP_MIN',
+            )
+
+        if cpus < 2 or mem.javaX_mb(heapMax) < 1792:
+            gc, reason = 'Serial', 'single cpu or small heap'
+        elif nodes > 1:
+            gc, reason = 'Parallel', 'NUMA aware allocation'
+        else:
+            gc, reason = 'G1', 'large heap, multiple cpus'
+        gc = choose('GC', gc, reason)
+        if gc not in self._GC_ARGS:
+            raise RuntimeError(
+                _(
+                    "Invalid ENGINE_AUTO_TUNE_GC '{gc}', "
+                    "valid values are {valid}"
+                ).format(
+                    gc=gc,
+                    valid=', '.join(sorted(self._GC_ARGS)),
+                )
+            )
+        args = list(self._GC_ARGS[gc])
+        if gc == 'Parallel' and nodes > 1:
+            args.append('-XX:+UseNUMA')
+
+        if gc != 'Serial':
+            # same as java virtual machine ergonomics, which does not
+            # consider cgroup cpu quota in older versions
+            count = max(int(cpus), 1)
+            threads = int(
+                choose(
+                    'GC_THREADS',
+                    count if count <= 8 else 8 + (count - 8) * 5 // 8,
+                    'cpus available',
+                )
+            )
+            args.append('-XX:ParallelGCThreads=%d' % threads)
+            if gc == 'G1':
+                args.append(
+                    '-XX:ConcGCThreads=%d' % max((threads + 2) // 4, 1)
+                )
+
+        metaspace = choose(
+            'METASPACE_MAX',
+            '%dM' % min(max(memory // 16, 256), 1024),
+            '1/16 of memory, 256M to 1G',
+        )
+        args.extend([
+            '-XX:MetaspaceSize=%dM' % min(mem.javaX_mb(metaspace), 256),
+            '-XX:MaxMetaspaceSize=%s' % metaspace,
+        ])
+
+        choose(
+            'MALLOC_ARENA_MAX',
+            min(max(int(cpus) // 4, 1), 4),
+            'cpus available',
         )
 
+        return tuned, args
+
+    def _detectJavaVersion(self):
+        """Feature version of java virtual machine, 8 for 1.8"""
+        java = os.path.realpath(self._executable)
+        key = 'java-version:%s' % java
+        version = self._detectCache.get(key, [java])
+        if version is None:
+            proc = subprocess.Popen(
+                args=[self._executable, '-version'],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                close_fds=True,
+            )
+            stdout, stderr = proc.communicate()
+            match = self._JAVA_VERSION_REGEX.search(
+                stderr.decode('utf-8', 'replace')
+            )
+            if proc.returncode != 0 or match is None:
+                raise RuntimeError(_('Cannot detect java version'))
+            version = int(match.group('major'))
+            if version == 1:
+                version = int(match.group('minor'))
+            self._detectCache.put(key, [java], version)
+        return version
+
+    def _appCdsFingerprint(self, jbossModulesJar, javaModulePath):
+        stamps = [
+            [p, stampcache.stamp(p)]
+            for p in (os.path.realpath(self._executable), jbossModulesJar)
+        ]
+        for moduleDir in javaModulePath.split(':'):
+            if not moduleDir:
+                continue
+            for root, dirs, files in os.walk(moduleDir):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith('.jar'):
+                        jar = os.path.join(root, name)
+                        stamps.append([jar, stampcache.stamp(jar)])
+        return self._fingerprint(stamps)
+
+    def _dumpAppCds(self, classList, archive, jbossModulesJar):
+        self.logger.info(_('Creating class data sharing archive'))
+        tmp = '%s.tmp' % archive
+        proc = subprocess.Popen(
+            executable=self._executable,
+            args=[
+                'java',
+                '-Xshare:dump',
+                '-XX:SharedClassListFile=%s' % classList,
+                '-XX:SharedArchiveFile=%s' % tmp,
+                # must match class path of engine
+                '-cp', jbossModulesJar,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            close_fds=True,
+        )
+        stdout, stderr = proc.communicate()
+        self.logger.debug(
+            "Return code: %s, output: '%s'",
+            proc.returncode,
+            stdout.decode('utf-8', 'replace'),
+        )
+        if proc.returncode != 0 or not os.path.exists(tmp):
+            self.logger.warning(
+                _(
+                    'Cannot create class data sharing archive, '
+                    'classes will be recorded again'
+                )
+            )
+            for f in (tmp, classList):
+                if os.path.exists(f):
+                    os.unlink(f)
+            return
+        os.rename(tmp, archive)
+
+    def _setupAppCds(self, jbossModulesJar, javaModulePath):
+        """
+        Class data sharing archive of classes loaded by the built in
+        class loaders, JDK and jboss-modules.
+
+        Classes loaded are recorded during first run of the engine, the
+        archive is created by the following start and used since, until
+        java, jboss-modules or jars of module path change.
+
+        Returns java virtual machine arguments.
+        """
+        version = self._detectJavaVersion()
+        if version < 11:
+            self.logger.warning(
+                _(
+                    'ENGINE_APPCDS requires java 11 or later, '
+                    'java {version} is used'
+                ).format(
+                    version=version,
+                )
+            )
+            return []
+
+        base = os.path.join(
+            self._config.get('ENGINE_CACHE'),
+            'ovirt-engine-cds',
+        )
+        classList = '%s.classlist' % base
+        archive = '%s.jsa' % base
+        stateFile = '%s.json' % base
+
+        fingerprint = self._appCdsFingerprint(
+            jbossModulesJar=jbossModulesJar,
+            javaModulePath=javaModulePath,
+        )
+        try:
+            with open(stateFile, 'r') as f:
+                state = json.load(f)
+        except (IOError, OSError, ValueError):
+            state = {}
+        if state.get('fingerprint') != fingerprint:
+            self.logger.debug('Class data sharing inputs changed')
+            for f in (archive, classList):
+                if os.path.exists(f):
+                    os.unlink(f)
+            tmp = '%s.tmp' % stateFile
+            with open(tmp, 'w') as f:
+                json.dump({'fingerprint': fingerprint}, f)
+            os.rename(tmp, stateFile)
+
+        if not os.path.exists(archive) and os.path.exists(classList):
+            self._dumpAppCds(
+                classList=classList,
+                archive=archive,
+                jbossModulesJar=jbossModulesJar,
+            )
+
+        if os.path.exists(archive):
+            self.logger.debug("Using class data sharing archive '%s'", archive)
+            return [
+                '-Xshare:auto',
+                '-XX:SharedArchiveFile=%s' % archive,
+            ]
+
+        self.logger.debug("Recording classes into '%s'", classList)
+        self._appCdsClassList = classList
+        return [
+            '-XX:DumpLoadedClassList=%s.tmp' % classList,
+        ]
+
+    def _appCdsRecorded(self):
+        """Keep class list recorded by engine which stopped normally"""
+        if self._appCdsClassList is None:
+            return
+        tmp = '%s.tmp' % self._appCdsClassList
+        if os.path.exists(tmp) and os.path.getsize(tmp) > 0:
+            os.rename(tmp, self._appCdsClassList)
+
+    def _readinessProbeUrl(self):
+        if not self._config.getboolean('ENGINE_READINESS_PROBE'):
+            return None
+        if self._config.get('ENGINE_READINESS_URL'):
+            return self._config.get('ENGINE_READINESS_URL')
+
+        path = '%s/services/health' % self._config.get('ENGINE_URI')
+        if self._config.getboolean('ENGINE_HTTP_ENABLED'):
+            return 'http://localhost:%s%s' % (
+                self._config.getinteger('ENGINE_HTTP_PORT'),
+                path,
+            )
+        if self._config.getboolean('ENGINE_HTTPS_ENABLED'):
+            return 'https://localhost:%s%s' % (
+                self._config.getinteger('ENGINE_HTTPS_PORT'),
+                path,
+            )
+        if self._config.getboolean('ENGINE_PROXY_ENABLED'):
+            return 'http://localhost:%s%s' % (
+                self._config.getinteger('ENGINE_PROXY_HTTP_PORT'),
+                path,
+            )
+        return None
+
+    def daemonReadiness(self):
+        """Whether engine health status responds"""
+        if self._readinessUrl is None:
+            return True
+        kwargs = {}
+        if (
+            self._readinessUrl.startswith('https:') and
+            hasattr(ssl, 'create_default_context')
+        ):
+            # certificate of engine is issued to its fqdn
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            kwargs['context'] = context
+        res = urlopen(
+            self._readinessUrl,
+            timeout=self._READINESS_TIMEOUT,
+            **kwargs
+        )
+        try:
+            return res.getcode() == 200
+        finally:
+            res.close()
+
+    def _startupReport(self):
+        self._timer.log()
+        report = self._config.get('ENGINE_STARTUP_REPORT')
+        if report:
+            try:
+                self._timer.write(report)
+            except (IOError, OSError) as e:
+                self.logger.warning(
+                    _(
+                        "Cannot write startup report '{file}': {error}"
+                    ).format(
+                        file=report,
+                        error=e,
+                    )
+                )
+
     def daemonStdHandles(self):
         consoleLog = open(
             os.path.join(
@@ -450,6 +1008,8 @@ class Daemon(service.Daemon):
             with open(self._config.get('ENGINE_UP_MARK'), 'w') as f:
                 f.write('%s\n' % os.getpid())
 
+            self._startupReport()
+
             #
             # NOTE:
             # jdwp must be set only for the process we are trying
@@ -478,6 +1038,8 @@ class Daemon(service.Daemon):
                 ),
             )
 
+            self._appCdsRecorded()
+
             raise self.TerminateException()
 
         except self.TerminateException:
@@ -485,6 +1047,9 @@ class Daemon(service.Daemon):
                 os.remove(self._config.get('ENGINE_UP_MARK'))
 
     def daemonCleanup(self):
+        if self._incremental:
+            # kept for next start
+            return
         if self._tempDir:
             self._tempDir.destroy()
         if self._jbossRuntime:
@@ -19,6 +19,7 @@ import json
 import psycopg2
 
 from ovirt_engine import base
+from ovirt_engine import metrics
 
 
 def _(m):
@@ -27,6 +28,21 @@ def _(m):
 
 class DbManager(base.Base):
     """Manages database connection and executes SQL commands"""
+
+    # connection validation modes
+    # status: rely on connection status and TCP keepalive, connection
+    #         broken meanwhile is detected by failure of next call, which
+    #         is retried on new connection
+    # query: execute test query
+    VALIDATION_STATUS = 'status'
+    VALIDATION_QUERY = 'query'
+    VALIDATION_MODES = (VALIDATION_STATUS, VALIDATION_QUERY)
+
+    # TCP keepalive settings to detect broken connection in status mode
+    _KEEPALIVES_IDLE = 30
+    _KEEPALIVES_INTERVAL = 10
+    _KEEPALIVES_COUNT = 3
+
     def __init__(
             self,
             host,
@@ -37,8 +53,20 @@ class DbManager(base.Base):
             secured,
             secure_validation,
             autocommit=True,
+            registry=None,
+            validation=VALIDATION_QUERY,
     ):
         super(DbManager, self).__init__()
+        if validation not in self.VALIDATION_MODES:
+            raise ValueError(
+                _(
+                    "Invalid connection validation '{validation}', "
+                    "expected one of: {modes}"
+                ).format(
+                    validation=validation,
+                    modes=', '.join(self.VALIDATION_MODES),
+                )
+            )
         self._host = host
         self._port = port
         self._database = database
@@ -51,7 +79,18 @@ class DbManager(base.Base):
             else:
                 self._sslmode = 'require'
         self._autocommit = autocommit
+        self._validation = validation
         self._connection = None
+        # procedure name -> number of arguments
+        self._procedures = {}
+        # procedures prepared within current connection
+        self._prepared = set()
+        self._procedureDuration = (
+            registry or metrics.Registry()
+        ).histogram(
+            name='fence_kdump_listener_db_procedure_duration_seconds',
+            help='Duration of database procedure calls',
+        )
 
     def __enter__(self):
         # connection is opened during listener db sync
@@ -81,6 +120,10 @@ class DbManager(base.Base):
                 password=self._password,
                 database=self._database,
                 sslmode=self._sslmode,
+                keepalives=1,
+                keepalives_idle=self._KEEPALIVES_IDLE,
+                keepalives_interval=self._KEEPALIVES_INTERVAL,
+                keepalives_count=self._KEEPALIVES_COUNT,
             )
 
         # autocommit member is available at >= 2.4.2
@@ -93,6 +136,45 @@ class DbManager(base.Base):
                 else psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT
             )
 
+        for name in self._procedures:
+            self._prepare(name)
+
+    def _statement_name(self, name):
+        return 'fence_kdump_%s' % name.lower()
+
+    def _prepare(self, name):
+        try:
+            with contextlib.closing(
+                    self._connection.cursor()
+            ) as cursor:
+                cursor.execute(
+                    'PREPARE %s AS SELECT * FROM %s(%s)' % (
+                        self._statement_name(name),
+                        name,
+                        ', '.join(
+                            '$%d' % (i + 1)
+                            for i in range(self._procedures[name])
+                        ),
+                    )
+                )
+            self._prepared.add(name)
+        except (psycopg2.Error, psycopg2.Warning):
+            # procedure will be called without prepared statement
+            self.logger.debug(
+                "Cannot prepare procedure '%s'",
+                name,
+                exc_info=True,
+            )
+
+    def prepare_procedure(self, name, argc):
+        """Registers procedure to be called using prepared statement
+
+        Statements are prepared on each new connection.
+        """
+        self._procedures[name] = argc
+        if self._connection is not None and name not in self._prepared:
+            self._prepare(name)
+
     def _close_connection(self):
         try:
             if self._connection is not None:
@@ -106,32 +188,36 @@ class DbManager(base.Base):
             self.logger.debug('Exception',  exc_info=True)
         finally:
             self._connection = None
+            self._prepared.clear()
 
     def _connection_valid(self):
         valid = False
         if self._connection is not None:
-            try:
-                with contextlib.closing(
-                        self._connection.cursor()
-                ) as cursor:
-                    cursor.execute('SELECT 1')
-                valid = True
-            except (psycopg2.Error, psycopg2.Warning):
-                self.logger.debug(
-                    'Error testing connection validity',
-                    exc_info=True,
+            if self._validation == self.VALIDATION_STATUS:
+                valid = (
+                    self._connection.closed == 0 and
+                    self._connection.get_transaction_status() !=
+                    psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
                 )
+            elif self._validation == self.VALIDATION_QUERY:
+                try:
+                    with contextlib.closing(
+                            self._connection.cursor()
+                    ) as cursor:
+                        cursor.execute('SELECT 1')
+                    valid = True
+                except (psycopg2.Error, psycopg2.Warning):
+                    self.logger.debug(
+                        'Error testing connection validity',
+                        exc_info=True,
+                    )
         return valid
 
     def _process_results(self, cursor):
         ret = []
         if cursor.description is not None:
             cols = [d[0] for d in cursor.description]
-            while True:
-                entry = cursor.fetchone()
-                if entry is None:
-                    break
-                ret.append(dict(zip(cols, entry)))
+            ret = [dict(zip(cols, entry)) for entry in cursor.fetchall()]
         return ret
 
     def validate_connection(self):
@@ -147,6 +233,28 @@ class DbManager(base.Base):
                 self.logger.debug('Connection is not valid')
         return valid
 
+    def _execute(self, name, args):
+        with self._procedureDuration.time(
+            procedure=name,
+        ), contextlib.closing(
+            self._connection.cursor()
+        ) as cursor:
+            if name in self._prepared:
+                cursor.execute(
+                    'EXECUTE %s%s' % (
+                        self._statement_name(name),
+                        '(%s)' % ', '.join(['%s'] * len(args))
+                        if args else '',
+                    ),
+                    args,
+                )
+            else:
+                cursor.callproc(
+                    name,
+                    args,
+                )
+            return self._process_results(cursor=cursor)
+
     def call_procedure(
             self,
             name,
@@ -160,14 +268,23 @@ class DbManager(base.Base):
         )
 
         try:
-            with contextlib.closing(
-                    self._connection.cursor()
-            ) as cursor:
-                cursor.callproc(
-                    name,
-                    args,
+            try:
+                ret = self._execute(name, args)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                # status validation does not detect connection broken
+                # meanwhile, so reconnect and retry once, all procedures
+                # are idempotent
+                self.logger.warning(
+                    _(
+                        "Database connection failed, reconnecting: {error}"
+                    ).format(
+                        error=e,
+                    )
                 )
-                ret = self._process_results(cursor=cursor)
+                self.logger.debug('Exception', exc_info=True)
+                self._close_connection()
+                self._open_connection()
+                ret = self._execute(name, args)
         except (psycopg2.Error, psycopg2.Warning) as e:
             raise DbException(
                 message=(
@@ -191,6 +308,13 @@ class EngineDao(base.Base):
     ):
         super(EngineDao, self).__init__()
         self._db_mgr = db_manager
+        for name, argc in (
+            ('UpsertKdumpStatusForIp', 3),
+            ('UpsertKdumpStatusForIps', 3),
+            ('UpsertExternalVariable', 2),
+            ('GetAllUnfinishedVdsKdumpStatus', 0),
+        ):
+            self._db_mgr.prepare_procedure(name=name, argc=argc)
 
     def update_vds_kdump_status(self, status, address):
         res = self._db_mgr.call_procedure(
@@ -203,6 +327,27 @@ class EngineDao(base.Base):
         )
         return res[0]['upsertkdumpstatusforip'] == 1
 
+    def update_vds_kdump_statuses(self, sessions):
+        """Saves statuses of all sessions in single database call
+
+        Accepts list of (status, address) tuples and returns dictionary
+        address -> True if host with address was found and updated
+        """
+        res = self._db_mgr.call_procedure(
+            name='UpsertKdumpStatusForIps',
+            args=(
+                [a[0] for s, a in sessions],     # v_ips
+                [s for s, a in sessions],        # v_statuses
+                [json.dumps(a) for s, a in sessions],  # v_addresses
+            ),
+        )
+
+        # address needs to be converted from string to tuple
+        return dict(
+            (tuple(json.loads(record['address'])), record['updated'] == 1)
+            for record in res
+        )
+
     def update_heartbeat(self):
         return self._db_mgr.call_procedure(
             name='UpsertExternalVariable',
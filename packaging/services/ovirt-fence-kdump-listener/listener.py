@@ -12,21 +12,52 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import datetime
+import binascii
+import errno
 import gettext
+import heapq
+import itertools
+import select
 import socket
-import time
 
 import db
 
 
 from ovirt_engine import base
+from ovirt_engine import metrics
+from ovirt_engine import util
 
 
 def _(m):
     return gettext.dgettext(message=m, domain='ovirt-fence-kdump-listener')
 
 
+class Session(object):
+    """Kdump flow of a host identified by its address"""
+
+    __slots__ = (
+        'address',
+        'status',
+        # monotonic timestamp of last valid message
+        'updated',
+        # whether session has an entry in expiration queue
+        'scheduled',
+    )
+
+    def __init__(self, address, status, updated):
+        self.address = address
+        self.status = status
+        self.updated = updated
+        self.scheduled = False
+
+    def __repr__(self):
+        return '<Session address=%r status=%r updated=%r>' % (
+            self.address,
+            self.status,
+            self.updated,
+        )
+
+
 class FenceKdumpListener(base.Base):
     class InvalidMessage(Exception):
         pass
@@ -40,28 +71,98 @@ class FenceKdumpListener(base.Base):
     # buffer size to receive message
     _BUF_SIZE = 0x20
 
+    # maximum number of messages read from one socket at once, so other
+    # sockets and timers are not starved during message storm
+    _BATCH_SIZE = 64
+
+    # not exported by python2 socket module
+    _SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15)
+
     # fence_kdump message version 1
     _MSG_V1_SIZE = 8
     # message contains magic 0x1B302A40 and version 0x1 in BE byte order
-    _MSG_V1_PREFIX = '402a301b01000000'.decode('hex')
+    _MSG_V1_PREFIX = binascii.unhexlify('402a301b01000000')
 
     def __init__(
             self,
-            bind,
+            binds,
             db_manager,
             heartbeat_interval,
             session_sync_interval,
             reopen_db_connection_interval,
             session_expiration_time,
+            reuse_port=False,
+            receive_buffer_size=None,
+            registry=None,
+            spool=None,
     ):
         super(FenceKdumpListener, self).__init__()
-        self._bind = bind
+        self._binds = binds
+        self._reusePort = reuse_port
+        self._receiveBufferSize = receive_buffer_size
+        self._sockets = {}
+        self._buffer = bytearray(self._BUF_SIZE)
+        self._bufferView = memoryview(self._buffer)
 
         self._db_manager = db_manager
         self._dao = db.EngineDao(db_manager)
         self._db_connection_valid = True
         self._afterFirstDbSync = False
 
+        self.set_intervals(
+            heartbeat_interval=heartbeat_interval,
+            session_sync_interval=session_sync_interval,
+            reopen_db_connection_interval=reopen_db_connection_interval,
+            session_expiration_time=session_expiration_time,
+        )
+        # all timestamps are taken from monotonic clock
+        self._lastHeartbeat = None
+        self._lastSessionSync = None
+        self._lastDbSyncFailure = None
+        self._lastDbConnectionAttempt = None
+        # last write of sessions to spool, _lastSessionSync is advanced
+        # only when sessions are saved to db
+        self._lastSpool = None
+        self._sessions = {}
+        # addresses of sessions to be saved to db
+        self._dirtySessions = set()
+        # addresses of sessions to be removed on next house keeping
+        self._closedSessions = set()
+        # heap of (expiration, sequence, session) of dumping sessions,
+        # expiration may be outdated as it is not updated on message
+        self._expirations = []
+        self._expirationSequence = itertools.count()
+        # sessions not saved to db are written to spool during db outage
+        self._spool = spool
+        # address -> status of last record in spool
+        self._spooled = {}
+
+        registry = registry or metrics.Registry()
+        self._messagesReceived = registry.counter(
+            name='fence_kdump_listener_messages_total',
+            help='Messages received, by result of validation',
+        )
+        self._dbSyncDuration = registry.histogram(
+            name='fence_kdump_listener_db_sync_duration_seconds',
+            help='Duration of database synchronization',
+        )
+        registry.gauge(
+            name='fence_kdump_listener_sessions',
+            help='Sessions in memory, by state',
+            callback=self._count_sessions,
+        )
+
+    def set_intervals(
+            self,
+            heartbeat_interval,
+            session_sync_interval,
+            reopen_db_connection_interval,
+            session_expiration_time,
+    ):
+        """Sets timers, may be called while running, applied on next wakeup
+
+        Expiration of sessions already scheduled is not changed.
+        """
         self._heartbeatInterval = heartbeat_interval
         self._sessionSyncInterval = session_sync_interval
         self._wakeupInterval = min(
@@ -70,62 +171,154 @@ class FenceKdumpListener(base.Base):
         )
         self._reopenDbConnInterval = reopen_db_connection_interval
         self._sessionExpirationTime = session_expiration_time
-        self._lastHeartbeat = None
-        self._lastSessionSync = None
-        self._lastWakeup = None
-        self._lastDbConnectionAttempt = None
-        self._sessions = {}
+
+    def _create_socket(self, bind):
+        family, socktype, proto, canonname, sockaddr = socket.getaddrinfo(
+            bind[0] or None,
+            bind[1],
+            socket.AF_UNSPEC,
+            socket.SOCK_DGRAM,
+            0,
+            socket.AI_PASSIVE,
+        )[0]
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+        try:
+            if family == socket.AF_INET6:
+                # allow binding IPv4 address on the same port
+                sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+            if self._reusePort:
+                sock.setsockopt(socket.SOL_SOCKET, self._SO_REUSEPORT, 1)
+            if self._receiveBufferSize:
+                sock.setsockopt(
+                    socket.SOL_SOCKET,
+                    socket.SO_RCVBUF,
+                    self._receiveBufferSize,
+                )
+            sock.bind(sockaddr)
+            sock.setblocking(False)
+        except Exception:
+            sock.close()
+            raise
+
+        self.logger.debug('Listening on %s', sockaddr)
+        return sock
 
     def __enter__(self):
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self._socket.bind(self._bind)
+        self._poller = select.poll()
+        try:
+            for bind in self._binds:
+                sock = self._create_socket(bind)
+                self._sockets[sock.fileno()] = sock
+                self._poller.register(sock.fileno(), select.POLLIN)
+        except Exception:
+            self._close_sockets()
+            raise
+        self._restore_spooled_sessions()
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self._socket.close()
+        self._close_sockets()
 
-    def _total_seconds(self, dt1, dt2):
-        return round(
-            abs(
-                time.mktime(dt1.timetuple()) - time.mktime(dt2.timetuple())
-            )
-        )
-
-    def _interval_finished(self, interval, last):
-        return (
-            last is None or
-            self._total_seconds(datetime.datetime.utcnow(), last) >= interval
-        )
+    def _close_sockets(self):
+        for sock in self._sockets.values():
+            sock.close()
+        self._sockets.clear()
 
-    def _recvfrom(self):
-        ret = (None, None)
+    def _deadline(self, interval, last):
+        return 0 if last is None else last + interval
 
-        try:
-            if self._interval_finished(
+    def _interval_finished(self, interval, last):
+        return util.monotonic() >= self._deadline(interval, last)
+
+    def _next_db_sync(self):
+        if self._db_connection_valid:
+            # on synchronization error retry after wakeup interval
+            return max(
+                min(
+                    self._deadline(
+                        interval=self._heartbeatInterval,
+                        last=self._lastHeartbeat,
+                    ),
+                    self._deadline(
+                        interval=self._sessionSyncInterval,
+                        last=self._lastSessionSync,
+                    ),
+                ),
+                self._deadline(
                     interval=self._wakeupInterval,
-                    last=self._lastWakeup,
-            ):
-                raise socket.timeout()
-
-            self._socket.settimeout(
-                max(
-                    self._wakeupInterval - self._total_seconds(
-                        datetime.datetime.utcnow(),
-                        self._lastWakeup
+                    last=self._lastDbSyncFailure,
+                ),
+            )
+        else:
+            deadline = self._deadline(
+                interval=self._reopenDbConnInterval,
+                last=self._lastDbConnectionAttempt,
+            )
+            if self._spool is not None:
+                deadline = min(
+                    deadline,
+                    self._deadline(
+                        interval=self._sessionSyncInterval,
+                        last=self._lastSpool,
                     ),
-                    1,
                 )
-            )
+            return deadline
 
-            ret = self._socket.recvfrom(self._BUF_SIZE)
-        except socket.timeout:
-            self._lastWakeup = datetime.datetime.utcnow()
+    def _next_wakeup(self):
+        wakeup = self._next_db_sync()
+        if self._expirations:
+            wakeup = min(wakeup, self._expirations[0][0])
+        return wakeup
 
-        return ret
+    def _receive(self):
+        """Waits for messages until next timer deadline
+
+        Yields (message, address) for messages queued in all ready sockets,
+        up to _BATCH_SIZE per socket.
+        """
+        timeout = self._next_wakeup() - util.monotonic()
+        if timeout <= 0:
+            return
+
+        # poll accepts milliseconds, round up not to wake up early
+        try:
+            events = self._poller.poll(int(timeout * 1000) + 1)
+        except select.error as e:
+            # interrupted by signal, e.g. reload
+            if e.args[0] == errno.EINTR:
+                return
+            raise
+        for fd, event in events:
+            sock = self._sockets[fd]
+            for i in range(self._BATCH_SIZE):
+                try:
+                    nbytes, address = sock.recvfrom_into(self._buffer)
+                except socket.error as e:
+                    if e.errno in (errno.EAGAIN, errno.EINTR):
+                        break
+                    raise
+                yield self._bufferView[:nbytes].tobytes(), address
 
     def _house_keeping(self):
         self._house_keeping_sessions()
-        self._db_sync()
+        if util.monotonic() >= self._next_db_sync():
+            with self._dbSyncDuration.time():
+                self._db_sync()
+
+    def _count_sessions(self):
+        """Returns number of sessions per state, called from metrics thread"""
+        ret = dict(
+            ((('state', state),), 0)
+            for state in (
+                self.SESSION_STATE_INITIAL,
+                self.SESSION_STATE_DUMPING,
+                self.SESSION_STATE_FINISHED,
+                self.SESSION_STATE_CLOSED,
+            )
+        )
+        for session in list(self._sessions.values()):
+            ret[(('state', session.status),)] += 1
+        return ret
 
     def _verify_message(self, message):
         return (
@@ -142,60 +335,92 @@ class FenceKdumpListener(base.Base):
                         "Discarding invalid message '{msg}' from address "
                         "'{address}'."
                     ).format(
-                        msg=message.encode('hex'),
-                        address=entry['address'][0],
+                        msg=binascii.hexlify(message).decode('ascii'),
+                        address=entry.address[0],
                     )
                 )
 
+            self._messagesReceived.inc(result='valid')
+
             # message is valid, update timestamp
-            entry['updated'] = datetime.datetime.utcnow()
+            entry.updated = util.monotonic()
 
-            if entry['status'] == self.SESSION_STATE_INITIAL:
+            if entry.status == self.SESSION_STATE_INITIAL:
                 self.logger.debug(
                     "Started to dump '%s'",
                     entry,
                 )
-                entry['status'] = self.SESSION_STATE_DUMPING
+                entry.status = self.SESSION_STATE_DUMPING
+                self._schedule_session_expiration(entry)
 
-            elif entry['status'] == self.SESSION_STATE_DUMPING:
+            elif entry.status == self.SESSION_STATE_DUMPING:
                 self.logger.debug(
                     "Dumping '%s'",
                     entry,
                 )
         except FenceKdumpListener.InvalidMessage as e:
+            self._messagesReceived.inc(result='invalid')
             self.logger.debug(e)
             # if host just started the dump, close the session, otherwise
             # just ignore invalid message
-            if entry['status'] == self.SESSION_STATE_INITIAL:
-                entry['status'] = self.SESSION_STATE_CLOSED
+            if entry.status == self.SESSION_STATE_INITIAL:
+                self._close_session(entry)
+
+    def _close_session(self, session):
+        session.status = self.SESSION_STATE_CLOSED
+        self._dirtySessions.discard(session.address)
+        self._closedSessions.add(session.address)
+
+    def _schedule_session_expiration(self, session):
+        if not session.scheduled:
+            session.scheduled = True
+            heapq.heappush(
+                self._expirations,
+                (
+                    session.updated + self._sessionExpirationTime,
+                    next(self._expirationSequence),
+                    session,
+                ),
+            )
 
     def _house_keeping_sessions(self):
-        for session in self._sessions.values():
+        now = util.monotonic()
+        while self._expirations and self._expirations[0][0] <= now:
+            session = heapq.heappop(self._expirations)[2]
+            session.scheduled = False
 
             if (
-                session['status'] == self.SESSION_STATE_DUMPING and
-                self._interval_finished(
-                    interval=self._sessionExpirationTime,
-                    last=session['updated']
-                )
+                session.status != self.SESSION_STATE_DUMPING or
+                self._sessions.get(session.address) is not session
+            ):
+                continue
+
+            if self._interval_finished(
+                interval=self._sessionExpirationTime,
+                last=session.updated
             ):
-                session['status'] = self.SESSION_STATE_FINISHED
-                session['dirty'] = True
+                session.status = self.SESSION_STATE_FINISHED
+                self._dirtySessions.add(session.address)
                 self.logger.info(
                     _(
                         "Host '{address}' finished kdump flow."
                     ).format(
-                        address=session['address'][0]
+                        address=session.address[0]
                     )
                 )
+            else:
+                # message received meanwhile
+                self._schedule_session_expiration(session)
 
         # remove finished sessions (engine will remove them from db)
-        for address in (
-            session['address']
-            for session in self._sessions.values()
-            if session['status'] == self.SESSION_STATE_CLOSED
-        ):
-            del self._sessions[address]
+        for address in self._closedSessions:
+            session = self._sessions.get(address)
+            if (
+                session is not None and
+                session.status == self.SESSION_STATE_CLOSED
+            ):
+                del self._sessions[address]
+        self._closedSessions.clear()
 
     def _heartbeat(self):
         if self._interval_finished(
@@ -203,7 +428,36 @@ class FenceKdumpListener(base.Base):
                 last=self._lastHeartbeat
         ):
             self._dao.update_heartbeat()
-            self._lastHeartbeat = datetime.datetime.utcnow()
+            self._lastHeartbeat = util.monotonic()
+
+    def _update_vds_kdump_statuses(self, sessions):
+        try:
+            return self._dao.update_vds_kdump_statuses(
+                sessions=[
+                    (session.status, session.address)
+                    for session in sessions
+                ],
+            )
+        except db.DbException as e:
+            self.logger.debug(
+                (
+                    "Error saving sessions in single call, falling back "
+                    "to saving them one by one: %s"
+                ),
+                e.cause,
+            )
+            self.logger.debug('Exception',  exc_info=True)
+
+        return dict(
+            (
+                session.address,
+                self._dao.update_vds_kdump_status(
+                    status=session.status,
+                    address=session.address,
+                ),
+            )
+            for session in sessions
+        )
 
     def _save_sessions(self):
         if self._interval_finished(
@@ -211,33 +465,91 @@ class FenceKdumpListener(base.Base):
                 last=self._lastSessionSync
         ):
             # update db state for all updated sessions
-            for session in self._sessions.values():
-                if (
-                    session['dirty'] and
-                    session['status'] != self.SESSION_STATE_CLOSED
-                ):
-                    if not self._dao.update_vds_kdump_status(
-                        status=session['status'],
-                        address=session['address'],
-                    ):
+            dirty_sessions = [
+                self._sessions[address]
+                for address in self._dirtySessions
+            ]
+            if dirty_sessions:
+                results = self._update_vds_kdump_statuses(dirty_sessions)
+                for session in dirty_sessions:
+                    if not results.get(session.address, False):
                         self.logger.debug(
                             (
                                 "Discarding session for unknown host with "
                                 "address '%s'."
                             ),
-                            session['address'][0],
+                            session.address[0],
                         )
-                        # set status to finished to be removed in next step
-                        session['status'] = self.SESSION_STATE_CLOSED
+                        # set status to closed to be removed in next step
+                        self._close_session(session)
 
-                    session['dirty'] = False
-
-                    if session['status'] == self.SESSION_STATE_FINISHED:
+                    elif session.status == self.SESSION_STATE_FINISHED:
                         # mark finished session saved to db as close, so they
                         # can be removed from sessions on next house keeping
-                        session['status'] = self.SESSION_STATE_CLOSED
+                        self._close_session(session)
+
+                self._dirtySessions.difference_update(
+                    session.address for session in dirty_sessions
+                )
 
-            self._lastSessionSync = datetime.datetime.utcnow()
+            if self._spool is not None:
+                # all sessions are saved, spool is not needed anymore
+                self._spool.clear()
+                self._spooled.clear()
+
+            self._lastSessionSync = util.monotonic()
+
+    def _spool_sessions(self):
+        if self._spool is not None:
+            records = [
+                (session.status, session.address)
+                for session in (
+                    self._sessions[address]
+                    for address in self._dirtySessions
+                )
+                if self._spooled.get(session.address) != session.status
+            ]
+            # sessions closed after being spooled must not be restored
+            records.extend(
+                (self.SESSION_STATE_CLOSED, address)
+                for address, status in self._spooled.items()
+                if (
+                    status != self.SESSION_STATE_CLOSED and
+                    address not in self._dirtySessions
+                )
+            )
+            try:
+                self._spool.append(records)
+                self._spooled.update(
+                    (address, status)
+                    for status, address in records
+                )
+            except (IOError, OSError) as e:
+                self.logger.warning(
+                    _(
+                        "Cannot write sessions to spool: {error}"
+                    ).format(
+                        error=e,
+                    )
+                )
+                self.logger.debug('Exception',  exc_info=True)
+            self._lastSpool = util.monotonic()
+
+    def _restore_spooled_sessions(self):
+        if self._spool is not None:
+            for status, address in self._spool.load():
+                self._spooled[address] = status
+                if status != self.SESSION_STATE_CLOSED:
+                    session = self._create_session(
+                        status=status,
+                        address=address,
+                    )
+                    if status == self.SESSION_STATE_DUMPING:
+                        self._schedule_session_expiration(session)
+            self.logger.debug(
+                'Restored %s sessions from spool',
+                len(self._sessions),
+            )
 
     def _create_session(
             self,
@@ -245,12 +557,15 @@ class FenceKdumpListener(base.Base):
             address,
             dirty=True,
     ):
-        return {
-            'status': status,
-            'address': address,
-            'updated': datetime.datetime.utcnow(),
-            'dirty': dirty,
-        }
+        session = Session(
+            address=address,
+            status=status,
+            updated=util.monotonic(),
+        )
+        self._sessions[address] = session
+        if dirty:
+            self._dirtySessions.add(address)
+        return session
 
     def _load_sessions(self):
         if not self._afterFirstDbSync:
@@ -264,7 +579,7 @@ class FenceKdumpListener(base.Base):
                         address=address,
                         dirty=False,
                     )
-                    self._sessions[session['address']] = session
+                    self._schedule_session_expiration(session)
 
             self._afterFirstDbSync = True
 
@@ -279,6 +594,9 @@ class FenceKdumpListener(base.Base):
             )
         ):
             if self._db_manager.validate_connection():
+                if not self._db_connection_valid:
+                    # save sessions spooled during outage immediately
+                    self._lastSessionSync = None
                 self._db_connection_valid = True
                 try:
                     self._heartbeat()
@@ -288,6 +606,8 @@ class FenceKdumpListener(base.Base):
                     self._save_sessions()
                     self._load_sessions()
                 except db.DbException as e:
+                    self._lastDbSyncFailure = util.monotonic()
+                    self._spool_sessions()
                     self.logger.debug(
                         (
                             "Error during synchronization with database, "
@@ -305,26 +625,28 @@ class FenceKdumpListener(base.Base):
                             "synchronization will be postponed."
                         )
                     )
-                self._lastDbConnectionAttempt = datetime.datetime.utcnow()
+                self._lastDbConnectionAttempt = util.monotonic()
+                self._spool_sessions()
+        else:
+            self._spool_sessions()
 
     def run(self):
         while True:
-            (data, address) = self._recvfrom()
-            if address is None:
-                self._house_keeping()
-            else:
+            for data, address in self._receive():
                 entry = self._sessions.get(address)
                 if entry is None:
                     entry = self._create_session(
                         status=self.SESSION_STATE_INITIAL,
                         address=address,
                     )
-                    self._sessions[address] = entry
 
                 self._handle_message(
                     entry=entry,
                     message=data,
                 )
 
+            if util.monotonic() >= self._next_wakeup():
+                self._house_keeping()
+
 
 # vim: expandtab tabstop=4 shiftwidth=4
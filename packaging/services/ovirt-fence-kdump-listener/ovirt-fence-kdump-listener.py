@@ -21,9 +21,11 @@ import sys
 import config
 import db
 import listener
+import spool
 
 
 from ovirt_engine import configfile
+from ovirt_engine import metrics
 from ovirt_engine import service
 
 
@@ -33,8 +35,19 @@ def _(m):
 
 class Daemon(service.Daemon):
 
+    # settings applied while running, by _applyConfig
+    _RELOADABLE = (
+        'HEARTBEAT_INTERVAL',
+        'SESSION_SYNC_INTERVAL',
+        'REOPEN_DB_CONNECTION_INTERVAL',
+        'KDUMP_FINISHED_TIMEOUT',
+    )
+
     def __init__(self):
         super(Daemon, self).__init__()
+        self._metricsServer = None
+        self._server = None
+        self._configWatcher = None
         self._defaults = os.path.abspath(
             os.path.join(
                 os.path.dirname(sys.argv[0]),
@@ -76,6 +89,10 @@ class Daemon(service.Daemon):
                 self._defaults,
                 config.ENGINE_FKLSNR_VARS,
             ),
+            cache=os.path.join(
+                config.ENGINE_CACHE,
+                'ovirt-fence-kdump-listener.conf.json',
+            ),
         )
 
         self._engineConfig = configfile.ConfigFile(
@@ -83,13 +100,78 @@ class Daemon(service.Daemon):
                 self._engineDefaults,
                 config.ENGINE_VARS,
             ),
+            cache=os.path.join(
+                config.ENGINE_CACHE,
+                'ovirt-fence-kdump-listener-engine.conf.json',
+            ),
         )
 
         self._checkInstallation(
             pidfile=self.pidfile,
         )
 
+        validation = self._config.get('DB_CONNECTION_VALIDATION')
+        if validation not in db.DbManager.VALIDATION_MODES:
+            raise RuntimeError(
+                _(
+                    "Invalid DB_CONNECTION_VALIDATION '{validation}', "
+                    "expected one of: {modes}"
+                ).format(
+                    validation=validation,
+                    modes=', '.join(db.DbManager.VALIDATION_MODES),
+                )
+            )
+
+    def _intervals(self):
+        return dict(
+            heartbeat_interval=(
+                self._config.getinteger('HEARTBEAT_INTERVAL')
+            ),
+            session_sync_interval=(
+                self._config.getinteger('SESSION_SYNC_INTERVAL')
+            ),
+            reopen_db_connection_interval=(
+                self._config.getinteger(
+                    'REOPEN_DB_CONNECTION_INTERVAL'
+                )
+            ),
+            session_expiration_time=(
+                self._config.getinteger('KDUMP_FINISHED_TIMEOUT')
+            ),
+        )
+
+    def _applyConfig(self, changes):
+        restart = sorted(set(changes) - set(self._RELOADABLE))
+        if restart:
+            self.logger.warning(
+                _(
+                    'Changes of {keys} are applied on restart'
+                ).format(
+                    keys=', '.join(restart),
+                )
+            )
+        if self._server is not None and set(changes) & set(self._RELOADABLE):
+            self._server.set_intervals(**self._intervals())
+            self.logger.info(_('Listener intervals updated'))
+
+    def daemonReload(self):
+        self._applyConfig(self._config.reload())
+
     def daemonContext(self):
+        if self._config.getboolean('CONFIG_WATCH'):
+            self._configWatcher = self._config.watch(self._applyConfig)
+
+        registry = metrics.Registry()
+        if self._config.getboolean('METRICS_ENABLE'):
+            self._metricsServer = metrics.MetricsServer(
+                registry=registry,
+                address=(
+                    self._config.get('METRICS_ADDRESS'),
+                    self._config.getinteger('METRICS_PORT'),
+                ),
+            )
+            self._metricsServer.start()
+
         with db.DbManager(
                 host=self._engineConfig.get('ENGINE_DB_HOST'),
                 port=self._engineConfig.get('ENGINE_DB_PORT'),
@@ -100,31 +182,41 @@ class Daemon(service.Daemon):
                 secure_validation=self._engineConfig.getboolean(
                     'ENGINE_DB_SECURED_VALIDATION'
                 ),
+                registry=registry,
+                validation=self._config.get('DB_CONNECTION_VALIDATION'),
         ) as db_manager:
 
             with listener.FenceKdumpListener(
-                    bind=(
-                        self._config.get('LISTENER_ADDRESS'),
-                        self._config.getinteger('LISTENER_PORT')
-                    ),
-                    db_manager=db_manager,
-                    heartbeat_interval=(
-                        self._config.getinteger('HEARTBEAT_INTERVAL')
-                    ),
-                    session_sync_interval=(
-                        self._config.getinteger('SESSION_SYNC_INTERVAL')
-                    ),
-                    reopen_db_connection_interval=(
-                        self._config.getinteger(
-                            'REOPEN_DB_CONNECTION_INTERVAL'
+                    binds=[
+                        (address, self._config.getinteger('LISTENER_PORT'))
+                        for address in (
+                            self._config.get('LISTENER_ADDRESS').split() or
+                            ['']
                         )
+                    ],
+                    db_manager=db_manager,
+                    reuse_port=self._config.getboolean('LISTENER_REUSE_PORT'),
+                    receive_buffer_size=self._config.getinteger(
+                        'LISTENER_RECEIVE_BUFFER_SIZE'
                     ),
-                    session_expiration_time=(
-                        self._config.getinteger('KDUMP_FINISHED_TIMEOUT')
+                    registry=registry,
+                    spool=(
+                        spool.SessionSpool(
+                            path=self._config.get('SESSION_SPOOL_FILE'),
+                        ) if self._config.get('SESSION_SPOOL_FILE')
+                        else None
                     ),
+                    **self._intervals()
             ) as server:
+                self._server = server
                 server.run()
 
+    def daemonCleanup(self):
+        if self._configWatcher is not None:
+            self._configWatcher.stop()
+        if self._metricsServer is not None:
+            self._metricsServer.stop()
+
 
 if __name__ == "__main__":
     service.setupLogger()
@@ -0,0 +1,92 @@
+# Copyright (C) 2026 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gettext
+import json
+import os
+
+from ovirt_engine import base
+
+
+def _(m):
+    return gettext.dgettext(message=m, domain='ovirt-fence-kdump-listener')
+
+
+class SessionSpool(base.Base):
+    """Append only file of session statuses not yet saved to database
+
+    Each line contains JSON object with status and address of a session,
+    the last line of an address wins.
+    """
+
+    def __init__(self, path):
+        super(SessionSpool, self).__init__()
+        self._path = path
+        self._empty = not (
+            os.path.exists(self._path) and
+            os.path.getsize(self._path) > 0
+        )
+
+    def load(self):
+        """Returns list of (status, address) of spooled sessions"""
+        sessions = {}
+        if not self._empty:
+            self.logger.debug("Loading sessions from '%s'", self._path)
+            with open(self._path, 'r') as f:
+                for index, line in enumerate(f):
+                    try:
+                        record = json.loads(line)
+                        # address needs to be converted from list to tuple
+                        address = tuple(record['address'])
+                        sessions[address] = record['status']
+                    except (ValueError, KeyError, TypeError):
+                        # last line may be incomplete after crash
+                        self.logger.warning(
+                            _(
+                                "Ignoring invalid record at line {line} "
+                                "of session spool '{path}'."
+                            ).format(
+                                line=index + 1,
+                                path=self._path,
+                            )
+                        )
+        return [(v, k) for k, v in sessions.items()]
+
+    def append(self, sessions):
+        """Appends list of (status, address) and syncs it to disk"""
+        if sessions:
+            with open(self._path, 'a') as f:
+                for status, address in sessions:
+                    f.write(
+                        '%s\n' % json.dumps(
+                            {
+                                'status': status,
+                                'address': address,
+                            }
+                        )
+                    )
+                f.flush()
+                os.fsync(f.fileno())
+            self._empty = False
+
+    def clear(self):
+        if not self._empty:
+            self.logger.debug("Clearing session spool '%s'", self._path)
+            with open(self._path, 'w') as f:
+                f.flush()
+                os.fsync(f.fileno())
+            self._empty = True
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
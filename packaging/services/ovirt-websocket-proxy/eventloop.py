@@ -0,0 +1,1145 @@
+# Copyright (C) 2026 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import collections
+import errno
+import fcntl
+import gettext
+import hashlib
+import os
+import select
+import signal
+import socket
+import ssl
+import struct
+import threading
+import timeit
+
+from ovirt_engine import base
+from ovirt_engine import service
+from telemetry import ProxyTelemetry
+from telemetry import SessionTransfer
+
+
+def _(m):
+    return gettext.dgettext(message=m, domain='ovirt-engine')
+
+
+# RFC 6455 opcodes
+_OP_CONTINUATION = 0x0
+_OP_TEXT = 0x1
+_OP_BINARY = 0x2
+_OP_CLOSE = 0x8
+_OP_PING = 0x9
+_OP_PONG = 0xa
+
+# RFC 6455 close codes
+_CLOSE_NORMAL = 1000
+_CLOSE_PROTOCOL_ERROR = 1002
+_CLOSE_INVALID_DATA = 1007
+_CLOSE_TOO_BIG = 1009
+
+_WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+_MAX_HEADER_SIZE = 10
+
+
+class ProtocolError(Exception):
+    def __init__(self, message, code=_CLOSE_PROTOCOL_ERROR):
+        super(ProtocolError, self).__init__(message)
+        self.code = code
+
+
+# translation tables to xor byte with key
+_XOR_TABLES = [
+    bytes(bytearray(i ^ key for i in range(256)))
+    for key in range(256)
+]
+
+
+def _unmask_into(buf, start, end, mask):
+    """Unmasks websocket payload in bytearray in place
+
+    Every 4th byte is masked by the same key byte, so each of the strided
+    slices is translated at once.
+    """
+    # empty slice assignment would resize the exported buffer
+    for i in range(min(4, end - start)):
+        buf[start + i:end:4] = buf[start + i:end:4].translate(
+            _XOR_TABLES[mask[i]]
+        )
+
+
+def _frame(opcode, payload):
+    size = len(payload)
+    if size < 126:
+        header = struct.pack('>BB', 0x80 | opcode, size)
+    elif size < 0x10000:
+        header = struct.pack('>BBH', 0x80 | opcode, 126, size)
+    else:
+        header = struct.pack('>BBQ', 0x80 | opcode, 127, size)
+    return header + payload
+
+
+def _frame_header_into(buf, end, opcode, size):
+    """Writes frame header just before offset end, returns its start"""
+    if size < 126:
+        start = end - 2
+        struct.pack_into('>BB', buf, start, 0x80 | opcode, size)
+    elif size < 0x10000:
+        start = end - 4
+        struct.pack_into('>BBH', buf, start, 0x80 | opcode, 126, size)
+    else:
+        start = end - _MAX_HEADER_SIZE
+        struct.pack_into('>BBQ', buf, start, 0x80 | opcode, 127, size)
+    return start
+
+
+class _Buffer(object):
+    """Preallocated receive buffer, data is between start and end"""
+
+    def __init__(self, size):
+        self._allocate(size)
+        self.start = 0
+        self.end = 0
+
+    def _allocate(self, size):
+        self.data = bytearray(size)
+        self.view = memoryview(self.data)
+
+    def __len__(self):
+        return self.end - self.start
+
+    def consume(self, size):
+        self.start += size
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def reserve(self, size):
+        """Returns view of at least size free bytes after data"""
+        if len(self.data) - self.end < size:
+            length = len(self)
+            if len(self.data) - length < size:
+                old = self.view[self.start:self.end]
+                self._allocate(max(len(self.data) * 2, length + size))
+                self.view[:length] = old
+            else:
+                # buffer is exported, so it can be only copied in place
+                self.data[:length] = self.data[self.start:self.end]
+            self.start = 0
+            self.end = length
+        return self.view[self.end:]
+
+
+class _Resolver(object):
+    """
+    Resolves target names off the event loop.
+
+    getaddrinfo() may block on dns for seconds, so each lookup runs in
+    its own thread. Results are queued and the loop is woken by a byte
+    written to a pipe, fd is polled by the loop.
+    """
+
+    def __init__(self):
+        self.fd, self._wakeFd = os.pipe()
+        for fd in (self.fd, self._wakeFd):
+            fcntl.fcntl(
+                fd,
+                fcntl.F_SETFL,
+                fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK,
+            )
+        self._results = collections.deque()
+
+    def resolve(self, connection, host, port):
+        thread = threading.Thread(
+            target=self._run,
+            args=(connection, host, port),
+        )
+        thread.daemon = True
+        thread.start()
+
+    def _run(self, connection, host, port):
+        try:
+            result = socket.getaddrinfo(
+                host,
+                port,
+                socket.AF_UNSPEC,
+                socket.SOCK_STREAM,
+            )[0]
+        except socket.error as e:
+            result = e
+        self._results.append((connection, result))
+        try:
+            os.write(self._wakeFd, b'x')
+        except OSError as e:
+            # pipe full, loop is woken already
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def results(self):
+        """Returns completed lookups as (connection, result) pairs"""
+        try:
+            while os.read(self.fd, 0x1000):
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+        results = []
+        while self._results:
+            results.append(self._results.popleft())
+        return results
+
+    def close(self):
+        os.close(self.fd)
+        os.close(self._wakeFd)
+
+
+class _Connection(object):
+    """
+    Websocket client connection proxied to its target.
+
+    Data is received into preallocated buffers. Target data is framed in
+    place, header is written into room reserved before the payload, so
+    frame is sent to client directly from the receive buffer. Client
+    frames are parsed and unmasked in the receive buffer, only the
+    payload is copied to target queue.
+    """
+
+    STATE_DETECT = 'detect'
+    STATE_CLIENT_TLS = 'client-tls'
+    STATE_REQUEST = 'request'
+    STATE_RESOLVE = 'resolve'
+    STATE_CONNECT = 'connect'
+    STATE_TARGET_TLS = 'target-tls'
+    STATE_RELAY = 'relay'
+    STATE_CLOSED = 'closed'
+
+    def __init__(self, proxy, sock, address):
+        self.proxy = proxy
+        self.client = sock
+        self.address = address
+        self.started = timeit.default_timer()
+        self.target = None
+        self.targetHost = None
+        # getaddrinfo() entry or error of target lookup
+        self.resolution = None
+        # set once session is established
+        self.transfer = None
+        self.sslTarget = False
+        self.state = (
+            self.STATE_DETECT if proxy.tls_enabled
+            else self.STATE_REQUEST
+        )
+        self.protocol = None
+        self.closing = False
+        self.clientIn = _Buffer(proxy.READ_SIZE)
+        # target data is received after room for frame header
+        self.targetIn = memoryview(
+            bytearray(_MAX_HEADER_SIZE + proxy.READ_SIZE)
+        )
+        # pending output, strings or views of receive buffers
+        self.clientQueue = collections.deque()
+        self.targetQueue = collections.deque()
+        self.targetQueued = 0
+        # fragments of current base64 message
+        self.message = bytearray()
+        # additional poll events required by tls layer per socket
+        self.wants = {}
+
+    def _recv_into(self, sock, view):
+        """Returns number of bytes received, None if it would block"""
+        self.wants.pop(sock, None)
+        try:
+            return sock.recv_into(view)
+        except ssl.SSLWantReadError:
+            return None
+        except ssl.SSLWantWriteError:
+            self.wants[sock] = select.POLLOUT
+            return None
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return None
+            raise
+
+    def _send(self, sock, data):
+        """Returns number of bytes sent, None if it would block"""
+        self.wants.pop(sock, None)
+        try:
+            return sock.send(data)
+        except ssl.SSLWantWriteError:
+            return None
+        except ssl.SSLWantReadError:
+            self.wants[sock] = select.POLLIN
+            return None
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return None
+            raise
+
+    def _flush(self, sock, queue):
+        """Sends queued data, returns number of bytes sent"""
+        sent = 0
+        while queue:
+            item = queue[0]
+            n = self._send(sock, item)
+            if n is None:
+                break
+            sent += n
+            if n < len(item):
+                queue[0] = memoryview(item)[n:]
+            else:
+                queue.popleft()
+        return sent
+
+    def _handshake(self, sock):
+        """Performs tls handshake step, returns True when complete"""
+        self.wants.pop(sock, None)
+        try:
+            sock.do_handshake()
+            return True
+        except ssl.SSLWantReadError:
+            self.wants[sock] = select.POLLIN
+        except ssl.SSLWantWriteError:
+            self.wants[sock] = select.POLLOUT
+        return False
+
+    def _reject(self, status):
+        self.clientQueue.clear()
+        self.clientQueue.append(
+            (
+                'HTTP/1.1 %s\r\n'
+                'Connection: close\r\n'
+                'Content-Length: 0\r\n'
+                '\r\n'
+            ) % status
+        )
+        self.closing = True
+
+    def _close_websocket(self, code):
+        self.clientQueue.append(_frame(_OP_CLOSE, struct.pack('>H', code)))
+        self.closing = True
+
+    def _queue_target(self, data):
+        self.targetQueue.append(data)
+        self.targetQueued += len(data)
+
+    def _detect(self):
+        try:
+            peek = self.client.recv(1, socket.MSG_PEEK)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return
+            raise
+        if not peek:
+            self.close()
+        elif peek in (b'\x16', b'\x80'):
+            if self.proxy.context is None:
+                self.proxy.logger.debug(
+                    'TLS connection from %s while TLS is not configured',
+                    self.address,
+                )
+                self.close()
+            else:
+                self.client = self.proxy.context.wrap_socket(
+                    self.client,
+                    server_side=True,
+                    do_handshake_on_connect=False,
+                )
+                self.state = self.STATE_CLIENT_TLS
+        elif self.proxy.ssl_only:
+            self.proxy.logger.debug(
+                'Non TLS connection from %s refused',
+                self.address,
+            )
+            self.close()
+        else:
+            self.state = self.STATE_REQUEST
+
+    def _read_request(self):
+        buf = self.clientIn
+        while True:
+            end = buf.data.find(b'\r\n\r\n', buf.start, buf.end)
+            if end != -1:
+                break
+            if len(buf) > self.proxy.MAX_REQUEST_SIZE:
+                self._reject('413 Request Entity Too Large')
+                return
+            n = self._recv_into(
+                self.client,
+                buf.reserve(self.proxy.READ_SIZE),
+            )
+            if n is None:
+                return
+            if not n:
+                self.close()
+                return
+            buf.end += n
+
+        request = buf.view[buf.start:end].tobytes()
+        buf.consume(end + 4 - buf.start)
+        lines = request.split(b'\r\n')
+        try:
+            method, path, version = lines[0].split(b' ')
+        except ValueError:
+            self._reject('400 Bad Request')
+            return
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(b':')
+            headers[name.strip().lower()] = value.strip()
+
+        if (
+            method != b'GET' or
+            headers.get(b'upgrade', b'').lower() != b'websocket' or
+            b'sec-websocket-key' not in headers
+        ):
+            self._reject('400 Bad Request')
+            return
+
+        start = timeit.default_timer()
+        try:
+            host, port, ssl_target = self.proxy.target(path)
+        except Exception as e:
+            self.proxy.telemetry.ticket_decoded(
+                timeit.default_timer() - start
+            )
+            self.proxy.logger.debug(
+                'Invalid ticket from %s: %s',
+                self.address,
+                e,
+            )
+            self.proxy.logger.debug('Exception', exc_info=True)
+            self._reject('403 Forbidden')
+            return
+        self.proxy.telemetry.ticket_decoded(timeit.default_timer() - start)
+
+        protocols = [
+            p.strip()
+            for p in headers.get(b'sec-websocket-protocol', b'').split(b',')
+        ]
+        if b'binary' in protocols:
+            self.protocol = b'binary'
+        elif b'base64' in protocols:
+            self.protocol = b'base64'
+        elif protocols == [b'']:
+            self.protocol = None
+        else:
+            self._reject('400 Bad Request')
+            return
+
+        self.clientQueue.append(
+            (
+                b'HTTP/1.1 101 Switching Protocols\r\n'
+                b'Upgrade: websocket\r\n'
+                b'Connection: Upgrade\r\n'
+                b'Sec-WebSocket-Accept: %s\r\n'
+                b'%s'
+                b'\r\n'
+            ) % (
+                base64.b64encode(
+                    hashlib.sha1(
+                        headers[b'sec-websocket-key'] + _WEBSOCKET_GUID
+                    ).digest()
+                ),
+                (
+                    b'Sec-WebSocket-Protocol: %s\r\n' % self.protocol
+                    if self.protocol else b''
+                ),
+            )
+        )
+        self._open_target(host, port, ssl_target)
+
+    def _open_target(self, host, port, ssl_target):
+        self.proxy.logger.debug(
+            'Connecting %s to %s:%s (ssl: %s)',
+            self.address,
+            host,
+            port,
+            ssl_target,
+        )
+        self.sslTarget = ssl_target
+        self.targetHost = host
+        try:
+            self.resolution = socket.getaddrinfo(
+                host,
+                int(port),
+                socket.AF_UNSPEC,
+                socket.SOCK_STREAM,
+                0,
+                socket.AI_NUMERICHOST,
+            )[0]
+        except socket.gaierror:
+            # host name, lookup must not block the loop
+            self.state = self.STATE_RESOLVE
+            self.proxy.resolver.resolve(self, host, int(port))
+            return
+        self._connect_target()
+
+    def resolved(self, result):
+        """Called by loop once target lookup is completed"""
+        if self.state == self.STATE_RESOLVE:
+            self.resolution = result
+            self.pump()
+
+    def _connect_target(self):
+        if isinstance(self.resolution, Exception):
+            raise self.resolution
+        family, socktype, proto, canonname, sockaddr = self.resolution
+        self.target = socket.socket(family, socktype, proto)
+        self.target.setblocking(False)
+        err = self.target.connect_ex(sockaddr)
+        if err not in (0, errno.EINPROGRESS):
+            raise socket.error(err, os.strerror(err))
+        self.state = self.STATE_CONNECT
+        self.proxy.register(self, self.target)
+
+    def _connect(self):
+        err = self.target.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err != 0:
+            raise socket.error(err, os.strerror(err))
+        try:
+            self.target.getpeername()
+        except socket.error as e:
+            if e.errno == errno.ENOTCONN:
+                # still in progress
+                return
+            raise
+        if self.sslTarget:
+            self.proxy.unregister(self.target)
+            self.target = self.proxy.targetContext.wrap_socket(
+                self.target,
+                do_handshake_on_connect=False,
+            )
+            self.proxy.register(self, self.target)
+            self.state = self.STATE_TARGET_TLS
+        else:
+            self._established()
+
+    def _established(self):
+        self.state = self.STATE_RELAY
+        self.proxy.telemetry.handshake_completed(
+            timeit.default_timer() - self.started
+        )
+        self.proxy.telemetry.session_started(self.targetHost)
+        self.transfer = SessionTransfer(
+            self.proxy.telemetry,
+            self.targetHost,
+        )
+
+    def _parse_frames(self):
+        buf = self.clientIn
+        while len(buf) >= 2:
+            start = buf.start
+            fin = buf.data[start] & 0x80
+            opcode = buf.data[start] & 0x0f
+            masked = buf.data[start + 1] & 0x80
+            size = buf.data[start + 1] & 0x7f
+            pos = start + 2
+            if size == 126:
+                if len(buf) < 4:
+                    break
+                size = struct.unpack_from('>H', buf.data, pos)[0]
+                pos += 2
+            elif size == 127:
+                if len(buf) < 10:
+                    break
+                size = struct.unpack_from('>Q', buf.data, pos)[0]
+                pos += 8
+            if not masked:
+                raise ProtocolError('Client frame is not masked')
+            if size > self.proxy.MAX_MESSAGE_SIZE:
+                raise ProtocolError('Frame too big', code=_CLOSE_TOO_BIG)
+            if buf.end < pos + 4 + size:
+                # make room for rest of the frame
+                buf.reserve(pos + 4 + size - buf.end)
+                break
+
+            _unmask_into(
+                buf.data,
+                pos + 4,
+                pos + 4 + size,
+                buf.data[pos:pos + 4],
+            )
+            payload = buf.view[pos + 4:pos + 4 + size].tobytes()
+            buf.consume(pos + 4 + size - start)
+            self._handle_frame(fin, opcode, payload)
+
+    def _handle_frame(self, fin, opcode, payload):
+        if opcode in (_OP_CONTINUATION, _OP_TEXT, _OP_BINARY):
+            if self.protocol == b'base64':
+                self.message += payload
+                if len(self.message) > self.proxy.MAX_MESSAGE_SIZE:
+                    raise ProtocolError(
+                        'Message too big',
+                        code=_CLOSE_TOO_BIG,
+                    )
+                if fin:
+                    try:
+                        data = base64.b64decode(bytes(self.message))
+                    except (TypeError, ValueError) as e:
+                        # TypeError on python2, binascii.Error on python3
+                        raise ProtocolError(
+                            'Invalid base64 message: %s' % e,
+                            code=_CLOSE_INVALID_DATA,
+                        )
+                    self._queue_target(data)
+                    del self.message[:]
+            elif payload:
+                self._queue_target(payload)
+        elif opcode == _OP_CLOSE:
+            self.proxy.logger.debug('Client %s closed', self.address)
+            self.clientQueue.append(_frame(_OP_CLOSE, payload[:2]))
+            self.closing = True
+        elif opcode == _OP_PING:
+            self.clientQueue.append(_frame(_OP_PONG, payload))
+        elif opcode != _OP_PONG:
+            raise ProtocolError('Unknown opcode %s' % opcode)
+
+    def _read_client(self):
+        progress = False
+        while (
+            not self.closing and
+            self.targetQueued < self.proxy.BUFFER_LIMIT
+        ):
+            n = self._recv_into(
+                self.client,
+                self.clientIn.reserve(self.proxy.READ_SIZE),
+            )
+            if n is None:
+                break
+            if not n:
+                self.close()
+                break
+            progress = True
+            self.clientIn.end += n
+            try:
+                self._parse_frames()
+            except ProtocolError as e:
+                self.proxy.logger.debug(
+                    'Protocol error from %s: %s',
+                    self.address,
+                    e,
+                )
+                self._close_websocket(e.code)
+        return progress
+
+    def _read_target(self):
+        # receive buffer is reused once its frame is sent to client
+        progress = False
+        while not self.closing and not self.clientQueue:
+            n = self._recv_into(
+                self.target,
+                self.targetIn[_MAX_HEADER_SIZE:],
+            )
+            if n is None:
+                break
+            progress = True
+            if not n:
+                self.proxy.logger.debug(
+                    'Target of %s closed',
+                    self.address,
+                )
+                self._close_websocket(_CLOSE_NORMAL)
+                break
+            self.transfer.add(received=n)
+            if self.protocol == b'base64':
+                self.clientQueue.append(
+                    _frame(
+                        _OP_TEXT,
+                        base64.b64encode(
+                            self.targetIn[
+                                _MAX_HEADER_SIZE:_MAX_HEADER_SIZE + n
+                            ]
+                        ),
+                    )
+                )
+            else:
+                self.clientQueue.append(
+                    self.targetIn[
+                        _frame_header_into(
+                            self.targetIn,
+                            _MAX_HEADER_SIZE,
+                            _OP_BINARY,
+                            n,
+                        ):_MAX_HEADER_SIZE + n
+                    ]
+                )
+        return progress
+
+    def _relay(self):
+        # data buffered by tls layer is not signaled by poll, so keep
+        # going until nothing can be moved without blocking
+        progress = True
+        while progress and self.state != self.STATE_CLOSED:
+            progress = self._read_client()
+            if self.state == self.STATE_RELAY:
+                sent = self._flush(self.target, self.targetQueue)
+                self.targetQueued -= sent
+                if sent:
+                    self.transfer.add(sent=sent)
+                progress |= sent > 0
+                progress |= self._read_target()
+            if self.state != self.STATE_CLOSED:
+                progress |= self._flush(self.client, self.clientQueue) > 0
+
+    def pump(self):
+        """Advances connection as far as possible without blocking"""
+        try:
+            if self.state == self.STATE_DETECT:
+                self._detect()
+            if self.state == self.STATE_CLIENT_TLS:
+                try:
+                    if self._handshake(self.client):
+                        self.state = self.STATE_REQUEST
+                except ssl.SSLError:
+                    self.proxy.telemetry.tls_handshake_failed()
+                    raise
+            if self.state == self.STATE_REQUEST and not self.closing:
+                self._read_request()
+            if (
+                self.state == self.STATE_RESOLVE and
+                self.resolution is not None
+            ):
+                self._connect_target()
+            if self.state == self.STATE_CONNECT:
+                self._connect()
+            if self.state == self.STATE_TARGET_TLS:
+                if self._handshake(self.target):
+                    self._established()
+            if self.state in (
+                self.STATE_CONNECT,
+                self.STATE_TARGET_TLS,
+                self.STATE_RELAY,
+            ):
+                self._relay()
+            if self.state != self.STATE_CLOSED:
+                self._flush(self.client, self.clientQueue)
+                if self.closing and not self.clientQueue:
+                    self.close()
+        except (socket.error, ssl.SSLError) as e:
+            self.proxy.logger.debug(
+                'Connection %s failed: %s',
+                self.address,
+                e,
+            )
+            if self.state == self.STATE_RELAY:
+                self.proxy.logger.debug('Exception', exc_info=True)
+            self.close()
+        except Exception:
+            # never let single connection take down the whole worker
+            self.proxy.logger.error(
+                _('Connection {address} failed').format(
+                    address=self.address,
+                ),
+                exc_info=True,
+            )
+            self.close()
+
+        if self.state != self.STATE_CLOSED:
+            self.proxy.modify(self.client, self._client_events())
+            if self.target is not None:
+                self.proxy.modify(self.target, self._target_events())
+
+    def _client_events(self):
+        events = self.wants.get(self.client, 0)
+        if self.state in (self.STATE_DETECT, self.STATE_REQUEST):
+            events |= select.POLLIN
+        elif self.state not in (
+            self.STATE_CLIENT_TLS,
+            self.STATE_RESOLVE,
+        ):
+            if (
+                not self.closing and
+                self.targetQueued < self.proxy.BUFFER_LIMIT
+            ):
+                events |= select.POLLIN
+        if self.clientQueue:
+            events |= select.POLLOUT
+        return events
+
+    def _target_events(self):
+        events = self.wants.get(self.target, 0)
+        if self.state == self.STATE_CONNECT:
+            events |= select.POLLOUT
+        elif self.state == self.STATE_RELAY:
+            if not self.closing and not self.clientQueue:
+                events |= select.POLLIN
+            if self.targetQueue:
+                events |= select.POLLOUT
+        return events
+
+    def close(self):
+        if self.state != self.STATE_CLOSED:
+            self.state = self.STATE_CLOSED
+            for sock in (self.client, self.target):
+                if sock is not None:
+                    self.proxy.unregister(sock)
+                    sock.close()
+            if self.transfer is not None:
+                self.transfer.flush()
+                self.proxy.telemetry.session_ended(self.targetHost)
+                self.proxy.logger.debug(
+                    'Session %s to %s closed after %.1f s, '
+                    'in %d bytes, out %d bytes',
+                    self.address,
+                    self.targetHost,
+                    timeit.default_timer() - self.started,
+                    self.transfer.received,
+                    self.transfer.sent,
+                )
+            self.proxy.connection_closed()
+
+
+class EventLoopProxy(base.Base):
+    """
+    Websocket proxy multiplexing all connections in a single event loop.
+
+    Unlike websockify, which forks per connection, connections are
+    handled by one process, optionally by several worker processes
+    accepting from the same listening socket.
+
+    target is called with request path and returns tuple of target
+    host, port and whether target uses tls.
+
+    telemetry, if set, is ProxyTelemetry owned by the calling process,
+    workers send their updates to it.
+    """
+
+    READ_SIZE = 0x10000
+    # reading client is paused while target has this many bytes queued,
+    # target is not read until its previous frame is sent to client
+    BUFFER_LIMIT = 0x40000
+    MAX_REQUEST_SIZE = 0x4000
+    MAX_MESSAGE_SIZE = 0x1000000
+    # how often supervisor checks workers
+    POLL_INTERVAL = 1
+    # worker exiting sooner than this after start is restarted with
+    # delay, doubled on each such exit up to maximum
+    RESTART_STABLE = 60
+    RESTART_DELAY = 1
+    RESTART_DELAY_MAX = 60
+    # consecutive early exits logged as error
+    RESTART_FAILURES = 5
+    # accepting is paused this long when out of file descriptors,
+    # unless a connection is closed earlier
+    ACCEPT_PAUSE = 1
+    ACCEPT_WARNING_INTERVAL = 60
+
+    def __init__(
+        self,
+        listen_host,
+        listen_port,
+        target,
+        source_is_ipv6=False,
+        cert=None,
+        key=None,
+        ssl_only=False,
+        workers=1,
+        telemetry=None,
+    ):
+        super(EventLoopProxy, self).__init__()
+        self._listenHost = listen_host
+        self._listenPort = listen_port
+        self._sourceIsIpv6 = source_is_ipv6
+        self._workers = workers
+        self.target = target
+        self.telemetry = telemetry or ProxyTelemetry()
+        self.ssl_only = ssl_only
+        self.context = None
+        if cert and os.path.exists(cert):
+            self.context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+            self.context.load_cert_chain(
+                certfile=cert,
+                keyfile=key or None,
+            )
+        self.tls_enabled = self.context is not None or ssl_only
+        # like websockify, target certificate is not verified
+        self.targetContext = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        self._sock = None
+        self._poller = None
+        # created by loop, so each worker owns its pipe
+        self.resolver = None
+        # fd -> (connection, socket)
+        self._fds = {}
+        # fd -> registered events
+        self._events = {}
+        # pid -> start time of workers, in supervisor
+        self._children = {}
+        # deadline of paused accepting
+        self._acceptResume = None
+        self._acceptWarned = None
+        # set while listening socket is bound
+        self.listening = threading.Event()
+
+    def _listen(self):
+        addrs = socket.getaddrinfo(
+            None if self._listenHost in ('', '*') else self._listenHost,
+            self._listenPort,
+            socket.AF_UNSPEC,
+            socket.SOCK_STREAM,
+            socket.IPPROTO_TCP,
+            socket.AI_PASSIVE,
+        )
+        addrs.sort(
+            key=lambda a: (a[0] == socket.AF_INET6) != self._sourceIsIpv6
+        )
+        family, socktype, proto, canonname, sockaddr = addrs[0]
+        sock = socket.socket(family, socktype, proto)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(sockaddr)
+            sock.listen(socket.SOMAXCONN)
+            sock.setblocking(False)
+        except Exception:
+            sock.close()
+            raise
+        self.logger.debug('Listening on %s', sockaddr)
+        return sock
+
+    def register(self, connection, sock):
+        self._fds[sock.fileno()] = (connection, sock)
+        self._events[sock.fileno()] = 0
+        self._poller.register(sock.fileno(), 0)
+
+    def unregister(self, sock):
+        fd = sock.fileno()
+        if self._fds.pop(fd, None) is not None:
+            del self._events[fd]
+            self._poller.unregister(fd)
+
+    def modify(self, sock, events):
+        fd = sock.fileno()
+        if self._events.get(fd) != events:
+            self._events[fd] = events
+            self._poller.modify(fd, events)
+
+    def _accept(self):
+        while True:
+            try:
+                sock, address = self._sock.accept()
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    break
+                if e.errno in (errno.EMFILE, errno.ENFILE):
+                    self._pause_accept(e)
+                    break
+                if e.errno == errno.ECONNABORTED:
+                    self.logger.warning(
+                        _('Cannot accept connection: {error}').format(
+                            error=e,
+                        )
+                    )
+                    break
+                raise
+            self.logger.debug('Connection from %s', address)
+            sock.setblocking(False)
+            connection = _Connection(self, sock, address)
+            self.register(connection, sock)
+            connection.pump()
+
+    def _pause_accept(self, error):
+        """Stops polling listening socket, it stays readable meanwhile"""
+        now = timeit.default_timer()
+        if (
+            self._acceptWarned is None or
+            now - self._acceptWarned >= self.ACCEPT_WARNING_INTERVAL
+        ):
+            self._acceptWarned = now
+            self.logger.warning(
+                _(
+                    'Cannot accept connection, pausing accept: {error}'
+                ).format(
+                    error=error,
+                )
+            )
+        else:
+            self.logger.debug('Cannot accept connection: %s', error)
+        self._acceptResume = now + self.ACCEPT_PAUSE
+        self._poller.modify(self._sock.fileno(), 0)
+
+    def _resume_accept(self):
+        if self._acceptResume is not None:
+            self._acceptResume = None
+            self._poller.modify(self._sock.fileno(), select.POLLIN)
+
+    def connection_closed(self):
+        """Called by connection once its sockets are closed"""
+        self._resume_accept()
+
+    def _loop(self):
+        self._poller = select.poll()
+        self._poller.register(self._sock.fileno(), select.POLLIN)
+        self.resolver = _Resolver()
+        self._poller.register(self.resolver.fd, select.POLLIN)
+        while True:
+            timeout = None
+            if self._acceptResume is not None:
+                timeout = max(
+                    0,
+                    1 + int(
+                        (self._acceptResume - timeit.default_timer()) * 1000
+                    ),
+                )
+            try:
+                events = self._poller.poll(timeout)
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if (
+                self._acceptResume is not None and
+                timeit.default_timer() >= self._acceptResume
+            ):
+                self._resume_accept()
+            for fd, event in events:
+                if fd == self._sock.fileno():
+                    self._accept()
+                elif fd == self.resolver.fd:
+                    for connection, result in self.resolver.results():
+                        connection.resolved(result)
+                else:
+                    entry = self._fds.get(fd)
+                    # connection may be closed by previous event
+                    if entry is not None:
+                        entry[0].pump()
+
+    def _worker(self):
+        # threads of supervisor may have logged at fork
+        service.resetLoggingLocks()
+        self._children = {}
+        # terminate immediately, the supervisor handles cleanup
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, signal.SIG_DFL)
+        status = 0
+        try:
+            self._loop()
+        except Exception:
+            self.logger.error(_('Worker failed'), exc_info=True)
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _wait(self, deadline=None):
+        """
+        Waits for worker exit, applying telemetry of workers meanwhile.
+
+        Returns pid and status, None if deadline passed first.
+        """
+        while True:
+            if self._children:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+                if pid != 0:
+                    return pid, status
+            timeout = self.POLL_INTERVAL
+            if deadline is not None:
+                timeout = min(timeout, deadline - timeit.default_timer())
+                if timeout <= 0:
+                    return None
+            try:
+                select.select([self.telemetry], [], [], timeout)
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+            self.telemetry.receive()
+
+    def signal_workers(self, signum):
+        """Sends signal to workers, no-op within worker or single process"""
+        for pid in self._children:
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                pass
+
+    def _supervise(self):
+        children = self._children
+        # consecutive early exits and delay of next restart
+        failures = 0
+        delay = 0
+        restart = None
+        try:
+            while True:
+                if restart is None or timeit.default_timer() >= restart:
+                    restart = None
+                    while len(children) < self._workers:
+                        pid = os.fork()
+                        if pid == 0:
+                            self._worker()
+                        children[pid] = timeit.default_timer()
+                exited = self._wait(restart)
+                if exited is None:
+                    continue
+                pid, status = exited
+                started = children.pop(pid, None)
+                if (
+                    started is not None and
+                    timeit.default_timer() - started >= self.RESTART_STABLE
+                ):
+                    failures = 0
+                    delay = 0
+                else:
+                    failures += 1
+                    delay = min(
+                        max(delay * 2, self.RESTART_DELAY),
+                        self.RESTART_DELAY_MAX,
+                    )
+                restart = timeit.default_timer() + delay
+                if failures >= self.RESTART_FAILURES:
+                    self.logger.error(
+                        _(
+                            'Worker {pid} exited with status {status}, '
+                            '{failures} workers exited shortly after start, '
+                            'restarting in {delay} seconds.'
+                        ).format(
+                            pid=pid,
+                            status=status,
+                            failures=failures,
+                            delay=delay,
+                        )
+                    )
+                else:
+                    self.logger.warning(
+                        _(
+                            'Worker {pid} exited with status {status}, '
+                            'restarting in {delay} seconds.'
+                        ).format(
+                            pid=pid,
+                            status=status,
+                            delay=delay,
+                        )
+                    )
+        finally:
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                    os.waitpid(pid, 0)
+                except OSError:
+                    pass
+
+    def serve_forever(self):
+        self._sock = self._listen()
+        self.listening.set()
+        try:
+            if self._workers > 1:
+                self._supervise()
+            else:
+                self._loop()
+        finally:
+            self.listening.clear()
+            self._sock.close()
+            if self.resolver is not None:
+                self.resolver.close()
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
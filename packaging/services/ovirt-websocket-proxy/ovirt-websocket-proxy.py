@@ -14,18 +14,28 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import errno
+import fcntl
 import gettext
 import json
 import os
+import select
+import signal
+import ssl
 import sys
+import threading
+import timeit
 import urllib
 
 import websockify
 
 import config
+import eventloop
+import telemetry
 
 
 from ovirt_engine import configfile
+from ovirt_engine import metrics
 from ovirt_engine import service
 from ovirt_engine import ticket
 
@@ -43,9 +53,123 @@ def _(m):
     return gettext.dgettext(message=m, domain='ovirt-engine')
 
 
+def ticket_target(ticketDecoder, path):
+    """
+    Decodes ticket from request path, returns tuple of target host,
+    target port and whether the target uses ssl.
+    """
+    connection_data = json.loads(urllib.unquote(
+        ticketDecoder.decode(path[1:])))
+    return (
+        connection_data['host'].encode('utf8'),
+        connection_data['port'].encode('utf8'),
+        connection_data['ssl_target'],
+    )
+
+
+class SharedTicketCache(ticket.TicketCache):
+    """
+    Ticket cache shared by connection handlers.
+
+    websockify handles each connection in a forked child, so tickets
+    verified by children are sent to the parent over a pipe and received
+    while the parent waits for connections, to be inherited by the next
+    children. Records carry generation of the cache, so entries sent by
+    children forked before clear() are dropped.
+    """
+
+    def __init__(self, size):
+        super(SharedTicketCache, self).__init__(size)
+        self._pid = os.getpid()
+        self._generation = 0
+        # clear() may be called by config watcher thread
+        self._lock = threading.Lock()
+        self._pending = ''
+        self._rfd, self._wfd = os.pipe()
+        for fd in (self._rfd, self._wfd):
+            fcntl.fcntl(
+                fd,
+                fcntl.F_SETFL,
+                fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK,
+            )
+
+    def put(self, digest, validTo, data):
+        super(SharedTicketCache, self).put(digest, validTo, data)
+        if os.getpid() != self._pid:
+            record = '%s\n' % json.dumps({
+                'generation': self._generation,
+                'digest': digest,
+                'validTo': ticket.TicketEncoder._formatDate(validTo),
+                'data': data,
+            })
+            # writes up to PIPE_BUF are atomic, larger records are not shared
+            if len(record) <= select.PIPE_BUF:
+                try:
+                    os.write(self._wfd, record)
+                except OSError as e:
+                    # parent is not reading, entry is just not shared
+                    if e.errno != errno.EAGAIN:
+                        raise
+
+    def receive(self):
+        """Receives tickets verified by children, called by parent"""
+        while True:
+            try:
+                chunk = os.read(self._rfd, 0x10000)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    break
+                raise
+            if not chunk:
+                break
+            self._pending += chunk
+
+        lines = self._pending.split('\n')
+        self._pending = lines.pop()
+        with self._lock:
+            for line in lines:
+                record = json.loads(line)
+                if record['generation'] != self._generation:
+                    continue
+                super(SharedTicketCache, self).put(
+                    record['digest'],
+                    ticket.TicketDecoder._parseDate(record['validTo']),
+                    record['data'],
+                )
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            super(SharedTicketCache, self).clear()
+
+
+class _CountingSocket(object):
+    """Target socket wrapper counting relayed bytes"""
+
+    def __init__(self, sock, transfer):
+        self._sock = sock
+        self._transfer = transfer
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+    def recv(self, *args, **kwargs):
+        data = self._sock.recv(*args, **kwargs)
+        self._transfer.add(received=len(data))
+        return data
+
+    def send(self, *args, **kwargs):
+        sent = self._sock.send(*args, **kwargs)
+        self._transfer.add(sent=sent)
+        return sent
+
+
 class OvirtProxyRequestHandler(websockify.ProxyRequestHandler):
     def __init__(self, retsock, address, proxy, *args, **kwargs):
         self._proxy = proxy
+        # whole request is handled within base constructor
+        self._started = timeit.default_timer()
+        self._targetHost = None
         websockify.ProxyRequestHandler.__init__(self, retsock, address, proxy,
                                                 *args, **kwargs)
 
@@ -56,13 +180,38 @@ class OvirtProxyRequestHandler(websockify.ProxyRequestHandler):
         target_host and target_port if successful and sets an ssl_target
         flag.
         """
-        connection_data = json.loads(urllib.unquote(
-            self._proxy._ticketDecoder.decode(path[1:])))
-        target_host = connection_data['host'].encode('utf8')
-        target_port = connection_data['port'].encode('utf8')
-        self.server.ssl_target = connection_data['ssl_target']
+        start = timeit.default_timer()
+        try:
+            target_host, target_port, self.server.ssl_target = ticket_target(
+                self._proxy._ticketDecoder,
+                path,
+            )
+        finally:
+            self._proxy._telemetry.ticket_decoded(
+                timeit.default_timer() - start
+            )
+        self._targetHost = target_host
         return (target_host, target_port)
 
+    def do_proxy(self, target):
+        proxyTelemetry = self._proxy._telemetry
+        proxyTelemetry.handshake_completed(
+            timeit.default_timer() - self._started
+        )
+        proxyTelemetry.session_started(self._targetHost)
+        transfer = telemetry.SessionTransfer(
+            proxyTelemetry,
+            self._targetHost,
+        )
+        try:
+            websockify.ProxyRequestHandler.do_proxy(
+                self,
+                _CountingSocket(target, transfer),
+            )
+        finally:
+            transfer.flush()
+            proxyTelemetry.session_ended(self._targetHost)
+
 
 class OvirtWebSocketProxy(websockify.WebSocketProxy):
     """"
@@ -72,17 +221,72 @@ class OvirtWebSocketProxy(websockify.WebSocketProxy):
 
     def __init__(self, *args, **kwargs):
         self._ticketDecoder = kwargs.pop('ticketDecoder')
+        self._ticketCache = kwargs.pop('ticketCache', None)
+        self._telemetry = (
+            kwargs.pop('telemetry', None) or
+            telemetry.ProxyTelemetry()
+        )
         self._logger = kwargs.pop('logger')
+        # set while listening socket is bound
+        self.listening = threading.Event()
         super(OvirtWebSocketProxy, self).__init__(*args, **kwargs)
 
     def get_logger(self):
         return self._logger
 
+    def started(self):
+        # called by start_server once listening socket is bound
+        super(OvirtWebSocketProxy, self).started()
+        self.listening.set()
+
+    def set_ticket_decoder(self, ticketDecoder):
+        """Decoder of connections accepted from now on"""
+        self._ticketDecoder = ticketDecoder
+
+    def top_new_client(self, *args, **kwargs):
+        # called in child forked per connection, while stats server and
+        # config watcher threads of parent may log
+        service.resetLoggingLocks()
+        return super(OvirtWebSocketProxy, self).top_new_client(
+            *args,
+            **kwargs
+        )
+
+    def do_handshake(self, sock, address):
+        try:
+            return super(OvirtWebSocketProxy, self).do_handshake(
+                sock,
+                address,
+            )
+        except ssl.SSLError:
+            self._telemetry.tls_handshake_failed()
+            raise
+
+    def poll(self):
+        super(OvirtWebSocketProxy, self).poll()
+        if self._ticketCache is not None:
+            self._ticketCache.receive()
+        self._telemetry.receive()
+
 
 class Daemon(service.Daemon):
 
+    MODE_WEBSOCKIFY = 'websockify'
+    MODE_EVENTLOOP = 'eventloop'
+
+    # settings applied while running, by _applyConfig
+    _RELOADABLE = (
+        'CERT_FOR_DATA_VERIFICATION',
+    )
+
     def __init__(self):
         super(Daemon, self).__init__()
+        self._proxy = None
+        self._peer = None
+        self._ticketCache = None
+        self._ticketDecoder = None
+        self._configWatcher = None
+        self._metricsServer = None
         self._defaults = os.path.abspath(
             os.path.join(
                 os.path.dirname(sys.argv[0]),
@@ -110,6 +314,16 @@ class Daemon(service.Daemon):
                 mustExist=False,
             )
 
+        if self._config.get('PROXY_MODE') not in (
+            self.MODE_WEBSOCKIFY,
+            self.MODE_EVENTLOOP,
+        ):
+            raise RuntimeError(
+                _("Invalid PROXY_MODE '{mode}'.").format(
+                    mode=self._config.get('PROXY_MODE'),
+                )
+            )
+
         if (
             self._config.getboolean('SSL_ONLY') and
             (
@@ -141,35 +355,112 @@ class Daemon(service.Daemon):
                 self._defaults,
                 config.ENGINE_WSPROXY_VARS,
             ),
+            cache=os.path.join(
+                config.ENGINE_CACHE,
+                'ovirt-websocket-proxy.conf.json',
+            ),
         )
 
         self._checkInstallation(
             pidfile=self.pidfile,
         )
 
-    def daemonContext(self):
+    def _readPeer(self):
         with open(
             self._config.get(
                 'CERT_FOR_DATA_VERIFICATION'
             )
         ) as f:
-            peer = f.read()
+            return f.read()
+
+    def _createTicketDecoder(self):
+        return ticket.TicketDecoder(
+            ca=None,
+            eku=None,
+            peer=self._peer,
+            cache=self._ticketCache,
+            backend=self._config.get('TICKET_CRYPTO_BACKEND') or None,
+        )
+
+    def _applyConfig(self, changes):
+        restart = sorted(set(changes) - set(self._RELOADABLE))
+        if restart:
+            self.logger.warning(
+                _(
+                    'Changes of {keys} are applied on restart'
+                ).format(
+                    keys=', '.join(restart),
+                )
+            )
+
+        # certificate may be replaced in place
+        peer = self._readPeer()
+        if peer != self._peer:
+            self._peer = peer
+            self._ticketDecoder = self._createTicketDecoder()
+            if isinstance(self._proxy, OvirtWebSocketProxy):
+                self._proxy.set_ticket_decoder(self._ticketDecoder)
+            # tickets verified by previous certificate are not trusted,
+            # event loop workers clear their caches on SIGHUP below
+            if self._ticketCache is not None:
+                self._ticketCache.clear()
+            self.logger.info(_('Data verification certificate reloaded'))
+
+        if isinstance(self._proxy, eventloop.EventLoopProxy):
+            self._proxy.signal_workers(signal.SIGHUP)
+
+    def daemonReload(self):
+        self._applyConfig(self._config.reload())
+
+    def daemonCleanup(self):
+        if self._configWatcher is not None:
+            self._configWatcher.stop()
+        if self._metricsServer is not None:
+            self._metricsServer.stop()
+
+    def daemonReadiness(self):
+        """Whether listening socket of this proxy is bound"""
+        proxy = self._proxy
+        return proxy is not None and proxy.listening.is_set()
+
+    def daemonContext(self):
+        self._peer = self._readPeer()
+
+        if self._config.getboolean('CONFIG_WATCH'):
+            self._configWatcher = self._config.watch(self._applyConfig)
+
+        registry = metrics.Registry()
+        proxyTelemetry = telemetry.ProxyTelemetry(registry=registry)
+        if self._config.getboolean('STATS_ENABLE'):
+            self._metricsServer = metrics.MetricsServer(
+                registry=registry,
+                address=self._config.get('STATS_SOCKET'),
+            )
+            self._metricsServer.start()
+
+        if self._config.get('PROXY_MODE') == self.MODE_EVENTLOOP:
+            self._eventLoopContext(proxyTelemetry)
+            return
 
         if websockify_has_plugins():
             kwargs = {'token_plugin': 'TokenFile'}
         else:
             kwargs = {'target_cfg': '/dummy'}
 
-        OvirtWebSocketProxy(
+        if self._config.getinteger('TICKET_CACHE_SIZE') > 0:
+            self._ticketCache = SharedTicketCache(
+                size=self._config.getinteger('TICKET_CACHE_SIZE'),
+            )
+        self._ticketDecoder = self._createTicketDecoder()
+
+        self._proxy = OvirtWebSocketProxy(
             listen_host=self._config.get('PROXY_HOST'),
             listen_port=self._config.get('PROXY_PORT'),
             source_is_ipv6=self._config.getboolean('SOURCE_IS_IPV6'),
             verbose=self.debug,
-            ticketDecoder=ticket.TicketDecoder(
-                ca=None,
-                eku=None,
-                peer=peer,
-            ),
+            ticketDecoder=self._ticketDecoder,
+            ticketCache=self._ticketCache,
+            telemetry=proxyTelemetry,
             logger=self._logger,
             cert=self._config.get('SSL_CERTIFICATE'),
             key=self._config.get('SSL_KEY'),
@@ -186,7 +477,33 @@ class Daemon(service.Daemon):
             wrap_cmd=None,
             RequestHandlerClass=OvirtProxyRequestHandler,
             **kwargs
-        ).start_server()
+        )
+        try:
+            self._proxy.start_server()
+        finally:
+            self._proxy.listening.clear()
+
+    def _eventLoopContext(self, proxyTelemetry):
+        # all connections of a worker share its process, so its own
+        # cache is sufficient
+        if self._config.getinteger('TICKET_CACHE_SIZE') > 0:
+            self._ticketCache = ticket.TicketCache(
+                size=self._config.getinteger('TICKET_CACHE_SIZE'),
+            )
+        self._ticketDecoder = self._createTicketDecoder()
+        self._proxy = eventloop.EventLoopProxy(
+            listen_host=self._config.get('PROXY_HOST'),
+            listen_port=self._config.getinteger('PROXY_PORT'),
+            # workers reload on SIGHUP too, see _applyConfig
+            target=lambda path: ticket_target(self._ticketDecoder, path),
+            source_is_ipv6=self._config.getboolean('SOURCE_IS_IPV6'),
+            cert=self._config.get('SSL_CERTIFICATE'),
+            key=self._config.get('SSL_KEY'),
+            ssl_only=self._config.getboolean('SSL_ONLY'),
+            workers=self._config.getinteger('PROXY_WORKERS'),
+            telemetry=proxyTelemetry,
+        )
+        self._proxy.serve_forever()
 
 
 if __name__ == '__main__':
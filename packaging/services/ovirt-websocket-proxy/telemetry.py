@@ -0,0 +1,190 @@
+# Copyright (C) 2026 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import fcntl
+import json
+import os
+import select
+
+from ovirt_engine import base
+from ovirt_engine import metrics
+from ovirt_engine import util
+
+
+class ProxyTelemetry(base.Base):
+    """
+    Aggregate counters of websocket proxy.
+
+    Counters are kept by the process which created the instance, the
+    one serving the stats socket. Connections handled by forked
+    processes, websockify children or event loop workers, send their
+    updates over a pipe, the owner applies them in receive().
+    """
+
+    def __init__(self, registry=None):
+        super(ProxyTelemetry, self).__init__()
+        registry = registry or metrics.Registry()
+        self._sessions = registry.gauge(
+            name='ovirt_websocket_proxy_sessions',
+            help='Active console sessions',
+        )
+        self._sessionsTotal = registry.counter(
+            name='ovirt_websocket_proxy_sessions_total',
+            help='Console sessions established',
+        )
+        self._bytes = registry.counter(
+            name='ovirt_websocket_proxy_bytes_total',
+            help=(
+                'Bytes relayed per target host, in is received from '
+                'target, out is sent to target'
+            ),
+        )
+        self._ticketDecode = registry.histogram(
+            name='ovirt_websocket_proxy_ticket_decode_seconds',
+            help='Duration of ticket decoding and verification',
+        )
+        self._handshake = registry.histogram(
+            name='ovirt_websocket_proxy_handshake_seconds',
+            help='Duration from client connection to established session',
+        )
+        self._tlsFailures = registry.counter(
+            name='ovirt_websocket_proxy_tls_handshake_failures_total',
+            help='Failed client TLS handshakes',
+        )
+        self._pid = os.getpid()
+        self._pending = ''
+        self._rfd, self._wfd = os.pipe()
+        for fd in (self._rfd, self._wfd):
+            fcntl.fcntl(
+                fd,
+                fcntl.F_SETFL,
+                fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK,
+            )
+
+    def fileno(self):
+        """Pipe of updates sent by forked processes"""
+        return self._rfd
+
+    def _post(self, name, *args):
+        if os.getpid() == self._pid:
+            getattr(self, '_apply_%s' % name)(*args)
+        else:
+            record = '%s\n' % json.dumps([name, args])
+            # writes up to PIPE_BUF are atomic
+            if len(record) <= select.PIPE_BUF:
+                try:
+                    os.write(self._wfd, record)
+                except OSError as e:
+                    # owner is not reading, update is lost
+                    if e.errno != errno.EAGAIN:
+                        raise
+
+    def _apply_session(self, host, delta):
+        self._sessions.inc(delta, host=host)
+        if delta > 0:
+            self._sessionsTotal.inc(host=host)
+
+    def _apply_transferred(self, host, received, sent):
+        if received:
+            self._bytes.inc(received, host=host, direction='in')
+        if sent:
+            self._bytes.inc(sent, host=host, direction='out')
+
+    def _apply_ticket_decoded(self, duration):
+        self._ticketDecode.observe(duration)
+
+    def _apply_handshake_completed(self, duration):
+        self._handshake.observe(duration)
+
+    def _apply_tls_handshake_failed(self):
+        self._tlsFailures.inc()
+
+    def session_started(self, host):
+        self._post('session', host, 1)
+
+    def session_ended(self, host):
+        self._post('session', host, -1)
+
+    def transferred(self, host, received, sent):
+        self._post('transferred', host, received, sent)
+
+    def ticket_decoded(self, duration):
+        self._post('ticket_decoded', duration)
+
+    def handshake_completed(self, duration):
+        self._post('handshake_completed', duration)
+
+    def tls_handshake_failed(self):
+        self._post('tls_handshake_failed')
+
+    def receive(self):
+        """Applies updates sent by forked processes, called by owner"""
+        while True:
+            try:
+                chunk = os.read(self._rfd, 0x10000)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    break
+                raise
+            if not chunk:
+                break
+            self._pending += chunk
+
+        lines = self._pending.split('\n')
+        self._pending = lines.pop()
+        for line in lines:
+            name, args = json.loads(line)
+            getattr(self, '_apply_%s' % name)(*args)
+
+
+class SessionTransfer(object):
+    """
+    Bytes relayed by single session.
+
+    Counts are accumulated and reported to telemetry at most once per
+    interval, so forked processes do not write the pipe per packet.
+    """
+
+    INTERVAL = 1
+
+    def __init__(self, telemetry, host):
+        self._telemetry = telemetry
+        self._host = host
+        self._reported = util.monotonic()
+        self._received = 0
+        self._sent = 0
+        self.received = 0
+        self.sent = 0
+
+    def add(self, received=0, sent=0):
+        self._received += received
+        self._sent += sent
+        self.received += received
+        self.sent += sent
+        if util.monotonic() - self._reported >= self.INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self._received or self._sent:
+            self._telemetry.transferred(
+                self._host,
+                self._received,
+                self._sent,
+            )
+            self._received = self._sent = 0
+        self._reported = util.monotonic()
+
+
+# vim: expandtab tabstop=4 shiftwidth=4
@@ -46,9 +46,14 @@ class Plugin(plugin.PluginBase):
     def _setup(self):
         self.logger.debug('Checking total memory')
         if self.environment[osetupcons.ConfigEnv.TOTAL_MEMORY_MB] is None:
+            self.logger.debug(
+                'Total memory %s MB, cgroup limit %s MB',
+                mem.get_total_mb(),
+                mem.get_cgroup_memory_limit_mb(),
+            )
             self.environment[
                 osetupcons.ConfigEnv.TOTAL_MEMORY_MB
-            ] = mem.get_total_mb()
+            ] = mem.get_effective_mb()
 
 
 # vim: expandtab tabstop=4 shiftwidth=4
@@ -26,6 +26,8 @@ import gettext
 from otopi import plugin
 from otopi import util
 
+from ovirt_engine import mem
+
 from ovirt_engine_setup import constants as osetupcons
 from ovirt_engine_setup.engine import constants as oenginecons
 
@@ -45,11 +47,34 @@ class Plugin(plugin.PluginBase):
     def __init__(self, context):
         super(Plugin, self).__init__(context=context)
 
+    def _usable_mb(self):
+        """
+        Total memory, within cgroup limit, without memory reserved for
+        huge pages, which cannot be used by regular allocations.
+
+        Huge pages are reserved from host memory, while cgroup limit
+        applies to regular allocations only, so total is limited by host
+        memory left by huge pages rather than reduced by them.
+        """
+        total = self.environment[osetupcons.ConfigEnv.TOTAL_MEMORY_MB]
+        hugepages = mem.get_hugepages()
+        if hugepages['total_mb']:
+            self.logger.debug(
+                '%s MB of memory is reserved for huge pages',
+                hugepages['total_mb'],
+            )
+            total = min(total, mem.get_total_mb() - hugepages['total_mb'])
+        self.logger.debug(
+            'Usable memory %s MB, currently available %s MB',
+            total,
+            mem.get_available_mb(),
+        )
+        return total
+
     def _check_requirements(self):
         satisfied = False
-        if self.environment[
-            osetupcons.ConfigEnv.TOTAL_MEMORY_MB
-        ] < self.environment[
+        total = self._usable_mb()
+        if total < self.environment[
             oenginecons.SystemEnv.MEMCHECK_MINIMUM_MB
         ] * self.environment[
             oenginecons.SystemEnv.MEMCHECK_THRESHOLD
@@ -70,9 +95,7 @@ class Plugin(plugin.PluginBase):
             )
         else:
             satisfied = True
-            if self.environment[
-                osetupcons.ConfigEnv.TOTAL_MEMORY_MB
-            ] < self.environment[
+            if total < self.environment[
                 oenginecons.SystemEnv.MEMCHECK_RECOMMENDED_MB
             ] * self.environment[
                 oenginecons.SystemEnv.MEMCHECK_THRESHOLD
@@ -0,0 +1,167 @@
+"""
+test_configfile.py - Tests for packaging/pythonlib/ovirt_engine/configfile.py
+"""
+
+import json
+import os
+import stat
+import time
+
+from ovirt_engine import configfile as under_test
+
+import mock
+import pytest
+
+
+@pytest.fixture
+def conf(tmpdir):
+    def write(name, content, age=10):
+        path = tmpdir.join(name)
+        path.write(content, ensure=True)
+        # cache is not written for recently modified files
+        old = time.time() - age
+        os.utime(str(path), (old, old))
+        os.utime(str(path.dirpath()), (old, old))
+        return str(path)
+    return write
+
+
+@pytest.mark.parametrize(
+    ('given', 'expected'), [
+        ('value', 'value'),
+        ('"quoted value"', 'quoted value'),
+        ('"a \\"b\\" c"', 'a "b" c'),
+        ('a\\ b', 'a b'),
+        ('value # comment', 'value'),
+        ('"value # not comment"', 'value # not comment'),
+        ('${A}/b', 'a/b'),
+        ('"${A} ${MISSING}x"', 'a x'),
+        ('', ''),
+    ]
+)
+def test_expand(conf, given, expected):
+    config = under_test.ConfigFile([conf('test.conf', 'A=a\nB=%s\n' % given)])
+    assert config.get('B') == expected
+
+
+def test_malformed(conf):
+    with pytest.raises(RuntimeError):
+        under_test.ConfigFile([conf('test.conf', 'A=$A\n')])
+
+
+def test_invalid_line(conf):
+    with pytest.raises(RuntimeError):
+        under_test.ConfigFile([conf('test.conf', 'A=a\nnot a line\n')])
+
+
+def test_confd_order(conf):
+    conf('test.conf.d/20-b.conf', 'A=${A}b\n')
+    conf('test.conf.d/10-a.conf', 'A=${A}a\n')
+    conf('test.conf.d/30-ignored.txt', 'A=ignored\n')
+    config = under_test.ConfigFile([conf('test.conf', 'A=x\n')])
+    assert config.get('A') == 'xab'
+
+
+def test_typed_getters(conf):
+    config = under_test.ConfigFile(
+        [conf('test.conf', 'T=True\nF=no\nN=42\n')]
+    )
+    assert config.getboolean('T') is True
+    assert config.getboolean('F') is False
+    assert config.getboolean('MISSING', 'default') == 'default'
+    assert config.getinteger('N') == 42
+    assert config.getinteger('MISSING', 1) == 1
+
+
+def test_cache_used(conf, tmpdir):
+    files = [conf('test.conf', 'A=a\n')]
+    cache = str(tmpdir.join('cache.json'))
+    under_test.ConfigFile(files, cache=cache)
+    assert stat.S_IMODE(os.stat(cache).st_mode) == 0o600
+
+    with mock.patch.object(under_test.ConfigFile, 'loadFile') as loadFile:
+        config = under_test.ConfigFile(files, cache=cache)
+    assert not loadFile.called
+    assert config.get('A') == 'a'
+
+
+@pytest.mark.parametrize(
+    'change', [
+        lambda conf: conf('test.conf', 'A=changed\n'),
+        lambda conf: conf('test.conf.d/10-a.conf', 'A=changed\n'),
+    ]
+)
+def test_cache_invalidated(conf, tmpdir, change):
+    files = [conf('test.conf', 'A=a\n')]
+    cache = str(tmpdir.join('cache.json'))
+    under_test.ConfigFile(files, cache=cache)
+    change(conf)
+    assert under_test.ConfigFile(files, cache=cache).get('A') == 'changed'
+
+
+def test_cache_of_other_files_ignored(conf, tmpdir):
+    cache = str(tmpdir.join('cache.json'))
+    under_test.ConfigFile([conf('a.conf', 'A=a\n')], cache=cache)
+    config = under_test.ConfigFile([conf('b.conf', 'B=b\n')], cache=cache)
+    assert config.get('A') is None
+    assert config.get('B') == 'b'
+
+
+def test_cache_not_written_for_recent_files(conf, tmpdir):
+    cache = str(tmpdir.join('cache.json'))
+    under_test.ConfigFile([conf('test.conf', 'A=a\n', age=0)], cache=cache)
+    assert not tmpdir.join('cache.json').check()
+
+
+def test_cache_write_failure(conf, tmpdir):
+    cache = str(tmpdir.join('missing', 'cache.json'))
+    config = under_test.ConfigFile([conf('test.conf', 'A=a\n')], cache=cache)
+    assert config.get('A') == 'a'
+    assert not tmpdir.join('missing').check()
+
+
+def test_cache_excludes_passwords(conf, tmpdir):
+    files = [conf('test.conf', 'DB_USER=engine\nDB_PASSWORD=default\n')]
+    conf('test.conf.d/10-setup.conf', 'DB_PASSWORD="s3cret"\n')
+    cache = str(tmpdir.join('cache.json'))
+    under_test.ConfigFile(files, cache=cache)
+    with open(cache) as f:
+        content = f.read()
+    assert 's3cret' not in content
+    assert 'DB_PASSWORD' not in json.loads(content)['values']
+
+    with mock.patch.object(under_test.ConfigFile, 'loadFile') as loadFile:
+        config = under_test.ConfigFile(files, cache=cache)
+    assert not loadFile.called
+    assert config.get('DB_USER') == 'engine'
+    assert config.get('DB_PASSWORD') == 's3cret'
+
+
+def test_cache_not_used_without_secrets(conf, tmpdir):
+    files = [conf('test.conf', 'DB_PASSWORD=s3cret\n')]
+    cache = str(tmpdir.join('cache.json'))
+    under_test.ConfigFile(files, cache=cache)
+    with mock.patch.object(
+        under_test.ConfigFile,
+        '_loadSecrets',
+        side_effect=IOError('denied'),
+    ):
+        config = under_test.ConfigFile(files, cache=cache)
+    assert config.get('DB_PASSWORD') == 's3cret'
+
+
+def test_reload(conf):
+    path = conf('test.conf', 'A=a\nB=b\n')
+    config = under_test.ConfigFile([path])
+    assert not config.changed()
+    assert config.reload() == {}
+
+    conf('test.conf', 'A=changed\nC=c\n', age=5)
+    assert config.changed()
+    assert config.reload() == {
+        'A': ('a', 'changed'),
+        'B': ('b', None),
+        'C': (None, 'c'),
+    }
+    assert not config.changed()
+    assert config.get('A') == 'changed'
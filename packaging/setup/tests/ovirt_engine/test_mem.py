@@ -0,0 +1,201 @@
+"""
+test_mem.py - Tests for packaging/pythonlib/ovirt_engine/mem.py
+"""
+
+import os
+
+from ovirt_engine import mem as under_test
+
+import pytest
+
+GB = 1024 * 1024 * 1024
+
+MEMINFO = (
+    'MemTotal:       16777216 kB\n'
+    'MemFree:         1048576 kB\n'
+    'MemAvailable:    8388608 kB\n'
+    'Cached:          2097152 kB\n'
+    'HugePages_Total:    1024\n'
+    'HugePages_Free:      512\n'
+    'Hugepagesize:       2048 kB\n'
+)
+
+
+class FakeSystem(object):
+
+    def __init__(self, tmpdir, monkeypatch):
+        self._tmpdir = tmpdir
+        self.root = tmpdir.join('cgroup')
+        self.root.ensure(dir=True)
+        self.write('meminfo', MEMINFO)
+        monkeypatch.setattr(under_test, '_MEMINFO', self.path('meminfo'))
+        monkeypatch.setattr(
+            under_test,
+            '_PROC_CGROUP',
+            self.path('cgroup.proc'),
+        )
+        monkeypatch.setattr(under_test, '_CGROUP_ROOT', str(self.root))
+        monkeypatch.setattr(under_test, '_NUMA_NODES', self.path('node'))
+        monkeypatch.setattr(under_test, '_THP_ENABLED', self.path('thp'))
+
+    def path(self, name):
+        return str(self._tmpdir.join(name))
+
+    def write(self, name, content):
+        self._tmpdir.join(name).write(content, ensure=True)
+
+    def cgroup(self, *path, **files):
+        d = self.root.join(*path)
+        d.ensure(dir=True)
+        for name, value in files.items():
+            d.join(name.replace('_', '.', 1)).write(value)
+        return d
+
+
+@pytest.fixture
+def system(tmpdir, monkeypatch):
+    under_test.clear_cache()
+    yield FakeSystem(tmpdir, monkeypatch)
+    under_test.clear_cache()
+
+
+def test_total(system):
+    assert under_test.get_total_mb() == 16384
+
+
+def test_no_cgroup(system):
+    assert under_test.get_cgroup_memory_limit_mb() is None
+    assert under_test.get_effective_mb() == 16384
+    assert under_test.get_available_mb() == 8192
+
+
+def test_cgroup_v2(system):
+    system.write('cgroup.proc', '0::/system.slice/engine.service\n')
+    system.cgroup(cgroup_controllers='cpu memory')
+    system.cgroup('system.slice', memory_max='max')
+    system.cgroup(
+        'system.slice', 'engine.service',
+        memory_max=str(4 * GB),
+        memory_current=str(3 * GB),
+    )
+    assert under_test.get_cgroup_memory_limit_mb() == 4096
+    assert under_test.get_effective_mb() == 4096
+    assert under_test.get_available_mb() == 1024
+
+
+def test_cgroup_v2_nearest_is_not_lowest(system):
+    system.write('cgroup.proc', '0::/machine.slice/engine\n')
+    system.cgroup(cgroup_controllers='memory')
+    system.cgroup('machine.slice', memory_max=str(2 * GB))
+    system.cgroup('machine.slice', 'engine', memory_max=str(4 * GB))
+    assert under_test.get_cgroup_memory_limit_mb() == 2048
+
+
+def test_cgroup_v1(system):
+    system.write(
+        'cgroup.proc',
+        '5:cpu,cpuacct:/docker/abc\n'
+        '4:memory:/docker/abc\n'
+        '1:name=systemd:/docker/abc\n',
+    )
+    system.cgroup('memory', 'docker', 'abc', memory_limit_in_bytes=str(GB))
+    assert under_test.get_cgroup_memory_limit_mb() == 1024
+
+
+def test_cgroup_v1_unlimited(system):
+    system.write('cgroup.proc', '4:memory:/\n')
+    system.cgroup('memory', memory_limit_in_bytes='9223372036854771712')
+    assert under_test.get_cgroup_memory_limit_mb() is None
+
+
+def test_cgroup_v1_container_root(system):
+    # within container, cgroup of host path is not visible
+    system.write('cgroup.proc', '4:memory:/docker/abc\n')
+    system.cgroup('memory', memory_limit_in_bytes=str(2 * GB))
+    assert under_test.get_cgroup_memory_limit_mb() == 2048
+
+
+def test_cgroup_limit_above_total(system):
+    system.write('cgroup.proc', '0::/\n')
+    system.cgroup(cgroup_controllers='memory', memory_max=str(32 * GB))
+    assert under_test.get_cgroup_memory_limit_mb() == 32768
+    assert under_test.get_effective_mb() == 16384
+
+
+def test_cached(system):
+    assert under_test.get_cgroup_memory_limit_mb() is None
+    system.write('cgroup.proc', '0::/\n')
+    system.cgroup(cgroup_controllers='memory', memory_max=str(GB))
+    assert under_test.get_cgroup_memory_limit_mb() is None
+    under_test.clear_cache()
+    assert under_test.get_cgroup_memory_limit_mb() == 1024
+
+
+def test_available_without_memavailable(system):
+    system.write(
+        'meminfo',
+        'MemTotal: 16777216 kB\n'
+        'MemFree: 1048576 kB\n'
+        'Cached: 2097152 kB\n',
+    )
+    assert under_test.get_available_mb() == 3072
+
+
+def test_invalid_meminfo(system):
+    system.write('meminfo', 'garbage\n')
+    with pytest.raises(RuntimeError):
+        under_test.get_total_mb()
+
+
+@pytest.mark.parametrize(
+    ('thp', 'expected'), [
+        ('always [madvise] never\n', 'madvise'),
+        ('[always] madvise never\n', 'always'),
+        (None, None),
+    ]
+)
+def test_hugepages(system, thp, expected):
+    if thp is not None:
+        system.write('thp', thp)
+    assert under_test.get_hugepages() == {
+        'total_mb': 2048,
+        'free_mb': 1024,
+        'size_kb': 2048,
+        'transparent': expected,
+    }
+
+
+@pytest.mark.parametrize(
+    ('files', 'expected'), [
+        ({'cpu_max': '50000 100000'}, 0.5),
+        ({'cpu_max': 'max 100000'}, 1.0),
+        ({'cpu_cfs_quota_us': '150000', 'cpu_cfs_period_us': '100000'}, 1.0),
+        ({'cpu_cfs_quota_us': '-1', 'cpu_cfs_period_us': '100000'}, 1.0),
+    ]
+)
+def test_cpu_limit(system, monkeypatch, files, expected):
+    monkeypatch.setattr(os, 'sched_getaffinity', lambda pid: {0})
+    system.write('cgroup.proc', '0::/\n')
+    system.cgroup(cgroup_controllers='cpu', **files)
+    assert under_test.get_cpu_limit() == expected
+
+
+def test_numa_nodes(system):
+    assert under_test.get_numa_nodes() == 1
+    for name in ('node0', 'node1', 'possible'):
+        system.write(os.path.join('node', name, 'meminfo'), '')
+    under_test.clear_cache()
+    assert under_test.get_numa_nodes() == 2
+
+
+@pytest.mark.parametrize(
+    ('given', 'expected'), [
+        ('2g', 2048),
+        ('2G', 2048),
+        ('512m', 512),
+        ('2048k', 2),
+        ('%d' % (3 * 1024 * 1024), 3),
+    ]
+)
+def test_javaX_mb(given, expected):
+    assert under_test.javaX_mb(given) == expected
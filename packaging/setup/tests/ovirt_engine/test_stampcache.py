@@ -0,0 +1,117 @@
+"""
+test_stampcache.py - Tests for packaging/pythonlib/ovirt_engine/stampcache.py
+"""
+
+import json
+import os
+import time
+
+from ovirt_engine import stampcache as under_test
+
+import pytest
+
+
+@pytest.fixture
+def write(tmpdir):
+    def write(name, content='content', age=10):
+        path = tmpdir.join(name)
+        path.write(content, ensure=True)
+        # values of recently modified files are not cached
+        old = time.time() - age
+        os.utime(str(path), (old, old))
+        return str(path)
+    return write
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return under_test.StampCache(str(tmpdir.join('cache.json')))
+
+
+def test_stamp(write, tmpdir):
+    path = write('file', 'abc')
+    st = os.stat(path)
+    assert under_test.stamp(path) == [st.st_mtime, 3, st.st_ino]
+    assert under_test.stamp(str(tmpdir.join('missing'))) is None
+
+
+def test_get_missing(cache, write):
+    assert cache.get('key', [write('file')]) is None
+
+
+def test_put_get(cache, write, tmpdir):
+    paths = [write('a'), write('b')]
+    cache.put('key', paths, {'value': 1})
+    cache.put('other', paths[:1], 'other')
+    assert cache.get('key', paths) == {'value': 1}
+    assert cache.get('key', list(reversed(paths))) == {'value': 1}
+    assert cache.get('other', paths[:1]) == 'other'
+    reopened = under_test.StampCache(str(tmpdir.join('cache.json')))
+    assert reopened.get('key', paths) == {'value': 1}
+
+
+def test_missing_path_is_stamped(cache, write, tmpdir):
+    missing = str(tmpdir.join('missing'))
+    cache.put('key', [missing], 'value')
+    assert cache.get('key', [missing]) == 'value'
+    write('missing')
+    assert cache.get('key', [missing]) is None
+
+
+def append(path):
+    with open(path, 'a') as f:
+        f.write('more')
+
+
+@pytest.mark.parametrize(
+    'change', [
+        append,
+        os.unlink,
+        lambda path: os.utime(path, None),
+    ]
+)
+def test_invalidated_by_change(cache, write, change):
+    path = write('file')
+    cache.put('key', [path], 'value')
+    change(path)
+    assert cache.get('key', [path]) is None
+
+
+def test_invalidated_by_replace(cache, write, tmpdir):
+    path = write('file')
+    cache.put('key', [path], 'value')
+    st = os.stat(path)
+    new = write('new')
+    os.utime(new, (st.st_atime, st.st_mtime))
+    os.rename(new, path)
+    assert cache.get('key', [path]) is None
+
+
+def test_other_paths(cache, write):
+    paths = [write('a'), write('b')]
+    cache.put('key', paths, 'value')
+    assert cache.get('key', paths[:1]) is None
+
+
+def test_recent_not_stored(cache, write, tmpdir):
+    cache.put('key', [write('file', age=0)], 'value')
+    assert not tmpdir.join('cache.json').check()
+
+
+@pytest.mark.parametrize(
+    'content', ['', 'not json', json.dumps({'version': 0, 'entries': {}})]
+)
+def test_invalid_cache(cache, write, tmpdir, content):
+    path = write('file')
+    tmpdir.join('cache.json').write(content)
+    assert cache.get('key', [path]) is None
+    cache.put('key', [path], 'value')
+    assert cache.get('key', [path]) == 'value'
+
+
+def test_write_failure(write, tmpdir):
+    cache = under_test.StampCache(str(tmpdir.join('missing', 'cache.json')))
+    path = write('file')
+    cache.put('key', [path], 'value')
+    assert cache.get('key', [path]) is None
+    assert not tmpdir.join('missing').check()
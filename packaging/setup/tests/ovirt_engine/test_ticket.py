@@ -0,0 +1,259 @@
+"""
+test_ticket.py - Tests for packaging/pythonlib/ovirt_engine/ticket.py
+"""
+
+import base64
+import datetime
+import json
+
+from ovirt_engine import ticket as under_test
+
+import mock
+import pytest
+
+
+def _date(d):
+    return d.strftime('%Y%m%d%H%M%S')
+
+
+def make_ticket(data, lifetime=60, signature=b'valid'):
+    now = datetime.datetime.utcnow()
+    return base64.b64encode(
+        json.dumps({
+            'salt': 'salt',
+            'digest': 'sha256',
+            'validFrom': _date(now - datetime.timedelta(seconds=1)),
+            'validTo': _date(now + datetime.timedelta(seconds=lifetime)),
+            'data': data,
+            'signedFields': 'salt,digest,validFrom,validTo,data',
+            'signature': base64.b64encode(signature).decode('ascii'),
+            'certificate': 'certificate',
+        }).encode('utf8')
+    )
+
+
+class FakeBackend(object):
+    """Accepts signature b'valid', counts verifications"""
+
+    name = 'fake'
+
+    def __init__(self):
+        self.verified = 0
+        self.notAfter = datetime.datetime.utcnow() + datetime.timedelta(
+            days=1
+        )
+
+    def load_certificate(self, pem):
+        return pem
+
+    def load_certificate_file(self, path):
+        return path
+
+    def public_key(self, cert):
+        return cert
+
+    def issued_by(self, ca, cert):
+        return True
+
+    def not_before(self, cert):
+        return datetime.datetime(2000, 1, 1)
+
+    def not_after(self, cert):
+        return self.notAfter
+
+    def extended_key_usage(self, cert):
+        return ['eku']
+
+    def verify(self, key, digest, data, signature):
+        self.verified += 1
+        return signature == b'valid'
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = FakeBackend()
+    monkeypatch.setattr(under_test, 'get_backend', lambda name: backend)
+    return backend
+
+
+def make_decoder(cache, ca=None):
+    return under_test.TicketDecoder(
+        ca=ca,
+        eku='eku',
+        peer='peer',
+        cache=cache,
+    )
+
+
+NOW = datetime.datetime(2026, 1, 1)
+LATER = NOW + datetime.timedelta(seconds=60)
+
+
+def test_cache_digest():
+    digest = under_test.TicketCache.digest(b'ticket')
+    assert digest == under_test.TicketCache.digest(u'ticket')
+    assert digest != under_test.TicketCache.digest(b'other')
+
+
+def test_cache_get_put():
+    cache = under_test.TicketCache(size=2)
+    assert cache.get('a', NOW) is None
+    cache.put('a', LATER, 'data')
+    assert cache.get('a', NOW) == 'data'
+    assert cache.get('a', LATER) == 'data'
+
+
+def test_cache_expired():
+    cache = under_test.TicketCache(size=2)
+    cache.put('a', NOW, 'data')
+    assert cache.get('a', LATER) is None
+    # expired entry is dropped
+    assert cache.get('a', NOW) is None
+
+
+def test_cache_lru():
+    cache = under_test.TicketCache(size=2)
+    cache.put('a', LATER, 'a')
+    cache.put('b', LATER, 'b')
+    # a becomes most recently used, so b is evicted
+    assert cache.get('a', NOW) == 'a'
+    cache.put('c', LATER, 'c')
+    assert cache.get('b', NOW) is None
+    assert cache.get('a', NOW) == 'a'
+    assert cache.get('c', NOW) == 'c'
+
+
+def test_cache_put_replaces():
+    cache = under_test.TicketCache(size=2)
+    cache.put('a', NOW, 'old')
+    cache.put('a', LATER, 'new')
+    cache.put('b', LATER, 'b')
+    assert cache.get('a', LATER) == 'new'
+    assert cache.get('b', LATER) == 'b'
+
+
+def test_cache_clear():
+    cache = under_test.TicketCache(size=2)
+    cache.put('a', LATER, 'a')
+    cache.clear()
+    assert cache.get('a', NOW) is None
+
+
+@pytest.mark.parametrize('size', [None, 10])
+def test_decode(backend, size):
+    cache = under_test.TicketCache(size) if size else None
+    decoder = make_decoder(cache)
+    ticket = make_ticket('data')
+    assert decoder.decode(ticket) == 'data'
+    assert decoder.decode(ticket) == 'data'
+    assert backend.verified == (1 if cache else 2)
+
+
+def test_decode_invalid_not_cached(backend):
+    decoder = make_decoder(under_test.TicketCache(10))
+    ticket = make_ticket('data', signature=b'invalid')
+    for i in range(2):
+        with pytest.raises(ValueError):
+            decoder.decode(ticket)
+    assert backend.verified == 2
+
+
+def test_decode_expired_not_cached(backend):
+    decoder = make_decoder(under_test.TicketCache(10))
+    with pytest.raises(ValueError):
+        decoder.decode(make_ticket('data', lifetime=-10))
+    assert backend.verified == 1
+
+
+def test_decode_cached_until_certificate_expires(backend):
+    cache = under_test.TicketCache(10)
+    backend.notAfter = datetime.datetime.utcnow() + datetime.timedelta(
+        seconds=10
+    )
+    ticket = make_ticket('data', lifetime=3600)
+    make_decoder(cache, ca='ca').decode(ticket)
+    digest = cache.digest(ticket)
+    assert cache.get(digest, backend.notAfter) == 'data'
+    assert cache.get(
+        digest,
+        backend.notAfter + datetime.timedelta(seconds=1),
+    ) is None
+
+
+def test_decode_after_clear(backend):
+    cache = under_test.TicketCache(10)
+    decoder = make_decoder(cache)
+    ticket = make_ticket('data')
+    decoder.decode(ticket)
+    cache.clear()
+    decoder.decode(ticket)
+    assert backend.verified == 2
+
+
+@pytest.mark.parametrize('digest', under_test.DIGESTS)
+def test_check_digest(digest):
+    assert under_test._checkDigest(digest) == digest
+
+
+@pytest.mark.parametrize('digest', ['md5', 'SHA256', 'sha224', '', None])
+def test_check_digest_unsupported(digest):
+    with pytest.raises(ValueError):
+        under_test._checkDigest(digest)
+
+
+@pytest.mark.parametrize('method', ['sign', 'verify'])
+def test_m2crypto_digest_restricted(method):
+    backend = under_test.M2CryptoBackend.__new__(under_test.M2CryptoBackend)
+    key = mock.Mock()
+    args = (b'signature',) if method == 'verify' else ()
+    with pytest.raises(ValueError):
+        getattr(backend, method)(key, 'md5', b'data', *args)
+    assert not key.reset_context.called
+
+    getattr(backend, method)(key, 'sha256', b'data', *args)
+    key.reset_context.assert_called_once_with(md='sha256')
+
+
+def test_cryptography_digest_restricted():
+    backend = under_test.CryptographyBackend.__new__(
+        under_test.CryptographyBackend
+    )
+    backend._hashes = mock.Mock()
+    assert backend._hash('sha384') is backend._hashes.SHA384.return_value
+    with pytest.raises(ValueError):
+        backend._hash('md5')
+    assert not backend._hashes.MD5.called
+
+
+class Available(object):
+    name = 'available'
+
+
+class Missing(object):
+    name = 'missing'
+
+    def __init__(self):
+        raise ImportError('missing')
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    monkeypatch.setattr(under_test, 'BACKENDS', (Missing, Available))
+    monkeypatch.setattr(under_test, '_backends', {})
+
+
+def test_get_backend_first_available(backends):
+    backend = under_test.get_backend()
+    assert isinstance(backend, Available)
+    assert under_test.get_backend() is backend
+    assert under_test.get_backend('available') is backend
+
+
+def test_get_backend_missing(backends):
+    with pytest.raises(ImportError):
+        under_test.get_backend('missing')
+
+
+def test_get_backend_unknown(backends):
+    with pytest.raises(RuntimeError):
+        under_test.get_backend('unknown')
@@ -0,0 +1,143 @@
+"""
+test_db.py - Tests for packaging/services/ovirt-fence-kdump-listener/db.py
+"""
+
+import os
+import sys
+
+import psycopg2
+import psycopg2.extensions
+
+import mock
+import pytest
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(__file__),
+        '..', '..', '..', 'services', 'ovirt-fence-kdump-listener',
+    ),
+)
+
+import db as under_test  # isort:skip # noqa: E402
+
+
+def make_connection():
+    connection = mock.Mock()
+    connection.closed = 0
+    connection.get_transaction_status.return_value = (
+        psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    )
+    cursor = connection.cursor.return_value
+    cursor.description = [('updated',)]
+    cursor.fetchall.return_value = [(1,)]
+    return connection
+
+
+@pytest.fixture
+def connect():
+    with mock.patch.object(under_test.psycopg2, 'connect') as connect:
+        connect.side_effect = lambda **kwargs: make_connection()
+        yield connect
+
+
+def make_manager(validation):
+    return under_test.DbManager(
+        host='localhost',
+        port=5432,
+        database='engine',
+        username='engine',
+        password='password',
+        secured=False,
+        secure_validation=False,
+        validation=validation,
+    )
+
+
+@pytest.mark.parametrize('validation', ['', 'Status', 'none', None])
+def test_invalid_validation(validation):
+    with pytest.raises(ValueError):
+        make_manager(validation)
+
+
+def test_status_validation_does_not_query(connect):
+    manager = make_manager(under_test.DbManager.VALIDATION_STATUS)
+    assert manager.validate_connection()
+    assert manager.validate_connection()
+    assert connect.call_count == 1
+    assert not manager._connection.cursor.called
+
+
+@pytest.mark.parametrize(
+    ('closed', 'status'), [
+        (1, psycopg2.extensions.TRANSACTION_STATUS_IDLE),
+        (0, psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN),
+    ]
+)
+def test_status_validation_reconnects(connect, closed, status):
+    manager = make_manager(under_test.DbManager.VALIDATION_STATUS)
+    assert manager.validate_connection()
+    broken = manager._connection
+    broken.closed = closed
+    broken.get_transaction_status.return_value = status
+    assert manager.validate_connection()
+    assert connect.call_count == 2
+    assert broken.close.called
+    assert manager._connection is not broken
+
+
+def test_query_validation(connect):
+    manager = make_manager(under_test.DbManager.VALIDATION_QUERY)
+    assert manager.validate_connection()
+    manager._connection.cursor.return_value.execute.assert_called_with(
+        'SELECT 1'
+    )
+    manager._connection.cursor.return_value.execute.side_effect = (
+        psycopg2.OperationalError()
+    )
+    assert manager.validate_connection()
+    assert connect.call_count == 2
+
+
+@pytest.mark.parametrize(
+    'error', [psycopg2.OperationalError, psycopg2.InterfaceError]
+)
+def test_call_retried_on_broken_connection(connect, error):
+    manager = make_manager(under_test.DbManager.VALIDATION_STATUS)
+    manager.validate_connection()
+    broken = manager._connection
+    broken.cursor.return_value.callproc.side_effect = error()
+    assert manager.call_procedure('Proc', ('a',)) == [{'updated': 1}]
+    assert connect.call_count == 2
+    assert broken.close.called
+    manager._connection.cursor.return_value.callproc.assert_called_once_with(
+        'Proc',
+        ('a',),
+    )
+
+
+def test_call_retried_once(connect):
+    def failing_connection(**kwargs):
+        connection = make_connection()
+        connection.cursor.return_value.callproc.side_effect = (
+            psycopg2.OperationalError()
+        )
+        return connection
+
+    manager = make_manager(under_test.DbManager.VALIDATION_STATUS)
+    connect.side_effect = failing_connection
+    manager.validate_connection()
+    with pytest.raises(under_test.DbException):
+        manager.call_procedure('Proc', ('a',))
+    assert connect.call_count == 2
+
+
+def test_call_not_retried_on_other_errors(connect):
+    manager = make_manager(under_test.DbManager.VALIDATION_STATUS)
+    manager.validate_connection()
+    manager._connection.cursor.return_value.callproc.side_effect = (
+        psycopg2.ProgrammingError()
+    )
+    with pytest.raises(under_test.DbException):
+        manager.call_procedure('Proc', ('a',))
+    assert connect.call_count == 1
@@ -0,0 +1,275 @@
+"""
+test_listener.py - Tests for
+packaging/services/ovirt-fence-kdump-listener/listener.py
+"""
+
+import os
+import socket
+import sys
+
+from ovirt_engine import util
+
+import mock
+import pytest
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(__file__),
+        '..', '..', '..', 'services', 'ovirt-fence-kdump-listener',
+    ),
+)
+
+import listener as under_test  # isort:skip # noqa: E402
+
+
+MESSAGE = b'\x40\x2a\x30\x1b\x01\x00\x00\x00'
+EXPIRATION = 60
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(util, 'monotonic', clock)
+    return clock
+
+
+def make_listener(binds=(), **kwargs):
+    return under_test.FenceKdumpListener(
+        binds=list(binds),
+        db_manager=mock.Mock(),
+        # db is synced less often than sessions expire
+        heartbeat_interval=300,
+        session_sync_interval=120,
+        reopen_db_connection_interval=30,
+        session_expiration_time=EXPIRATION,
+        **kwargs
+    )
+
+
+@pytest.fixture
+def server(clock):
+    server = make_listener()
+    # database is synced, next sync is not due
+    server._lastHeartbeat = clock.now
+    server._lastSessionSync = clock.now
+    return server
+
+
+def addresses(server):
+    return [sock.getsockname() for sock in server._sockets.values()]
+
+
+def receive_all(server):
+    received = []
+    while True:
+        batch = list(server._receive())
+        if not batch:
+            return received
+        received.extend(batch)
+
+
+@pytest.fixture
+def receiving(server, monkeypatch):
+    # wait at most 0.2 s for messages
+    monkeypatch.setattr(
+        server,
+        '_next_wakeup',
+        lambda: util.monotonic() + 0.2,
+    )
+    return server
+
+
+def sender():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    return sock
+
+
+def test_receive_from_all_sockets(receiving):
+    receiving._binds = [('127.0.0.1', 0), ('127.0.0.1', 0)]
+    with receiving:
+        first, second = addresses(receiving)
+        assert first != second
+        client = sender()
+        client.sendto(MESSAGE, first)
+        client.sendto(MESSAGE + b'second', second)
+        received = receive_all(receiving)
+    address = client.getsockname()
+    client.close()
+    assert sorted(received) == [
+        (MESSAGE, address),
+        (MESSAGE + b'second', address),
+    ]
+
+
+def test_receive_batch(receiving, monkeypatch):
+    monkeypatch.setattr(receiving, '_BATCH_SIZE', 3)
+    receiving._binds = [('127.0.0.1', 0)]
+    with receiving:
+        client = sender()
+        for i in range(5):
+            client.sendto(MESSAGE, addresses(receiving)[0])
+        assert len(list(receiving._receive())) == 3
+        assert len(list(receiving._receive())) == 2
+    client.close()
+
+
+def test_receive_ipv6(receiving):
+    if not socket.has_ipv6:
+        pytest.skip('IPv6 is not supported')
+    receiving._binds = [('::1', 0), ('127.0.0.1', 0)]
+    try:
+        receiving.__enter__()
+    except socket.error:
+        pytest.skip('IPv6 loopback is not available')
+    try:
+        client = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        client.sendto(MESSAGE, addresses(receiving)[0])
+        (message, address), = receive_all(receiving)
+        client.close()
+    finally:
+        receiving.__exit__(None, None, None)
+    assert message == MESSAGE
+    assert address[0] == '::1'
+
+
+def test_receive_not_before_deadline(server, clock):
+    server._binds = [('127.0.0.1', 0)]
+    with server:
+        client = sender()
+        client.sendto(MESSAGE, addresses(server)[0])
+        clock.now += 120
+        # session sync is due, so no waiting for messages
+        assert list(server._receive()) == []
+    client.close()
+
+
+@pytest.mark.parametrize(
+    ('message', 'valid'), [
+        (MESSAGE, True),
+        (MESSAGE + b'\x00' * 8, True),
+        (MESSAGE[:7], False),
+        (b'\x40\x2a\x30\x1b\x02\x00\x00\x00', False),
+        (b'', False),
+    ]
+)
+def test_verify_message(server, message, valid):
+    assert bool(server._verify_message(message)) == valid
+
+
+def handle(server, address, message=MESSAGE):
+    session = server._sessions.get(address)
+    if session is None:
+        session = server._create_session(
+            status=server.SESSION_STATE_INITIAL,
+            address=address,
+        )
+    server._handle_message(entry=session, message=message)
+    return session
+
+
+def test_session_started(server, clock):
+    session = handle(server, ('192.0.2.1', 7410))
+    assert session.status == server.SESSION_STATE_DUMPING
+    assert server._next_wakeup() == clock.now + EXPIRATION
+    # further messages do not add entries to expiration heap
+    handle(server, ('192.0.2.1', 7410))
+    assert len(server._expirations) == 1
+
+
+def test_invalid_message_closes_initial_session(server):
+    address = ('192.0.2.1', 7410)
+    session = handle(server, address, message=b'invalid')
+    assert session.status == server.SESSION_STATE_CLOSED
+    server._house_keeping_sessions()
+    assert address not in server._sessions
+
+
+def test_invalid_message_ignored_while_dumping(server):
+    session = handle(server, ('192.0.2.1', 7410))
+    handle(server, ('192.0.2.1', 7410), message=b'invalid')
+    assert session.status == server.SESSION_STATE_DUMPING
+
+
+def test_session_finished(server, clock):
+    address = ('192.0.2.1', 7410)
+    session = handle(server, address)
+    server._dirtySessions.clear()
+
+    clock.now += EXPIRATION - 1
+    server._house_keeping_sessions()
+    assert session.status == server.SESSION_STATE_DUMPING
+
+    clock.now += 1
+    server._house_keeping_sessions()
+    assert session.status == server.SESSION_STATE_FINISHED
+    assert server._dirtySessions == set([address])
+    assert server._expirations == []
+
+
+def test_session_expiration_postponed_by_message(server, clock):
+    session = handle(server, ('192.0.2.1', 7410))
+    clock.now += EXPIRATION / 2
+    handle(server, ('192.0.2.1', 7410))
+
+    clock.now += EXPIRATION / 2
+    server._house_keeping_sessions()
+    assert session.status == server.SESSION_STATE_DUMPING
+    assert server._next_wakeup() == session.updated + EXPIRATION
+
+    clock.now += EXPIRATION / 2
+    server._house_keeping_sessions()
+    assert session.status == server.SESSION_STATE_FINISHED
+
+
+def test_sessions_expire_in_order(server, clock):
+    sessions = []
+    for i in range(3):
+        sessions.append(handle(server, ('192.0.2.%d' % (3 - i), 7410)))
+        clock.now += 10
+
+    clock.now = sessions[1].updated + EXPIRATION
+    server._house_keeping_sessions()
+    assert [s.status for s in sessions] == [
+        server.SESSION_STATE_FINISHED,
+        server.SESSION_STATE_FINISHED,
+        server.SESSION_STATE_DUMPING,
+    ]
+    assert server._next_wakeup() == sessions[2].updated + EXPIRATION
+
+
+def test_replaced_session_not_expired(server, clock):
+    address = ('192.0.2.1', 7410)
+    old = handle(server, address)
+    server._close_session(old)
+    server._house_keeping_sessions()
+    new = server._create_session(
+        status=server.SESSION_STATE_DUMPING,
+        address=address,
+    )
+    clock.now += EXPIRATION
+    server._house_keeping_sessions()
+    assert new.status == server.SESSION_STATE_DUMPING
+
+
+def test_count_sessions(server):
+    handle(server, ('192.0.2.1', 7410))
+    handle(server, ('192.0.2.2', 7410))
+    server._create_session(
+        status=server.SESSION_STATE_INITIAL,
+        address=('192.0.2.3', 7410),
+    )
+    counts = server._count_sessions()
+    assert counts[(('state', server.SESSION_STATE_DUMPING),)] == 2
+    assert counts[(('state', server.SESSION_STATE_INITIAL),)] == 1
+    assert counts[(('state', server.SESSION_STATE_FINISHED),)] == 0
@@ -0,0 +1,242 @@
+"""
+test_spool.py - Tests for
+packaging/services/ovirt-fence-kdump-listener/spool.py
+"""
+
+import os
+import sys
+
+from ovirt_engine import util
+
+import mock
+import pytest
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(__file__),
+        '..', '..', '..', 'services', 'ovirt-fence-kdump-listener',
+    ),
+)
+
+import db  # isort:skip # noqa: E402
+import listener  # isort:skip # noqa: E402
+import spool as under_test  # isort:skip # noqa: E402
+
+
+MESSAGE = b'\x40\x2a\x30\x1b\x01\x00\x00\x00'
+FIRST = ('192.0.2.1', 7410)
+SECOND = ('192.0.2.2', 7410)
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('sessions.spool'))
+
+
+def test_load_missing(path):
+    assert under_test.SessionSpool(path).load() == []
+
+
+def test_append_load(path):
+    under_test.SessionSpool(path).append([
+        ('dumping', FIRST),
+        ('started', SECOND),
+    ])
+    assert sorted(under_test.SessionSpool(path).load()) == [
+        ('dumping', FIRST),
+        ('started', SECOND),
+    ]
+
+
+def test_last_record_wins(path):
+    spool = under_test.SessionSpool(path)
+    spool.append([('dumping', FIRST)])
+    spool.append([('finished', FIRST)])
+    assert spool.load() == [('finished', FIRST)]
+
+
+def test_invalid_records_ignored(path):
+    spool = under_test.SessionSpool(path)
+    spool.append([('dumping', FIRST)])
+    with open(path, 'a') as f:
+        f.write('{"status": "finished"}\n')
+        f.write('[]\n')
+        # truncated by crash during write
+        f.write('{"status": "finished", "addr')
+    assert under_test.SessionSpool(path).load() == [('dumping', FIRST)]
+
+
+def test_clear(path):
+    spool = under_test.SessionSpool(path)
+    spool.append([('dumping', FIRST)])
+    spool.clear()
+    assert os.path.getsize(path) == 0
+    assert spool.load() == []
+    assert under_test.SessionSpool(path).load() == []
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(util, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def db_manager():
+    return mock.Mock()
+
+
+@pytest.fixture
+def dao(monkeypatch):
+    dao = mock.Mock()
+    dao.get_unfinished_session_addresses.return_value = []
+    dao.update_vds_kdump_statuses.side_effect = lambda sessions: dict(
+        (address, True) for status, address in sessions
+    )
+    monkeypatch.setattr(db, 'EngineDao', lambda db_manager: dao)
+    return dao
+
+
+def make_listener(db_manager, path):
+    return listener.FenceKdumpListener(
+        binds=[],
+        db_manager=db_manager,
+        heartbeat_interval=30,
+        session_sync_interval=5,
+        reopen_db_connection_interval=30,
+        session_expiration_time=60,
+        spool=under_test.SessionSpool(path),
+    )
+
+
+def receive(server, address, message=MESSAGE):
+    session = server._sessions.get(address)
+    if session is None:
+        session = server._create_session(
+            status=server.SESSION_STATE_INITIAL,
+            address=address,
+        )
+    server._handle_message(entry=session, message=message)
+    return session
+
+
+def test_sessions_spooled_during_outage(clock, db_manager, dao, path):
+    db_manager.validate_connection.return_value = False
+    server = make_listener(db_manager, path)
+    with server:
+        receive(server, FIRST)
+        server._db_sync()
+    assert not dao.update_vds_kdump_statuses.called
+    assert server._lastSessionSync is None
+    assert under_test.SessionSpool(path).load() == [
+        (server.SESSION_STATE_DUMPING, FIRST),
+    ]
+
+
+def test_spooled_sessions_restored(clock, db_manager, dao, path):
+    under_test.SessionSpool(path).append([
+        ('dumping', FIRST),
+        ('started', SECOND),
+    ])
+    server = make_listener(db_manager, path)
+    with server:
+        pass
+    assert server._sessions[FIRST].status == server.SESSION_STATE_DUMPING
+    assert server._sessions[SECOND].status == server.SESSION_STATE_INITIAL
+    assert server._dirtySessions == set([FIRST, SECOND])
+    # dumping session expires again after restart
+    assert server._next_wakeup() <= clock.now + 60
+
+
+def test_session_closed_after_spooling_not_restored(
+        clock, db_manager, dao, path,
+):
+    db_manager.validate_connection.return_value = False
+    server = make_listener(db_manager, path)
+    with server:
+        session = server._create_session(
+            status=server.SESSION_STATE_INITIAL,
+            address=FIRST,
+        )
+        receive(server, SECOND)
+        server._db_sync()
+        assert sorted(under_test.SessionSpool(path).load()) == [
+            (server.SESSION_STATE_DUMPING, SECOND),
+            (server.SESSION_STATE_INITIAL, FIRST),
+        ]
+        # first message is invalid, session is closed and removed
+        server._handle_message(entry=session, message=b'invalid')
+        server._house_keeping_sessions()
+        clock.now += 5
+        server._db_sync()
+
+    restored = make_listener(db_manager, path)
+    with restored:
+        pass
+    assert list(restored._sessions) == [SECOND]
+
+
+def test_spooled_session_closed_later_not_restored(
+        clock, db_manager, dao, path,
+):
+    db_manager.validate_connection.return_value = False
+    server = make_listener(db_manager, path)
+    with server:
+        receive(server, FIRST)
+        server._db_sync()
+        clock.now += 60
+        server._house_keeping_sessions()
+        assert server._sessions[FIRST].status == (
+            server.SESSION_STATE_FINISHED
+        )
+        clock.now += 5
+        server._db_sync()
+    assert under_test.SessionSpool(path).load() == [
+        (server.SESSION_STATE_FINISHED, FIRST),
+    ]
+
+
+def test_spool_cleared_after_save(clock, db_manager, dao, path):
+    db_manager.validate_connection.return_value = False
+    server = make_listener(db_manager, path)
+    with server:
+        receive(server, FIRST)
+        server._db_sync()
+
+        db_manager.validate_connection.return_value = True
+        clock.now += 30
+        server._db_sync()
+    dao.update_vds_kdump_statuses.assert_called_once_with(
+        sessions=[(server.SESSION_STATE_DUMPING, FIRST)],
+    )
+    assert server._lastSessionSync == clock.now
+    assert server._dirtySessions == set()
+    assert os.path.getsize(path) == 0
+    assert server._spooled == {}
+
+
+def test_spool_kept_on_save_failure(clock, db_manager, dao, path):
+    error = db.DbException(message='failed', cause=Exception('failed'))
+    dao.update_vds_kdump_statuses.side_effect = error
+    dao.update_vds_kdump_status.side_effect = error
+    db_manager.validate_connection.return_value = True
+    server = make_listener(db_manager, path)
+    with server:
+        receive(server, FIRST)
+        server._db_sync()
+    assert server._lastSessionSync is None
+    assert server._lastDbSyncFailure == clock.now
+    assert under_test.SessionSpool(path).load() == [
+        (server.SESSION_STATE_DUMPING, FIRST),
+    ]
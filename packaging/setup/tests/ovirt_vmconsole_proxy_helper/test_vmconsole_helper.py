@@ -0,0 +1,136 @@
+"""
+test_vmconsole_helper.py - Tests for
+packaging/libexec/ovirt-vmconsole-proxy-helper/vmconsole_helper.py
+"""
+
+import json
+import os
+import sys
+import time
+
+import mock
+import pytest
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(__file__),
+        '..', '..', '..', 'libexec', 'ovirt-vmconsole-proxy-helper',
+    ),
+)
+
+import vmconsole_helper as under_test  # isort:skip # noqa: E402
+
+
+# base64 of b'test'
+KEY = 'ssh-ed25519 dGVzdA== user@host'
+KEY_SHA256 = 'SHA256:n4bQgYhMfWWaL+qgxVrQFaO/TxsrC4Is0V1sFbDwCgg'
+KEY_MD5 = '09:8f:6b:cd:46:21:d3:73:ca:de:4e:83:26:27:b4:f6'
+OTHER_KEY = 'ssh-rsa b3RoZXI= other@host'
+
+
+def engine_key(key, entityid='1', entity='user'):
+    return {'entityid': entityid, 'entity': entity, 'key': key}
+
+
+def keys(response):
+    return json.loads(response)['keys']
+
+
+@pytest.fixture
+def index(tmpdir):
+    return under_test.KeyIndex(str(tmpdir.join('keys.json')), max_age=60)
+
+
+def test_key_fingerprints():
+    assert under_test.key_fingerprints(KEY) == [
+        KEY_SHA256,
+        'MD5:%s' % KEY_MD5,
+        KEY_MD5,
+    ]
+
+
+@pytest.mark.parametrize('key', ['', 'ssh-rsa', 'ssh-rsa dGVzdA'])
+def test_key_fingerprints_invalid(key):
+    assert under_test.key_fingerprints(key) == []
+
+
+@pytest.mark.parametrize(
+    'fingerprint', [KEY_SHA256, 'MD5:%s' % KEY_MD5, KEY_MD5]
+)
+def test_lookup_by_fingerprint(index, fingerprint):
+    index.update([engine_key(KEY), engine_key(OTHER_KEY, entityid='2')])
+    assert keys(index.lookup(key_fp=fingerprint)) == [engine_key(KEY)]
+
+
+def test_lookup_by_type_and_content(index):
+    index.update([engine_key(KEY), engine_key(OTHER_KEY, entityid='2')])
+    assert keys(index.lookup(key_type='ssh-rsa')) == [
+        engine_key(OTHER_KEY, entityid='2'),
+    ]
+    assert keys(
+        index.lookup(key_type='ssh-ed25519', key_content='dGVzdA==')
+    ) == [engine_key(KEY)]
+
+
+def test_lookup_all(index):
+    assert keys(index.lookup()) == []
+    index.update([engine_key(KEY)])
+    assert keys(index.lookup()) == [engine_key(KEY)]
+
+
+@pytest.mark.parametrize(
+    'filters', [
+        {'key_fp': 'SHA256:unknown'},
+        {'key_type': 'ssh-dss'},
+        {'key_content': 'dW5rbm93bg=='},
+    ]
+)
+def test_lookup_miss(index, filters):
+    index.update([engine_key(KEY)])
+    assert index.lookup(**filters) is None
+
+
+def test_update_counts_changes(index):
+    assert index.update([engine_key(KEY)]) == (1, 0)
+    assert index.update([engine_key(KEY)]) == (0, 0)
+    # changed entity replaces entry
+    assert index.update(
+        [engine_key(KEY, entity='admin'), engine_key(OTHER_KEY)]
+    ) == (2, 0)
+    assert index.update([engine_key(OTHER_KEY)]) == (0, 1)
+    assert index.update([]) == (0, 1)
+    assert keys(index.lookup()) == []
+
+
+def test_update_unchanged_is_not_saved(index):
+    index.update([engine_key(KEY)])
+    with mock.patch.object(index, '_save') as save:
+        index.update([engine_key(KEY)])
+    assert not save.called
+
+
+def test_ready(index):
+    assert not index.ready
+    index.update([])
+    assert index.ready
+    index.synced = time.time() - 120
+    assert not index.ready
+    # clock stepped back since sync
+    index.synced = time.time() + 120
+    assert not index.ready
+
+
+def test_persisted(index, tmpdir):
+    index.update([engine_key(KEY)])
+    assert tmpdir.listdir() == [tmpdir.join('keys.json')]
+
+    loaded = under_test.KeyIndex(str(tmpdir.join('keys.json')), max_age=60)
+    loaded.load()
+    assert loaded.ready
+    assert keys(loaded.lookup(key_fp=KEY_SHA256)) == [engine_key(KEY)]
+
+
+def test_load_missing(index):
+    index.load()
+    assert not index.ready